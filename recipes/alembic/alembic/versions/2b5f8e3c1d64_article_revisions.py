@@ -0,0 +1,46 @@
+"""article revisions and block tombstones
+
+Revision ID: 2b5f8e3c1d64
+Revises: 9a4d6e1f2b87
+Create Date: 2026-10-19 15:42:17.530214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2b5f8e3c1d64'
+down_revision: Union[str, None] = '9a4d6e1f2b87'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('articles', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+
+    op.add_column('article_blocks', sa.Column('revision', sa.Integer(), nullable=True))
+    op.create_index('idx_article_blocks_page_revision', 'article_blocks', ['page_id', 'revision'], unique=False)
+
+    op.create_table('article_block_tombstones',
+    sa.Column('_id', sa.Integer(), nullable=False),
+    sa.Column('page_id', sa.Integer(), nullable=False),
+    sa.Column('block_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('_id')
+    )
+    op.create_index('idx_article_block_tombstones_page_revision', 'article_block_tombstones', ['page_id', 'revision'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_article_block_tombstones_page_revision', table_name='article_block_tombstones')
+    op.drop_table('article_block_tombstones')
+
+    op.drop_index('idx_article_blocks_page_revision', table_name='article_blocks')
+    op.drop_column('article_blocks', 'revision')
+
+    op.drop_column('articles', 'revision')
@@ -0,0 +1,45 @@
+"""task tree indexes
+
+Revision ID: 5d3a8c7e2f19
+Revises: 2b5f8e3c1d64
+Create Date: 2026-10-19 16:55:03.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d3a8c7e2f19'
+down_revision: Union[str, None] = '2b5f8e3c1d64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_tasks_root_id', 'tasks', ['root_id'], unique=False)
+    op.create_index('idx_tasks_parent_id', 'tasks', ['parent_id'], unique=False)
+
+    # Moving a task used to leave the root_id of its subtasks behind. Orphans
+    # (parent deleted) stay under their root if it still exists, else are their own root
+    op.execute(
+        "WITH RECURSIVE tree(_id, root) AS ("
+        " SELECT _id, CASE WHEN parent_id IS NULL THEN _id ELSE COALESCE("
+        "  (SELECT r._id FROM tasks AS r WHERE r._id = tasks.root_id AND r.parent_id IS NULL), _id"
+        " ) END FROM tasks"
+        " WHERE parent_id IS NULL OR parent_id NOT IN (SELECT _id FROM tasks)"
+        " UNION"
+        " SELECT tasks._id, tree.root FROM tasks JOIN tree ON tasks.parent_id = tree._id"
+        ") "
+        "UPDATE tasks SET root_id = (SELECT root FROM tree WHERE tree._id = tasks._id) "
+        "WHERE _id IN (SELECT _id FROM tree)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_tasks_parent_id', table_name='tasks')
+    op.drop_index('idx_tasks_root_id', table_name='tasks')
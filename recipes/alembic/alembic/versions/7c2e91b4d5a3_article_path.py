@@ -0,0 +1,42 @@
+"""article materialized path
+
+Revision ID: 7c2e91b4d5a3
+Revises: 3f1c2a7d9b40
+Create Date: 2026-10-19 11:42:37.520931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e91b4d5a3'
+down_revision: Union[str, None] = '3f1c2a7d9b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('articles', sa.Column('path', sa.String(length=1024), nullable=True))
+    op.create_index('idx_articles_path', 'articles', ['path'], unique=False)
+
+    # Articles whose parent does not exist anymore become roots
+    op.execute("""
+        WITH RECURSIVE tree(_id, path) AS (
+            SELECT _id, '/' || _id || '/' FROM articles
+            WHERE parent IS NULL OR parent NOT IN (SELECT _id FROM articles)
+            UNION ALL
+            SELECT articles._id, tree.path || articles._id || '/'
+            FROM articles JOIN tree ON articles.parent = tree._id
+        )
+        UPDATE articles SET path = (SELECT path FROM tree WHERE tree._id = articles._id)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_articles_path', table_name='articles')
+    op.drop_column('articles', 'path')
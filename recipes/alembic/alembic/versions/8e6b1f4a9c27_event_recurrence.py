@@ -0,0 +1,32 @@
+"""event recurrence rules
+
+Revision ID: 8e6b1f4a9c27
+Revises: 5d3a8c7e2f19
+Create Date: 2026-10-19 18:21:40.662915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e6b1f4a9c27'
+down_revision: Union[str, None] = '5d3a8c7e2f19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('events', sa.Column('rrule', sa.String(length=255), nullable=True))
+    op.add_column('events', sa.Column('recurrence_end', sa.DateTime(), nullable=True))
+    op.create_index('idx_events_start_end', 'events', ['datetime_start', 'datetime_end'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_events_start_end', table_name='events')
+    op.drop_column('events', 'recurrence_end')
+    op.drop_column('events', 'rrule')
@@ -0,0 +1,62 @@
+"""fractional rank for articles and blocks
+
+Revision ID: 9a4d6e1f2b87
+Revises: 7c2e91b4d5a3
+Create Date: 2026-10-19 13:08:51.204117
+
+"""
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from recipes.tools.fractional import spread_keys
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d6e1f2b87'
+down_revision: Union[str, None] = '7c2e91b4d5a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def backfill_ranks(table, group_columns):
+    """Convert the float sequences to ranks, sibling list by sibling list"""
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        f"SELECT _id, {', '.join(group_columns)} FROM {table} "
+        f"ORDER BY sequence IS NULL, sequence, _id"
+    )).all()
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(row[1:])].append(row[0])
+
+    params = []
+    for ids in groups.values():
+        params.extend({"id": i, "rank": rank} for i, rank in zip(ids, spread_keys(len(ids))))
+
+    if params:
+        conn.execute(sa.text(f"UPDATE {table} SET rank = :rank WHERE _id = :id"), params)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('articles', sa.Column('rank', sa.String(length=255), nullable=True))
+    op.create_index('idx_articles_parent_rank', 'articles', ['parent', 'rank'], unique=False)
+
+    op.add_column('article_blocks', sa.Column('rank', sa.String(length=255), nullable=True))
+    op.create_index('idx_article_blocks_page_rank', 'article_blocks', ['page_id', 'rank'], unique=False)
+
+    backfill_ranks('articles', ['parent'])
+    backfill_ranks('article_blocks', ['page_id', 'parent'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_article_blocks_page_rank', table_name='article_blocks')
+    op.drop_column('article_blocks', 'rank')
+
+    op.drop_index('idx_articles_parent_rank', table_name='articles')
+    op.drop_column('articles', 'rank')
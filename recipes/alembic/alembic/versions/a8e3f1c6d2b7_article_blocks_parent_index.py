@@ -0,0 +1,28 @@
+"""article blocks parent index
+
+Revision ID: a8e3f1c6d2b7
+Revises: f4a1c8d3b529
+Create Date: 2026-10-19 23:41:12.660391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e3f1c6d2b7'
+down_revision: Union[str, None] = 'f4a1c8d3b529'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_article_blocks_parent', 'article_blocks', ['parent'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_article_blocks_parent', table_name='article_blocks')
@@ -0,0 +1,28 @@
+"""task deadline index for the day plans
+
+Revision ID: b4c9e2d7a613
+Revises: 8e6b1f4a9c27
+Create Date: 2026-10-19 19:37:12.904551
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4c9e2d7a613'
+down_revision: Union[str, None] = '8e6b1f4a9c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_tasks_deadline', 'tasks', ['datetime_deadline'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_tasks_deadline', table_name='tasks')
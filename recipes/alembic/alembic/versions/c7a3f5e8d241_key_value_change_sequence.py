@@ -0,0 +1,36 @@
+"""key value change sequence
+
+Revision ID: c7a3f5e8d241
+Revises: b4c9e2d7a613
+Create Date: 2026-10-19 20:12:45.310274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a3f5e8d241'
+down_revision: Union[str, None] = 'b4c9e2d7a613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('key_value_topics',
+    sa.Column('topic', sa.String(length=100), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('topic')
+    )
+    op.add_column('key_value_store', sa.Column('seq', sa.Integer(), nullable=True))
+    op.create_index('idx_keyvalue_topic_seq', 'key_value_store', ['topic', 'seq'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_keyvalue_topic_seq', table_name='key_value_store')
+    op.drop_column('key_value_store', 'seq')
+    op.drop_table('key_value_topics')
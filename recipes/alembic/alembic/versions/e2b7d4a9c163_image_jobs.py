@@ -0,0 +1,42 @@
+"""image jobs
+
+Revision ID: e2b7d4a9c163
+Revises: c7a3f5e8d241
+Create Date: 2026-10-19 22:41:08.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d4a9c163'
+down_revision: Union[str, None] = 'c7a3f5e8d241'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('image_jobs',
+    sa.Column('_id', sa.String(length=32), nullable=False),
+    sa.Column('namespace', sa.String(length=255), nullable=False),
+    sa.Column('state', sa.String(length=16), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('image', sa.String(length=255), nullable=True),
+    sa.Column('url', sa.String(length=255), nullable=True),
+    sa.Column('derivatives', sa.JSON(), nullable=True),
+    sa.Column('duplicates', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('_id')
+    )
+    op.create_index('idx_image_jobs_created_at', 'image_jobs', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_image_jobs_created_at', table_name='image_jobs')
+    op.drop_table('image_jobs')
@@ -0,0 +1,73 @@
+"""integer head ranks
+
+Revision ID: f4a1c8d3b529
+Revises: e2b7d4a9c163
+Create Date: 2026-10-19 23:05:37.902416
+
+"""
+import math
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from recipes.tools.fractional import BASE, DIGITS, spread_keys
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a1c8d3b529'
+down_revision: Union[str, None] = 'e2b7d4a9c163'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def fraction_keys(n):
+    """Keys of the previous format, bare fractions evenly spread over the range"""
+    width = max(1, math.ceil(math.log(n + 1, BASE)))
+    if BASE ** width < 2 * (n + 1):
+        width += 1
+
+    keys = []
+    for i in range(n):
+        value = (i + 1) * BASE ** width // (n + 1)
+
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def respread_ranks(table, group_columns, make_keys):
+    """New ranks in the current order, sibling list by sibling list"""
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        f"SELECT _id, {', '.join(group_columns)} FROM {table} "
+        f"ORDER BY rank IS NULL, rank, sequence, _id"
+    )).all()
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[tuple(row[1:])].append(row[0])
+
+    params = []
+    for ids in groups.values():
+        params.extend({"id": i, "rank": rank} for i, rank in zip(ids, make_keys(len(ids))))
+
+    if params:
+        conn.execute(sa.text(f"UPDATE {table} SET rank = :rank WHERE _id = :id"), params)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    respread_ranks('articles', ['parent'], spread_keys)
+    respread_ranks('article_blocks', ['page_id', 'parent'], spread_keys)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    respread_ranks('articles', ['parent'], fraction_keys)
+    respread_ranks('article_blocks', ['page_id', 'parent'], fraction_keys)
@@ -12,6 +12,8 @@ from typing import Any
 from argklass.arguments import add_arguments
 from argklass.command import Command, newparser
 
+from recipes.tools.buildprofile import BuildProfiler
+
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +23,20 @@ class Arguments:
     output: str = None
     skip_frontend: bool = False
     skip_api: bool = False
+    skip_search: bool = False
     fail_on_error: bool = False
     base_path: str = "/"
     api_url: str = "/api"
+    top: int = 10
+    watch: bool = False
+    interval: float = 1.0
+
+
+# Sync state of the uploads, kept between builds
+UPLOADS_MANIFEST = ".uploads-manifest.json"
+
+# Tables the search index is built from
+SEARCH_TABLES = frozenset({"recipes", "recipe_ingredients", "ingredients", "articles", "article_blocks"})
 
 
 def default_output_dir():
@@ -44,6 +57,8 @@ class StaticWebsite(Command):
     def __init__(self, output_dir=None):
         self.output_dir = Path(output_dir) if output_dir else default_output_dir()
         self.base_dir = Path(__file__).parent.parent.parent
+        # Files written by each endpoint, so re-rendering a route can remove stale ones
+        self.route_files = {}
 
     @staticmethod
     def execute(args):
@@ -68,35 +83,72 @@ class StaticWebsite(Command):
 
         skip_api = getattr(args, 'skip_api', False)
         skip_frontend = getattr(args, 'skip_frontend', False)
+        skip_search = getattr(args, 'skip_search', False)
         base_path = getattr(args, 'base_path', '/')
         api_url = getattr(args, 'api_url', '/api')
 
-        # Clean output directory
-        if self.output_dir.exists():
-            shutil.rmtree(self.output_dir)
-        self.output_dir.mkdir(parents=True)
+        self.clean_output_dir()
 
         with self.app.app_context():
-            if not skip_api:
-                self.crawl_exposed_routes()
+            self.profiler = BuildProfiler(self.db.engine)
+            try:
+                if not skip_api:
+                    self.crawl_exposed_routes()
+                    print(self.profiler.table(getattr(args, 'top', 10)))
+
+                if not skip_search:
+                    self.build_search_index()
+
+                if not skip_frontend:
+                    self.build_frontend(base_path=base_path, api_url=api_url)
+                    self.copy_frontend_build()
 
-            if not skip_frontend:
-                self.build_frontend(base_path=base_path, api_url=api_url)
-                self.copy_frontend_build()
+                self.copy_uploads()
+                self.create_spa_fallback()
+                self.create_hosting_configs()
+                self.create_build_info()
 
-            self.copy_uploads()
-            self.create_spa_fallback()
-            self.create_hosting_configs()
-            self.create_build_info()
+                logger.info(f"Static site generated at {self.output_dir}")
+
+                if getattr(args, 'watch', False):
+                    self.watch(
+                        interval=getattr(args, 'interval', 1.0),
+                        skip_api=skip_api,
+                        skip_search=skip_search,
+                    )
+            finally:
+                # The listener must not outlive a failed build
+                self.profiler.close()
 
-        logger.info(f"Static site generated at {self.output_dir}")
         return 0
 
-    def crawl_exposed_routes(self):
-        """Find all routes with @expose and fetch their data."""
-        logger.info("Crawling exposed routes...")
+    def upload_destinations(self):
+        """Uploads are placed both at /uploads/ (matching server paths in the JSON data)
+        and at /api/uploads/ (matching the API_BASE_URL prefix the frontend adds)."""
+        return self.output_dir / "uploads", self.output_dir / "api" / "uploads"
+
+    def clean_output_dir(self):
+        """Remove the previous build, keeping the synced uploads so they are not copied again."""
+        keep = set(self.upload_destinations()) | {self.output_dir / UPLOADS_MANIFEST}
+        parents = {path.parent for path in keep}
+
+        def clean(folder):
+            for item in folder.iterdir():
+                if item in keep:
+                    continue
+                if item in parents and item.is_dir():
+                    clean(item)
+                elif item.is_dir() and not item.is_symlink():
+                    shutil.rmtree(item)
+                else:
+                    item.unlink()
 
-        count = 0
+        if self.output_dir.exists():
+            clean(self.output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def exposed_routes(self):
+        """Yield the GET rules decorated with @expose and their view function."""
         for rule in self.app.url_map.iter_rules():
             if "GET" not in rule.methods:
                 continue
@@ -110,12 +162,86 @@ class StaticWebsite(Command):
                 continue
 
             if hasattr(view_func, '_static_kwargs') or hasattr(view_func, '_static_args'):
-                static_args = getattr(view_func, '_static_args', ())
-                static_kwargs = getattr(view_func, '_static_kwargs', {})
+                yield rule, view_func
+
+    def crawl_exposed_routes(self, changed_tables=None):
+        """Find all routes with @expose and fetch their data.
+
+        When `changed_tables` is given, only the routes depending on one of them
+        (see `depends_on`) are fetched again.
+        """
+        logger.info("Crawling exposed routes...")
+
+        count = 0
+        for rule, view_func in self.exposed_routes():
+            tables = getattr(view_func, '_static_tables', None)
+            if changed_tables is not None and tables is not None and not (tables & changed_tables):
+                continue
+
+            static_args = getattr(view_func, '_static_args', ())
+            static_kwargs = getattr(view_func, '_static_kwargs', {})
+            with self.profiler.route(rule):
                 count += self.save_route_data(rule, static_args, static_kwargs)
 
         logger.info(f"Crawled {count} endpoints total")
 
+    def watch(self, interval=1.0, skip_api=False, skip_search=False):
+        """Keep the app loaded and republish the routes impacted by database changes."""
+        from recipes.server.changes import data_version, table_versions
+
+        logger.info(f"Watching database for changes every {interval}s, press Ctrl+C to stop")
+
+        with self.db.engine.connect() as conn:
+            last_data_version = data_version(conn)
+            last_versions = table_versions(conn)
+
+            try:
+                while True:
+                    time.sleep(interval)
+
+                    current = data_version(conn)
+                    if current is not None and current == last_data_version:
+                        continue
+
+                    versions = table_versions(conn)
+                    changed = {
+                        table for table, version in versions.items()
+                        if last_versions.get(table) != version
+                    }
+                    last_data_version, last_versions = current, versions
+
+                    if not changed:
+                        if current is None:
+                            continue
+                        # Committed outside of the app session, we cannot know what changed
+                        changed = None
+
+                    self.republish(changed, skip_api=skip_api, skip_search=skip_search)
+
+            except KeyboardInterrupt:
+                logger.info("Stopped watching")
+
+    def republish(self, changed_tables, skip_api=False, skip_search=False):
+        """Render again the routes depending on `changed_tables` (None means everything)."""
+        start = time.perf_counter()
+        names = "all tables" if changed_tables is None else ", ".join(sorted(changed_tables))
+        logger.info(f"Change detected in {names}")
+
+        # Drop the identity map so the queries see the new rows
+        self.db.session.remove()
+
+        self.profiler.close()
+        self.profiler = BuildProfiler(self.db.engine)
+
+        if not skip_api:
+            self.crawl_exposed_routes(changed_tables)
+
+        if not skip_search and (changed_tables is None or changed_tables & SEARCH_TABLES):
+            self.build_search_index()
+
+        self.create_build_info()
+        logger.info(f"Republished in {time.perf_counter() - start:.2f}s")
+
     def save_route_data(self, rule, static_args, static_kwargs):
         """Generate all route combinations and save the data."""
         from flask import url_for
@@ -160,7 +286,11 @@ class StaticWebsite(Command):
 
         # 4. Fetch and save — each request runs inside its own public_articles_only() context
         saved = 0
+        written = set()
         for kwargs in combinations:
+            start = time.perf_counter()
+            nbytes = 0
+            failed = True
             try:
                 with self.app.test_request_context():
                     relative_url = url_for(rule.endpoint, **kwargs)
@@ -171,8 +301,10 @@ class StaticWebsite(Command):
                     try:
                         data = response.get_json()
                         if data is not None:
-                            self.save_json_file(relative_url, data)
+                            nbytes = self.save_json_file(relative_url, data)
+                            written.add(self.json_file_path(relative_url))
                             saved += 1
+                            failed = False
                     except Exception as e:
                         logger.error(f"Failed to parse JSON for {relative_url}: {e}")
                 else:
@@ -185,23 +317,118 @@ class StaticWebsite(Command):
                     f"Error processing combination {kwargs} for {rule.endpoint}: {e}"
                 )
 
+            self.profiler.sample(time.perf_counter() - start, nbytes, failed)
+
+        # Remove the files of combinations that do not exist anymore (deleted rows)
+        for stale in self.route_files.get(rule.endpoint, set()) - written:
+            stale.unlink(missing_ok=True)
+        self.route_files[rule.endpoint] = written
+
         logger.info(f"  Saved {saved}/{len(combinations)} for {rule.endpoint}")
         return saved
 
-    def save_json_file(self, endpoint: str, data: Any):
-        """Save JSON data to a file structure mimicking the API."""
+    def json_file_path(self, endpoint: str) -> Path:
         if endpoint == "/":
-            file_path = self.output_dir / "api" / "index.json"
-        else:
-            clean_endpoint = endpoint.lstrip("/")
-            file_path = self.output_dir / "api" / f"{clean_endpoint}.json"
+            return self.output_dir / "api" / "index.json"
 
+        clean_endpoint = endpoint.lstrip("/")
+        return self.output_dir / "api" / f"{clean_endpoint}.json"
+
+    def save_json_file(self, endpoint: str, data: Any) -> int:
+        """Save JSON data to a file structure mimicking the API, returns the number of bytes written."""
+        file_path = self.json_file_path(endpoint)
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(file_path, 'w') as f:
+        # Write then rename so a site served while watching never sees a partial file
+        tmp_path = file_path.with_name(file_path.name + ".tmp")
+        with open(tmp_path, 'w') as f:
             json.dump(data, f, indent=2, default=str)
+        nbytes = os.path.getsize(tmp_path)
+        os.replace(tmp_path, file_path)
 
         logger.debug(f"Saved {file_path}")
+        return nbytes
+
+    def build_search_index(self):
+        """Build the client side search index over recipes, ingredients and public articles."""
+        from collections import defaultdict
+        from sqlalchemy import select
+        from recipes.server.models import Recipe, Ingredient, RecipeIngredient, Article, ArticleBlock
+        from recipes.tools.searchindex import SearchIndex, benchmark, json_strings
+
+        logger.info("Building search index...")
+        start = time.perf_counter()
+
+        session = self.db.session
+        index = SearchIndex()
+
+        recipe_ingredients = defaultdict(list)
+        rows = session.execute(
+            select(RecipeIngredient.recipe_id, Ingredient.name)
+            .join(Ingredient, RecipeIngredient.ingredient_id == Ingredient._id)
+        )
+        for recipe_id, name in rows:
+            recipe_ingredients[recipe_id].append(name)
+
+        for recipe_id, title in session.execute(select(Recipe._id, Recipe.title).order_by(Recipe._id)):
+            index.add("recipe", recipe_id, title, *recipe_ingredients.get(recipe_id, []))
+
+        for ingredient_id, name in session.execute(select(Ingredient._id, Ingredient.name).order_by(Ingredient._id)):
+            index.add("ingredient", ingredient_id, name)
+
+        articles = session.execute(
+            select(Article._id, Article.title).where(Article.public == True).order_by(Article._id)
+        ).all()
+
+        article_text = defaultdict(list)
+        public_ids = select(Article._id).where(Article.public == True)
+        blocks = session.execute(
+            select(ArticleBlock.page_id, ArticleBlock.data)
+            .where(ArticleBlock.page_id.in_(public_ids))
+            .execution_options(yield_per=1000)
+        )
+        for page_id, data in blocks:
+            article_text[page_id].extend(json_strings(data))
+
+        for article_id, title in articles:
+            index.add("article", article_id, title or "", *article_text.get(article_id, []))
+
+        folder = self.output_dir / "api" / "search"
+        manifest = index.save(folder)
+        elapsed = time.perf_counter() - start
+
+        # Query with the title words and their prefixes to estimate the UI latency
+        queries = []
+        for _, _, title in index.documents[:200]:
+            words = (title or "").split()
+            if words:
+                queries.append(words[0])
+                queries.append(words[0][:3])
+        latency = benchmark(folder, queries)
+
+        total_bytes = manifest["docs_bytes"] + sum(b["bytes"] for b in manifest["buckets"].values())
+        largest = max((b["bytes"] for b in manifest["buckets"].values()), default=0)
+
+        self.search_stats = {
+            "documents": manifest["documents"],
+            "terms": manifest["terms"],
+            "buckets": len(manifest["buckets"]),
+            "bytes": total_bytes,
+            "largest_bucket_bytes": largest,
+            "build_s": elapsed,
+            "latency": latency,
+        }
+
+        logger.info(
+            f"  Indexed {manifest['documents']} documents, {manifest['terms']} terms "
+            f"in {len(manifest['buckets'])} buckets, {total_bytes / 1024:.1f} KiB "
+            f"(largest bucket {largest / 1024:.1f} KiB) in {elapsed:.2f}s"
+        )
+        if latency["queries"]:
+            logger.info(
+                f"  Query latency over {latency['queries']} queries: "
+                f"mean {latency['mean_ms']:.2f} ms, p95 {latency['p95_ms']:.2f} ms"
+            )
 
     def build_frontend(self, base_path="/", api_url="/api"):
         """Build the React frontend for production."""
@@ -267,12 +494,14 @@ class StaticWebsite(Command):
         logger.info("Frontend files copied")
 
     def copy_uploads(self):
-        """Copy uploaded files to the static build.
+        """Sync uploaded files to the static build.
 
-        Uploads are placed both at /uploads/ (matching server paths in the JSON data)
-        and at /api/uploads/ (matching the API_BASE_URL prefix the frontend adds).
+        Only new or changed files are copied to /uploads/, /api/uploads/ receives
+        hardlinks to them and files deleted from the source are removed from both.
         """
-        logger.info("Copying uploaded files...")
+        from recipes.tools.syncdir import sync_tree
+
+        logger.info("Syncing uploaded files...")
 
         uploads_src = None
 
@@ -293,15 +522,21 @@ class StaticWebsite(Command):
             logger.info("No uploads directory found")
             return
 
-        # Copy to /uploads/ (direct path as stored in JSON data)
-        uploads_dest = self.output_dir / "uploads"
-        shutil.copytree(uploads_src, uploads_dest, dirs_exist_ok=True)
-
-        # Also copy into /api/uploads/ so the frontend's API_BASE_URL prefix resolves
-        api_uploads_dest = self.output_dir / "api" / "uploads"
-        shutil.copytree(uploads_src, api_uploads_dest, dirs_exist_ok=True)
+        start = time.perf_counter()
+        uploads_dest, api_uploads_dest = self.upload_destinations()
+        stats = sync_tree(
+            uploads_src,
+            uploads_dest,
+            mirrors=(api_uploads_dest,),
+            manifest_path=self.output_dir / UPLOADS_MANIFEST,
+        )
+        self.upload_stats = dict(stats.to_json(), seconds=time.perf_counter() - start)
 
-        logger.info(f"Copied uploads from {uploads_src} to /uploads/ and /api/uploads/")
+        logger.info(
+            f"Synced uploads from {uploads_src} to /uploads/ and /api/uploads/: "
+            f"{stats.copied} copied ({stats.bytes / 1024 ** 2:.1f} MiB), {stats.linked} linked, {stats.skipped} unchanged, "
+            f"{stats.removed} removed in {self.upload_stats['seconds']:.2f}s"
+        )
 
     def create_spa_fallback(self):
         """Create 404.html for SPA routing on static hosts.
@@ -347,6 +582,14 @@ class StaticWebsite(Command):
             "build_type": "static",
         }
 
+        if getattr(self, "search_stats", None) is not None:
+            build_info["search"] = self.search_stats
+
+        if getattr(self, "upload_stats", None) is not None:
+            build_info["uploads"] = self.upload_stats
+
+        build_info["profile"] = self.profiler.report()
+
         with open(self.output_dir / "build-info.json", 'w') as f:
             json.dump(build_info, f, indent=2)
 
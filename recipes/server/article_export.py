@@ -0,0 +1,556 @@
+"""
+Streaming export of the articles to Markdown, HTML and JSON.
+
+Blocks are read as plain rows (nothing is kept in the session identity map):
+the top level blocks of an article are streamed, their subtrees loaded a batch
+at a time, and every top level block is rendered and yielded on its own.
+Archives of a subtree or of the whole wiki are written to the response as they
+are built; memory use is bounded by a batch of top level blocks, not by the
+article nor by the export.
+
+The Markdown renderers mirror the `as_markdown` methods of the editor blocks
+(`ui/src/components/article/blocks`).
+"""
+from __future__ import annotations
+
+import io
+import json
+import re
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from html import escape
+
+from sqlalchemy import exists, func, or_, select
+
+from .models.article import Article, ArticleBlock
+
+
+# Werkzeug adds "; charset=utf-8" to the text types
+FORMATS = {
+    "md": "text/markdown",
+    "html": "text/html",
+    "json": "application/json",
+}
+
+ARCHIVES = {
+    "tar": "application/x-tar",
+    "zip": "application/zip",
+}
+
+ARTICLE_COLUMNS = (
+    Article._id,
+    Article.title,
+    Article.namespace,
+    Article.tags,
+    Article.extension,
+    Article.parent,
+    Article.root_id,
+    Article.path,
+    Article.rank,
+    Article.public,
+    Article.article_kind,
+    Article.revision,
+)
+
+#
+# Loading
+#
+def article_json(row):
+    """Same fields as `Article.to_json`, from a row"""
+    return {
+        "id": row._id,
+        "title": row.title,
+        "namespace": row.namespace,
+        "tags": row.tags,
+        "extension": row.extension,
+        "parent_id": row.parent,
+        "root_id": row.root_id,
+        "path": row.path,
+        "rank": row.rank,
+        "public": row.public,
+        "article_kind": row.article_kind,
+        "revision": row.revision,
+    }
+
+
+def block_json(row):
+    """Same fields as `ArticleBlock.to_json`, from a row"""
+    return {
+        "id": row._id,
+        "page_id": row.page_id,
+        "parent_id": row.parent,
+        "kind": row.kind,
+        "data": row.data,
+        "sequence": row.sequence,
+        "rank": row.rank,
+        "revision": row.revision,
+        "extension": row.extension,
+    }
+
+
+def iter_block_trees(session, article_id, batch=100):
+    """Root blocks of an article in display order, with their nested `children`
+
+    The roots are streamed from the database; the subtrees of `batch` roots at a
+    time are loaded with one recursive query, then yielded and dropped.
+    """
+    blocks = ArticleBlock.__table__
+    parent = blocks.alias("parent_block")
+
+    roots = (
+        select(blocks)
+        .where(
+            blocks.c.page_id == article_id,
+            or_(
+                blocks.c.parent.is_(None),
+                # Some root blocks are their own parent
+                blocks.c.parent == blocks.c._id,
+                # Parent deleted
+                ~exists().where(parent.c._id == blocks.c.parent, parent.c.page_id == article_id),
+            ),
+        )
+        .order_by(blocks.c.rank.is_(None), blocks.c.rank, func.coalesce(blocks.c.sequence, 0), blocks.c._id)
+        .execution_options(yield_per=batch)
+    )
+
+    for rows in session.execute(roots).partitions():
+        nodes = {row._id: block_json(row) for row in rows}
+
+        tree = select(blocks.c._id).where(blocks.c._id.in_(list(nodes))).cte("tree", recursive=True)
+        tree = tree.union(
+            select(blocks.c._id).where(
+                blocks.c.parent == tree.c._id,
+                blocks.c._id != blocks.c.parent,
+                blocks.c.page_id == article_id,
+            )
+        )
+        descendants = session.execute(
+            select(blocks)
+            .where(blocks.c._id.in_(select(tree.c._id)), blocks.c._id.not_in(list(nodes)))
+            .order_by(blocks.c.rank.asc(), blocks.c.sequence.asc(), blocks.c._id.asc())
+        )
+
+        children = defaultdict(list)
+        for row in descendants:
+            node = nodes[row._id] = block_json(row)
+            children[node["parent_id"]].append(node)
+        for parent_id, group in children.items():
+            nodes[parent_id]["children"] = group
+
+        yield from (nodes[row._id] for row in rows)
+
+
+def iter_articles(session, root=None, namespace=None, batch=100):
+    """Article rows of a subtree (or the whole wiki) parents first, streamed from the database"""
+    query = select(*ARTICLE_COLUMNS)
+
+    if root is not None:
+        query = query.where(Article.in_subtree(root.path) if root.path else Article._id == root._id)
+    if namespace is not None:
+        query = query.where(Article.namespace == namespace)
+
+    query = query.order_by(Article.path.asc(), Article._id.asc())
+    yield from session.execute(query.execution_options(yield_per=batch))
+
+
+#
+# Markdown
+#
+def _md_children(node, level, sep="\n\n"):
+    return sep.join(render_markdown(child, level) for child in node.get("children", []))
+
+
+def _md_inline(node, level):
+    text = (node["data"] or {}).get("text") or ""
+    inline = "".join(render_markdown(child, level) for child in node.get("children", []))
+    spacer = " " if text and inline else ""
+    return f"{text}{spacer}{inline}"
+
+
+def _md_text(node, level):
+    data = node["data"] or {}
+    text = _md_children(node, level, "") if node.get("children") else data.get("text", "")
+    wrap = {"strong": "__", "em": "*", "del": "~~", "codespan": "`"}.get(data.get("style"), "")
+    return f"{wrap}{text}{wrap}"
+
+
+def _md_heading(node, level):
+    depth = min(max((node["data"] or {}).get("level") or 1, 1), 6)
+    return f"{'#' * depth} {_md_inline(node, level)}"
+
+
+def _md_code(node, level):
+    data = node["data"] or {}
+    return f"```{data.get('language') or ''}\n{data.get('code') or ''}\n```"
+
+
+def _md_blockquote(node, level):
+    content = _md_children(node, level, "\n")
+    return "\n".join(f"> {line}".rstrip() for line in content.split("\n"))
+
+
+def _md_list(node, level):
+    data = node["data"] or {}
+    indent = "  " * level
+    ordered = bool(data.get("ordered"))
+    start = data.get("start") or 1
+
+    def marker(i):
+        return f"{start + i}." if ordered else "*"
+
+    lines = [f"{indent}{marker(i)} {item}" for i, item in enumerate(data.get("items") or [])]
+    for i, child in enumerate(node.get("children", [])):
+        if child["kind"] == "list":
+            lines.append(render_markdown(child, level + 1))
+        else:
+            lines.append(f"{indent}{marker(i)} {render_markdown(child, level + 1)}")
+    return "\n".join(lines)
+
+
+def _md_item(node, level):
+    children = [c for c in node.get("children", []) if c["kind"] != "separator"]
+    return "\n".join(render_markdown(child, level) for child in children)
+
+
+def _md_link(node, level):
+    data = node["data"] or {}
+    text = _md_children(node, level, "") if node.get("children") else data.get("text", "")
+    title = f' "{data["title"]}"' if data.get("title") else ""
+    return f"[{text}]({data.get('url', '')}{title})"
+
+
+def _md_image(node, level):
+    data = node["data"] or {}
+    caption = f' "{data["caption"]}"' if data.get("caption") else ""
+    return f"![{data.get('alt') or ''}]({data.get('url', '')}{caption})"
+
+
+def _md_media(node, level):
+    url = (node["data"] or {}).get("url", "")
+    return f"[{node['kind']}]({url})"
+
+
+def _md_alert(node, level):
+    data = node["data"] or {}
+    return f"> **{data.get('title') or data.get('type')}**: {data.get('message', '')}"
+
+
+def _table_rows(node):
+    """Header and body cells of a table block, from its rows or its JSON `data`"""
+    if node.get("children"):
+        rows = [row.get("children", []) for row in node["children"]]
+        return rows[0] if rows else [], rows[1:]
+
+    try:
+        records = json.loads((node["data"] or {}).get("data") or "[]")
+    except (TypeError, ValueError):
+        return [], []
+
+    headers = list(records[0].keys()) if records else []
+    return headers, [[str(record.get(h, "")) for h in headers] for record in records]
+
+
+def _md_cell(cell, level):
+    if isinstance(cell, str):
+        return cell
+    return _md_inline(cell, level)
+
+
+def _md_table(node, level):
+    header, body = _table_rows(node)
+    if not header:
+        return ""
+
+    def align(cell):
+        value = None if isinstance(cell, str) else (cell["data"] or {}).get("align")
+        return {"center": ":---:", "right": "---:", "left": ":---"}.get(value, "---")
+
+    lines = [
+        "| " + " | ".join(_md_cell(cell, level) for cell in header) + " |",
+        "| " + " | ".join(align(cell) for cell in header) + " |",
+    ]
+    lines.extend("| " + " | ".join(_md_cell(cell, level) for cell in row) + " |" for row in body)
+    return "\n".join(lines)
+
+
+MARKDOWN = {
+    "paragraph": _md_inline,
+    "tablecell": _md_inline,
+    "heading": _md_heading,
+    "text": _md_text,
+    "codespan": lambda node, level: f"`{(node['data'] or {}).get('text', '')}`",
+    "code": _md_code,
+    "blockquote": _md_blockquote,
+    "list": _md_list,
+    "item": _md_item,
+    "link": _md_link,
+    "image": _md_image,
+    "video": _md_media,
+    "audio": _md_media,
+    "embed": _md_media,
+    "iframe": _md_media,
+    "alert": _md_alert,
+    "table": _md_table,
+    "hr": lambda node, level: (node["data"] or {}).get("raw") or "---",
+    "br": lambda node, level: "  \n",
+    "html": lambda node, level: (node["data"] or {}).get("raw") or (node["data"] or {}).get("text") or "",
+    "latex": lambda node, level: f"$${(node['data'] or {}).get('formula', '')}$$",
+    "mermaid": lambda node, level: f"```mermaid\n{(node['data'] or {}).get('diagram', '')}\n```",
+}
+
+
+def render_markdown(node, level=0):
+    renderer = MARKDOWN.get(node["kind"])
+    if renderer is None:
+        # Layouts and containers without a Markdown form: their content
+        return _md_children(node, level)
+    return renderer(node, level)
+
+
+def iter_markdown(article, blocks):
+    yield f"# {article['title'] or ''}\n\n"
+    for block in blocks:
+        text = render_markdown(block)
+        if text:
+            yield text + "\n\n"
+
+
+#
+# HTML
+#
+def _html_children(node, sep=""):
+    return sep.join(render_html(child) for child in node.get("children", []))
+
+
+def _html_inline(node):
+    text = escape((node["data"] or {}).get("text") or "")
+    inline = _html_children(node)
+    spacer = " " if text and inline else ""
+    return f"{text}{spacer}{inline}"
+
+
+def _html_text(node):
+    data = node["data"] or {}
+    text = _html_children(node) if node.get("children") else escape(data.get("text") or "")
+    tag = {"strong": "strong", "em": "em", "del": "del", "codespan": "code"}.get(data.get("style"))
+    return f"<{tag}>{text}</{tag}>" if tag else text
+
+
+def _html_heading(node):
+    depth = min(max((node["data"] or {}).get("level") or 1, 1), 6)
+    return f"<h{depth}>{_html_inline(node)}</h{depth}>"
+
+
+def _html_code(node):
+    data = node["data"] or {}
+    language = escape(data.get("language") or "")
+    return f'<pre><code class="language-{language}">{escape(data.get("code") or "")}</code></pre>'
+
+
+def _html_list(node):
+    data = node["data"] or {}
+    items = [f"<li>{escape(str(item))}</li>" for item in data.get("items") or []]
+    for child in node.get("children", []):
+        content = render_html(child)
+        items.append(content if child["kind"] == "list" else f"<li>{content}</li>")
+
+    if data.get("ordered"):
+        return f'<ol start="{int(data.get("start") or 1)}">{"".join(items)}</ol>'
+    return f"<ul>{''.join(items)}</ul>"
+
+
+def _html_link(node):
+    data = node["data"] or {}
+    text = _html_children(node) if node.get("children") else escape(data.get("text") or "")
+    title = f' title="{escape(data["title"])}"' if data.get("title") else ""
+    return f'<a href="{escape(data.get("url") or "")}"{title}>{text}</a>'
+
+
+def _html_image(node):
+    data = node["data"] or {}
+    image = f'<img src="{escape(data.get("url") or "")}" alt="{escape(data.get("alt") or "")}">'
+    if data.get("caption"):
+        return f"<figure>{image}<figcaption>{escape(data['caption'])}</figcaption></figure>"
+    return image
+
+
+def _html_media(tag):
+    def render(node):
+        return f'<{tag} controls src="{escape((node["data"] or {}).get("url") or "")}"></{tag}>'
+    return render
+
+
+def _html_alert(node):
+    data = node["data"] or {}
+    kind = escape(data.get("type") or "info")
+    title = escape(data.get("title") or data.get("type") or "")
+    return f'<div class="alert alert-{kind}"><strong>{title}</strong> {escape(data.get("message") or "")}</div>'
+
+
+def _html_cell(cell, tag):
+    if isinstance(cell, str):
+        return f"<{tag}>{escape(cell)}</{tag}>"
+    return f"<{tag}>{_html_inline(cell)}</{tag}>"
+
+
+def _html_table(node):
+    header, body = _table_rows(node)
+    if not header:
+        return ""
+
+    head = "".join(_html_cell(cell, "th") for cell in header)
+    rows = "".join("<tr>" + "".join(_html_cell(cell, "td") for cell in row) + "</tr>" for row in body)
+    return f"<table><thead><tr>{head}</tr></thead><tbody>{rows}</tbody></table>"
+
+
+HTML = {
+    "paragraph": lambda node: f"<p>{_html_inline(node)}</p>",
+    "tablecell": _html_inline,
+    "heading": _html_heading,
+    "text": _html_text,
+    "codespan": lambda node: f"<code>{escape((node['data'] or {}).get('text') or '')}</code>",
+    "code": _html_code,
+    "blockquote": lambda node: f"<blockquote>{_html_children(node)}</blockquote>",
+    "list": _html_list,
+    "item": lambda node: _html_children(node),
+    "link": _html_link,
+    "image": _html_image,
+    "video": _html_media("video"),
+    "audio": _html_media("audio"),
+    "iframe": lambda node: f'<iframe src="{escape((node["data"] or {}).get("url") or "")}"></iframe>',
+    "alert": _html_alert,
+    "table": _html_table,
+    "hr": lambda node: "<hr>",
+    "br": lambda node: "<br>",
+    # Written by the article author, rendered as is like the editor does
+    "html": lambda node: (node["data"] or {}).get("raw") or (node["data"] or {}).get("text") or "",
+    "latex": lambda node: f'<div class="math">$${escape((node["data"] or {}).get("formula") or "")}$$</div>',
+    "mermaid": lambda node: f'<pre class="mermaid">{escape((node["data"] or {}).get("diagram") or "")}</pre>',
+}
+
+
+def render_html(node):
+    renderer = HTML.get(node["kind"])
+    if renderer is None:
+        return f'<div class="block-{escape(node["kind"] or "")}">{_html_children(node)}</div>'
+    return renderer(node)
+
+
+def iter_html(article, blocks):
+    title = escape(article["title"] or "")
+    yield (
+        f'<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n</head>\n'
+        f"<body>\n<article>\n<h1>{title}</h1>\n"
+    )
+    for block in blocks:
+        yield render_html(block) + "\n"
+    yield "</article>\n</body>\n</html>\n"
+
+
+#
+# JSON
+#
+def iter_json(article, blocks):
+    """The `/articles/<id>/export` document: the article with its `blocks` tree"""
+    fields = [f"{json.dumps(name)}: {json.dumps(value)}" for name, value in article.items() if name != "blocks"]
+    yield "{" + "".join(f"{field}, " for field in fields) + '"blocks": ['
+    for i, block in enumerate(blocks):
+        yield (", " if i else "") + json.dumps(block)
+    yield "]}"
+
+
+RENDERERS = {
+    "md": iter_markdown,
+    "html": iter_html,
+    "json": iter_json,
+}
+
+
+def iter_article(session, article, fmt):
+    """Chunks of text of one exported article (a row or `article_json` dict)"""
+    if not isinstance(article, dict):
+        article = article_json(article)
+    return RENDERERS[fmt](article, iter_block_trees(session, article["id"]))
+
+
+#
+# Archives
+#
+def slugify(title):
+    slug = re.sub(r"[^a-zA-Z0-9]+", "-", title or "").strip("-").lower()
+    return slug or "untitled"
+
+
+class _Sink(io.RawIOBase):
+    """Write only stream collecting what an archive writer produced since the last drain"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile records the offsets of the entries
+        return self.offset
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def archive_names(articles, fmt):
+    """(article row, path inside the archive) following the article tree"""
+    names = {}
+    for article in articles:
+        parent = names.get(article.parent)
+        name = f"{slugify(article.title)}-{article._id}"
+        names[article._id] = f"{parent}/{name}" if parent else name
+
+        yield article, f"{names[article._id]}.{fmt}"
+
+
+def iter_tar(session, articles, fmt):
+    sink = _Sink()
+    with tarfile.open(fileobj=sink, mode="w|") as archive:
+        for article, name in archive_names(articles, fmt):
+            # The size goes in the header, stage the article in a temporary file
+            with tempfile.SpooledTemporaryFile(max_size=4 * 1024 ** 2) as fp:
+                for chunk in iter_article(session, article, fmt):
+                    fp.write(chunk.encode("utf-8"))
+
+                info = tarfile.TarInfo(name)
+                info.size = fp.tell()
+                info.mtime = time.time()
+                fp.seek(0)
+                archive.addfile(info, fp)
+
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_zip(session, articles, fmt):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for article, name in archive_names(articles, fmt):
+            with archive.open(name, mode="w") as fp:
+                for chunk in iter_article(session, article, fmt):
+                    fp.write(chunk.encode("utf-8"))
+                    yield sink.drain()
+    yield sink.drain()
+
+
+ARCHIVE_WRITERS = {
+    "tar": iter_tar,
+    "zip": iter_zip,
+}
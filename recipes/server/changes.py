@@ -0,0 +1,65 @@
+"""
+Table level change tracking.
+
+Every flush (and every bulk INSERT/UPDATE/DELETE statement) of the app session
+bumps the version of the tables it wrote to, inside the same transaction.
+A reader polls `PRAGMA data_version`, which is cheap and changes whenever
+another connection committed, and only then diffs `table_versions` to learn
+which tables changed.
+"""
+import itertools
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+
+from .models import TableVersion
+
+
+def bump_table_versions(connection, tables):
+    tables = sorted(set(tables) - {TableVersion.__tablename__})
+    if not tables:
+        return
+
+    stmt = insert(TableVersion).values([
+        {"table_name": table, "version": 1} for table in tables
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["table_name"],
+        set_=dict(version=TableVersion.version + 1),
+    )
+    connection.execute(stmt)
+
+
+def track_table_changes(session_factory):
+    """Install the version bumping hooks on a session factory (`db.session`)"""
+
+    @event.listens_for(session_factory, "after_flush")
+    def _track_flush(session, flush_context):
+        tables = set()
+        for obj in itertools.chain(session.new, session.dirty, session.deleted):
+            tables.update(table.name for table in inspect(obj).mapper.tables)
+
+        bump_table_versions(session.connection(), tables)
+
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _track_statements(execute_state):
+        if execute_state.is_insert or execute_state.is_update or execute_state.is_delete:
+            table = getattr(execute_state.statement, "table", None)
+            if table is not None:
+                bump_table_versions(execute_state.session.connection(), [table.name])
+
+
+def table_versions(connection):
+    rows = connection.execute(select(TableVersion.table_name, TableVersion.version)).all()
+    connection.rollback()
+    return dict(rows)
+
+
+def data_version(connection):
+    """SQLite counter that changes when another connection commits, None for other databases"""
+    if connection.dialect.name != "sqlite":
+        return None
+
+    version = connection.exec_driver_sql("PRAGMA data_version").scalar()
+    connection.rollback()
+    return version
@@ -0,0 +1,90 @@
+"""
+SQLite profile of the app engine.
+
+Every connection opened by the pool runs the pragmas below, from the engine
+`connect` event:
+
+    journal_mode=WAL        readers never wait for the writer, nor the writer for them
+    synchronous=NORMAL      in WAL mode, a commit only syncs at checkpoints; a power
+                            loss can drop the last commits, never corrupt the file
+    busy_timeout            a second writer waits for the lock instead of failing
+                            with "database is locked"
+    cache_size, mmap_size   pages kept in memory; mmap shares them across connections
+                            and processes through the OS page cache
+    temp_store=MEMORY       sorts and temporary indexes stay in memory
+
+Each pragma can be overridden with RECIPES_SQLITE_<PRAGMA> (RECIPES_SQLITE_SYNCHRONOUS=FULL),
+an empty value leaves the SQLite default. The pool keeps RECIPES_SQLITE_POOL_SIZE
+connections open, enough for the threads of a worker (see prefork.py), so the
+pragmas and the page cache are not set up again for every request; up to
+RECIPES_SQLITE_MAX_OVERFLOW more are opened under load (background tasks).
+
+cache_size is private to each connection, the memory it can take is
+
+    cache_size x (pool_size + max_overflow) x workers = 8 MiB x 12 x workers = 96 MiB per worker
+
+with the defaults (one worker per core); hot pages beyond it are served from the shared mmap.
+"""
+from __future__ import annotations
+
+import os
+
+from sqlalchemy import event
+
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 10000,
+    # Negative: KiB, 8 MiB per connection
+    "cache_size": -8000,
+    "mmap_size": 256 * 1024 ** 2,
+    "temp_store": "MEMORY",
+}
+
+POOL_SIZE = 8
+MAX_OVERFLOW = 4
+
+
+def sqlite_pragmas(environ=os.environ):
+    """PRAGMAS with the overrides of the environment"""
+    pragmas = {}
+    for name, default in PRAGMAS.items():
+        value = environ.get(f"RECIPES_SQLITE_{name.upper()}", default)
+        if value != "":
+            pragmas[name] = value
+    return pragmas
+
+
+def engine_options(environ=os.environ):
+    """SQLALCHEMY_ENGINE_OPTIONS of a file database"""
+    return {
+        "pool_size": int(environ.get("RECIPES_SQLITE_POOL_SIZE", POOL_SIZE)),
+        "max_overflow": int(environ.get("RECIPES_SQLITE_MAX_OVERFLOW", MAX_OVERFLOW)),
+        "pool_timeout": 30,
+    }
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def install_sqlite_profile(engine, pragmas=None):
+    """Run the pragmas on every new connection of a SQLite engine"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+    for name, value in pragmas.items():
+        # Pragmas cannot be bound as parameters
+        if not name.isidentifier() or not str(value).replace("-", "").isalnum():
+            raise ValueError(f"Invalid pragma: {name}={value}")
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
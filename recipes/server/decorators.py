@@ -19,3 +19,25 @@ def expose(*args, **kwargs):
         f._static_kwargs = kwargs
         return f
     return decorator
+
+
+def depends_on(*tables):
+    """
+    Declare the tables an exposed route reads from, used by `recipes static --watch`
+    to only re-render the routes impacted by a database change.
+
+    Args:
+        *tables: Table names, tables or models. Routes without a declaration
+                 are re-rendered on every change.
+    """
+    def table_name(table):
+        if isinstance(table, str):
+            return table
+        return getattr(table, '__tablename__', None) or table.name
+
+    names = frozenset(table_name(table) for table in tables)
+
+    def decorator(f):
+        f._static_tables = names
+        return f
+    return decorator
@@ -0,0 +1,18 @@
+"""
+Thread pools of the routes (image jobs, block rebalancing).
+
+Their work is accepted by a request and finished after the response; a server
+process must let them finish before it exits, see `RecipeApp.serve`.
+"""
+
+
+def register_executor(app, executor):
+    """Keep track of an executor of `app`, returns it"""
+    app.extensions.setdefault("executors", []).append(executor)
+    return executor
+
+
+def shutdown_executors(app, wait=True):
+    """Stop accepting work, and with `wait` finish the queued and running tasks"""
+    for executor in app.extensions.get("executors", []):
+        executor.shutdown(wait=wait)
@@ -0,0 +1,98 @@
+"""
+Background image processing.
+
+`/upload` only streams the original to the blob store then queues a job here;
+the copy to the originals folder, the production crop and the responsive
+derivatives are computed by a small thread pool, which also bounds how many
+images are decoded at once. Job status is an `ImageJob` row (the most recent
+`keep` jobs), so `/upload/jobs/<id>` can be answered by any worker process and
+survives a restart; its `url` is set once the production image is written,
+clients poll it before showing the image.
+"""
+import os
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from ..tools.imagecache import open_scaled
+from ..tools.phash import file_dhash
+from ..tools.images import centercrop_resize_image, make_derivatives, MAX_PRODUCTION_WIDTH
+from .models import ImageJob
+
+
+class ImageJobs:
+    def __init__(self, app, db, workers=2, keep=1000, store=None, hashes=None):
+        self.app = app
+        self.db = db
+        self.store = store
+        self.hashes = hashes
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+        self.keep = keep
+
+    def submit(self, source, root, namespace, extension, widths, formats, digest=None, original=None):
+        """Record a queued job then run it in the background, called from a request"""
+        session = self.db.session
+        job = ImageJob(_id=uuid.uuid4().hex[:12], namespace=namespace, state="queued")
+        session.add(job)
+        session.flush()
+
+        # Forget the oldest jobs past `keep`
+        recent = session.query(ImageJob._id).order_by(ImageJob.created_at.desc()).limit(self.keep)
+        session.query(ImageJob).filter(ImageJob._id.not_in(recent.scalar_subquery())).delete(synchronize_session=False)
+        session.commit()
+
+        self.executor.submit(self._run, job._id, source, root, namespace, extension, widths, formats, digest, original)
+        return job.to_json()
+
+    def get(self, job_id):
+        job = self.db.session.get(ImageJob, job_id)
+        return job.to_json() if job is not None else None
+
+    def _update(self, job_id, **values):
+        session = self.db.session
+        try:
+            session.query(ImageJob).filter(ImageJob._id == job_id).update(values)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def _run(self, *args):
+        with self.app.app_context():
+            try:
+                self._process(*args)
+            finally:
+                self.db.session.remove()
+
+    def _process(self, job_id, source, root, namespace, extension, widths, formats, digest, original):
+        self._update(job_id, state="running")
+        try:
+            if original is not None:
+                self.store.link(digest, original)
+
+            # Never decode more pixels than the largest image produced
+            largest = max(max(widths), MAX_PRODUCTION_WIDTH)
+            with open_scaled(source, width=largest) as image:
+                path = centercrop_resize_image(root, image, namespace, extension, store=self.store, source=digest)
+                self._update(job_id, image=path, url=f"/uploads/{path}")
+
+                if self.hashes is not None:
+                    # Warn about near duplicates already uploaded
+                    value = file_dhash(os.path.join(root, path))
+                    self._update(job_id, duplicates=self.hashes.similar(value, exclude=path))
+                    self.hashes.add(path, value, os.stat(os.path.join(root, path)))
+
+                manifest = make_derivatives(
+                    root, image, namespace, widths=widths, formats=formats, store=self.store, source=digest
+                )
+
+            self._update(
+                job_id,
+                state="done",
+                derivatives=manifest["derivatives"],
+                finished_at=datetime.utcnow(),
+            )
+        except Exception as err:
+            traceback.print_exc()
+            self._update(job_id, state="failed", error=str(err), finished_at=datetime.utcnow())
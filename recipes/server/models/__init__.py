@@ -1,6 +1,6 @@
 from .calendar import Event
 
-from .keyvalue import KeyValueStore
+from .keyvalue import KeyValueStore, KeyValueTopic
 
 # Product is the bridge between Receipt and Pantry management
 # IngredientProduct is the bridge between Pantry and recipes
@@ -26,7 +26,11 @@ from .task import Task
 
 from .user import User
 
-from .article import Article, ArticleBlock
+from .article import Article, ArticleBlock, ArticleBlockTombstone
+
+from .changes import TableVersion
+
+from .image import ImageJob
 
 
 from .common import Base
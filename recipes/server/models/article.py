@@ -14,6 +14,10 @@ from sqlalchemy import (
     select,
     Boolean,
     Index,
+    update,
+    case,
+    func,
+    literal,
 )
 from sqlalchemy.orm import relationship, sessionmaker, declarative_base
 
@@ -29,9 +33,15 @@ class Article(Base):
     root_id = Column(Integer, ForeignKey("articles._id"), nullable=True)
     parent = Column(Integer, ForeignKey("articles._id"), nullable=True)
 
+    # Materialized path "/<root>/.../<parent>/<id>/", a subtree is a single range scan
+    path = Column(String(1024), nullable=True)
+
     # use 10000 for default nodes
     sequence = Column(Float, nullable=True)
 
+    # Fractional index among the siblings, see tools/fractional.py
+    rank = Column(String(255), nullable=True)
+
     title = Column(String(50))
     namespace = Column(String(255))
     tags = Column(JSON)
@@ -40,35 +50,149 @@ class Article(Base):
     public = Column(Boolean, default=False)
     article_kind = Column(String(25))
 
+    # Bumped once per write of its blocks, clients sync with `/articles/<id>/changes`
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("idx_articles_path", "path"),
+        Index("idx_articles_parent_rank", "parent", "rank"),
+    )
+
     # Add a view counter for optimizing UX display view
 
+    @staticmethod
+    def subtree_range(path):
+        """All the paths starting with `path`: ["/1/2/", "/1/20") since "0" follows "/" """
+        return path, path[:-1] + chr(ord("/") + 1)
+
+    @staticmethod
+    def in_subtree(path):
+        start, end = Article.subtree_range(path)
+        return (Article.path >= start) & (Article.path < end)
+
+    def assign_path(self, parent=None):
+        """Set the path of a flushed article, its _id is part of it"""
+        prefix = parent.path if parent is not None and parent.path else "/"
+        self.path = f"{prefix}{self._id}/"
+
+    @staticmethod
+    def materialize_path(session, article):
+        """Path of an article left without one (orphans the migration could not reach)
+
+        Built from the parents, up to the first one with a path; the descendants
+        without a path get theirs too. Raises ValueError if the parents loop.
+        """
+        chain = [article]
+        prefix = "/"
+        node = article
+        while node.parent is not None:
+            parent = session.get(Article, node.parent)
+            if parent is None:
+                break
+            if parent.path:
+                prefix = parent.path
+                break
+            if parent in chain:
+                raise ValueError(f"Article {article._id} is its own ancestor")
+            chain.append(parent)
+            node = parent
+
+        for node in reversed(chain):
+            node.path = f"{prefix}{node._id}/"
+            prefix = node.path
+
+        pending = [article]
+        while pending:
+            node = pending.pop()
+            children = session.query(Article).filter(Article.parent == node._id, Article.path.is_(None)).all()
+            for child in children:
+                child.path = f"{node.path}{child._id}/"
+                pending.append(child)
+
+        session.flush()
+
+    def ancestor_ids(self):
+        if not self.path:
+            return []
+        return [int(i) for i in self.path.strip("/").split("/")[:-1]]
+
     @staticmethod
     def get_article_forest(session, article):
-        if article.root_id is not None:
-            query_id = article.root_id
-        else:
-            query_id = article._id
+        if not article.path:
+            return []
+
+        nodes = (
+            session.query(Article)
+            .filter(Article.in_subtree(article.path), Article._id != article._id)
+            .all()
+        )
 
-        nodes = session.query(Article).filter(Article.root_id == query_id).all()
+        # Parents are shorter than their children
+        nodes.sort(key=lambda node: (node.path.count("/"), node.rank or "", node._id))
 
         root = []
         parents = {article._id: {"children": root}}
-        children = nodes
-
-        while len(children) > 0:
-            missed = []
-            for node in children:
-                parent = parents.get(node.parent)
 
+        for node in nodes:
+            # Attach to the closest ancestor found (a private or deleted parent
+            # would otherwise drop the whole branch)
+            parent = None
+            for ancestor in reversed(node.ancestor_ids()):
+                parent = parents.get(ancestor)
                 if parent is not None:
-                    obj = node.to_json()
-                    parent.setdefault("children", []).append(obj)
-                    parents[node._id] = obj
+                    break
 
-            children = missed
+            if parent is None:
+                parent = parents[article._id]
+
+            obj = node.to_json()
+            parent.setdefault("children", []).append(obj)
+            parents[node._id] = obj
 
         return root
 
+    @staticmethod
+    def bump_revision(session, article_id):
+        """Increment the revision of an article and return it, inside the caller transaction"""
+        return session.execute(
+            update(Article)
+            .where(Article._id == article_id)
+            .values(revision=Article.revision + 1)
+            .returning(Article.revision)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+
+    @staticmethod
+    def last_child_rank(session, parent_id):
+        return (
+            session.query(func.max(Article.rank))
+            .filter(Article.parent.is_(None) if parent_id is None else Article.parent == parent_id)
+            .scalar()
+        )
+
+    @staticmethod
+    def move_subtree(session, article, parent, rank=None):
+        """Move `article` and its descendants under `parent` in one UPDATE
+
+        `rank` orders the article among its new siblings, it is left unchanged if None
+        """
+        root_id = parent.root_id if parent.root_id is not None else parent._id
+        old_prefix = article.path
+        new_prefix = f"{parent.path}{article._id}/"
+
+        session.execute(
+            update(Article)
+            .where(Article.in_subtree(old_prefix))
+            .values(
+                path=literal(new_prefix, String).concat(func.substr(Article.path, len(old_prefix) + 1)),
+                root_id=root_id,
+                parent=case((Article._id == article._id, parent._id), else_=Article.parent),
+                rank=case((Article._id == article._id, rank or article.rank), else_=Article.rank),
+            )
+            # The session is committed right after, which expires the moved rows
+            .execution_options(synchronize_session=False)
+        )
+
     @staticmethod
     def get_block_forest(session, articles):
         article_ids = [a["id"] for a in articles]
@@ -77,6 +201,7 @@ class Article(Base):
             session.query(ArticleBlock)
             .filter(ArticleBlock.page_id.in_(article_ids))
             .order_by(
+                ArticleBlock.rank.asc(),
                 ArticleBlock.sequence.asc(),
                 ArticleBlock._id.asc(),
             )
@@ -149,6 +274,15 @@ class Article(Base):
     def get_block_tree(session, article_id):
         return Article.get_block_forest(session, article_ids=[article_id])[0]
 
+    def to_summary_json(self):
+        return {
+            "id": self._id,
+            "title": self.title,
+            "namespace": self.namespace,
+            "tags": self.tags,
+            "article_kind": self.article_kind,
+        }
+
     def to_json(self, session=None, children=False):
         this = {
             "id": self._id,
@@ -158,8 +292,11 @@ class Article(Base):
             "extension": self.extension,
             "parent_id": self.parent,
             "root_id": self.root_id,
+            "path": self.path,
+            "rank": self.rank,
             "public": self.public,
             "article_kind": self.article_kind,
+            "revision": self.revision,
             "blocks": [],
         }
 
@@ -212,8 +349,19 @@ class ArticleBlock(Base):
     # use 10000 for default nodes
     sequence = Column(Float, nullable=True)
 
-    # LexoRank a b c d e f g -> aa ab etc...
-    # sequence = Column(String(32), index=True)
+    # Fractional index among the siblings, it decides the order; sequence is
+    # only kept for the clients that still send floats
+    rank = Column(String(255), nullable=True)
+
+    # Revision of the article when the block was last written
+    revision = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("idx_article_blocks_page_rank", "page_id", "rank"),
+        Index("idx_article_blocks_page_revision", "page_id", "revision"),
+        # Children of a block, walked by the export
+        Index("idx_article_blocks_parent", "parent"),
+    )
 
     kind = Column(String(25))
     data = Column(JSON)
@@ -228,6 +376,8 @@ class ArticleBlock(Base):
             "kind": self.kind,
             "data": self.data,
             "sequence": self.sequence,
+            "rank": self.rank,
+            "revision": self.revision,
             "extension": self.extension,
         }
 
@@ -235,3 +385,16 @@ class ArticleBlock(Base):
         return (
             f"ArticleBlock<page_id={self.page_id}, parent={self.parent}, id={self._id}>"
         )
+
+
+class ArticleBlockTombstone(Base):
+    """Deleted block, so clients syncing with `/articles/<id>/changes` can drop it"""
+
+    __tablename__ = "article_block_tombstones"
+
+    _id = Column(Integer, primary_key=True)
+    page_id = Column(Integer, nullable=False)
+    block_id = Column(Integer, nullable=False)
+    revision = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("idx_article_block_tombstones_page_revision", "page_id", "revision"),)
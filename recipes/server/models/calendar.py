@@ -1,8 +1,9 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, UniqueConstraint, JSON, create_engine, select, Boolean, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, UniqueConstraint, JSON, create_engine, select, Boolean, Index, or_
 from sqlalchemy.orm import relationship, sessionmaker, declarative_base
 
 from .common import Base
+from ...tools.recurrence import RRule, expand, naive_utc
 
 
 #
@@ -79,12 +80,80 @@ class Event(Base):
 
     extension = Column(JSON)
 
+    # Recurrence rule (FREQ=WEEKLY;BYDAY=MO,WE...), see tools/recurrence.py
+    # the occurrences are computed for the queried window, never stored
+    rrule = Column(String(255))
+    # End of the last occurrence, None for a series without end
+    recurrence_end = Column(DateTime)
+
+    __table_args__ = (
+        Index('idx_events_start_end', 'datetime_start', 'datetime_end'),
+    )
+
     # Relationships
     # task = relationship('Task', back_populates='events')
 
     def __repr__(self):
         return f'<Event {self.title}>'
 
+    @staticmethod
+    def in_window(session, start, end, templates=True):
+        """json of the events and of the occurrences of the series overlapping [start, end)"""
+        query = session.query(Event)
+        if not templates:
+            query = query.filter(Event.template.isnot(True))
+
+        # Events overlapping the window, range scan on (datetime_start, datetime_end)
+        events = query.filter(
+            Event.rrule.is_(None),
+            Event.datetime_start < end,
+            Event.datetime_end > start,
+        ).all()
+
+        # Series started before the end of the window and not finished before it
+        series = query.filter(
+            Event.rrule.isnot(None),
+            Event.datetime_start < end,
+            or_(Event.recurrence_end.is_(None), Event.recurrence_end > start),
+        ).all()
+
+        result = [event.to_json() for event in events]
+        for event in series:
+            result.extend(event.occurrences(start, end))
+
+        result.sort(key=lambda e: e['datetime_start'])
+        return result
+
+    def set_recurrence(self, rule):
+        """Store the rule normalized, raises ValueError if it is invalid"""
+        self.rrule = str(RRule.parse(rule)) if rule else None
+        self.recuring = self.rrule is not None
+        self.update_recurrence_end()
+
+    def update_recurrence_end(self):
+        """To call when the rule or the times change"""
+        self.recurrence_end = None
+        if self.rrule is None:
+            return
+
+        start = naive_utc(self.datetime_start)
+        last = RRule.parse(self.rrule).last_occurrence(start)
+        if last is not None:
+            self.recurrence_end = last + (naive_utc(self.datetime_end) - start)
+
+    def occurrences(self, start, end):
+        """The occurrences of a recurring event overlapping [start, end), as json"""
+        duration = self.datetime_end - self.datetime_start
+
+        result = []
+        for moment in expand(self.rrule, self.datetime_start, duration, naive_utc(start), naive_utc(end)):
+            obj = self.to_json()
+            obj['datetime_start'] = moment.isoformat() + 'Z'
+            obj['datetime_end'] = (moment + duration).isoformat() + 'Z'
+            obj['recurrence_id'] = obj['datetime_start']
+            result.append(obj)
+        return result
+
     def to_json(self):
         return {
             'id': self._id,
@@ -105,5 +174,6 @@ class Event(Base):
             'recuring': self.recuring,
             'active': self.active,
             'owner': self.owner,
-            'name': self.name
+            'name': self.name,
+            'rrule': self.rrule,
         }
@@ -0,0 +1,24 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+
+from .common import Base
+
+
+class TableVersion(Base):
+    """Monotonic version per table, bumped on every write going through the app session
+
+    Lets another process (`recipes static --watch`) know which tables changed
+    without diffing their content.
+    """
+    __tablename__ = 'table_versions'
+
+    table_name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_json(self):
+        return {
+            'table': self.table_name,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
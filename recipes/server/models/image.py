@@ -0,0 +1,42 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Text, JSON, Index
+
+from .common import Base
+
+
+class ImageJob(Base):
+    """Background processing of an upload, see `ImageJobs`
+
+    Kept in the database so any worker process can answer a poll and
+    the status outlives a restart.
+    """
+    __tablename__ = 'image_jobs'
+
+    _id = Column(String(32), primary_key=True)
+    namespace = Column(String(255), nullable=False)
+    state = Column(String(16), nullable=False, default="queued")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    image = Column(String(255))
+    url = Column(String(255))
+    derivatives = Column(JSON)
+    duplicates = Column(JSON)
+    error = Column(Text)
+
+    __table_args__ = (
+        Index('idx_image_jobs_created_at', 'created_at'),
+    )
+
+    def to_json(self):
+        return {
+            'id': self._id,
+            'namespace': self.namespace,
+            'state': self.state,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'image': self.image,
+            'url': self.url,
+            'derivatives': self.derivatives or [],
+            'duplicates': self.duplicates or [],
+            'error': self.error,
+        }
@@ -13,12 +13,15 @@ class KeyValueStore(Base):
     value = Column(JSON)
     created_at = Column(DateTime, default=datetime.now())
     updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+    # Sequence of the topic when the key was last written, see KeyValueTopic
+    seq = Column(Integer)
 
     # Composite primary key constraint on (topic, key)
     __table_args__ = (
         # Additional index for topic-only queries (primary key already indexes topic+key)
         Index('idx_keyvalue_topic', 'topic'),
         Index('idx_keyvalue_key', 'key'),
+        Index('idx_keyvalue_topic_seq', 'topic', 'seq'),
     )
 
     def __repr__(self):
@@ -32,3 +35,14 @@ class KeyValueStore(Base):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+class KeyValueTopic(Base):
+    """Change sequence of a topic, bumped once per write request
+
+    `/kv/<topic>/_watch?since=<seq>` returns the keys written with a greater sequence.
+    """
+    __tablename__ = 'key_value_topics'
+
+    topic = Column(String(100), primary_key=True, nullable=False)
+    seq = Column(Integer, nullable=False, default=0)
@@ -142,6 +142,19 @@ class Recipe(Base):
             'categories': [category.to_json() for category in self.categories] if self.categories else []
         }
 
+    def to_summary_json(self):
+        # Listing projection, no nested ingredients
+        return {
+            'id': self._id,
+            'title': self.title,
+            'images': self.images[:1] if self.images else [],
+            'prep_time': self.prep_time,
+            'cook_time': self.cook_time,
+            'servings': self.servings,
+            "component": self.component,
+            'categories': [category.name for category in self.categories] if self.categories else []
+        }
+
 
 class IngredientComposition(Base):
     __tablename__ = 'ingredient_compositions'
@@ -244,6 +257,14 @@ class Ingredient(Base):
             }
         }
 
+    def to_summary_json(self):
+        return {
+            'id': self._id,
+            'name': self.name,
+            'calories': self.calories,
+            "fdc_id": self.fdc_id,
+        }
+
 
 class Category(Base):
     __tablename__ = 'categories'
@@ -1,6 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, UniqueConstraint, JSON, create_engine, select, Boolean, Index, or_
-from sqlalchemy.orm import relationship, sessionmaker, declarative_base
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, UniqueConstraint, JSON, create_engine, select, Boolean, Index, or_, func, literal, update
+from sqlalchemy.orm import relationship, sessionmaker, declarative_base, aliased
+from sqlalchemy import case, exists
 
 from .common import Base
 
@@ -33,6 +34,12 @@ class Task(Base):
     #
     extension = Column(JSON)
 
+    __table_args__ = (
+        Index('idx_tasks_root_id', 'root_id'),
+        Index('idx_tasks_parent_id', 'parent_id'),
+        Index('idx_tasks_deadline', 'datetime_deadline'),
+    )
+
     # # Relationships
     parent = relationship(
         "Task",
@@ -53,51 +60,137 @@ class Task(Base):
 
 
     @staticmethod
-    def get_task_forest(session, task_ids):
-        nodes = (
-            session.query(Task)
-            .filter(or_(Task.root_id.in_(task_ids), Task._id.in_(task_ids)))
-            .order_by(Task.priority.desc(), Task._id)
-            .order_by(Task._id.asc())
-            .all()
+    def orphaned():
+        """Condition of the tasks whose parent was deleted"""
+        parent = aliased(Task)
+        return Task.parent_id.isnot(None) & ~exists().where(parent._id == Task.parent_id)
+
+    @staticmethod
+    def root_ids(session):
+        """Ids of the top level tasks: no parent, or an orphan whose root is gone too"""
+        roots = select(Task._id).where(Task.parent_id.is_(None))
+        orphans = Task.orphaned() & (Task.root_id.is_(None) | Task.root_id.notin_(roots))
+        return [row[0] for row in session.query(Task._id).filter(Task.parent_id.is_(None) | orphans)]
+
+    @staticmethod
+    def subtree(task_ids, depth=None):
+        """CTE of the ids of the tasks and of their descendants, `depth` levels down at most
+
+        Walks `parent_id`, so it does not rely on `root_id` being up to date. The
+        orphans (parent deleted) of a tree are part of it, one level below its root,
+        like `build_forest` shows them.
+        """
+        seeds = Task._id.in_(task_ids)
+        if depth is None or depth >= 1:
+            seeds = seeds | (Task.root_id.in_(task_ids) & Task.orphaned())
+
+        if depth is None:
+            # UNION drops the rows seen before, it stops on a cycle
+            tree = select(Task._id).where(seeds).cte("subtree", recursive=True)
+            return tree.union(select(Task._id).join(tree, Task.parent_id == tree.c._id))
+
+        tree = (
+            select(Task._id, case((Task._id.in_(task_ids), 0), else_=1).label("depth"))
+            .where(seeds)
+            .cte("subtree", recursive=True)
+        )
+        return tree.union(
+            select(Task._id, tree.c.depth + 1)
+            .join(tree, Task.parent_id == tree.c._id)
+            .where(tree.c.depth < depth)
         )
 
-        parents = {}
+    @staticmethod
+    def build_forest(nodes, task_ids):
+        """Nest the tasks under their parent in one pass, whatever the order of their ids
+
+        `nodes` are in display order, the children lists keep it. A task whose parent
+        was not loaded (deleted) is attached to its root.
+        """
+        task_ids = set(task_ids)
+        objs = {node._id: node.to_json() for node in nodes}
         roots = []
-        children = []
 
         for node in nodes:
-            if node._id == node.root_id or node.parent_id is None:
-                obj = node.to_json()
-                parents[node._id] = obj
+            obj = objs[node._id]
+            if node._id in task_ids:
                 roots.append(obj)
-            else:
-                children.append(node)
-
-        assert len(roots) == len(task_ids), "All roots should have been fetched"
-
-        # If the query order by task_id, it should do this loop in a single pass
-        # because parent need to be created first so their _id will be smaller
-        # than the children
-        while len(children) > 0:
-            missed = []
-            for task in children:
-                parent = parents.get(task.parent_id)
-                if parent is not None:
-                    obj = task.to_json()
-                    parent.setdefault("children", []).append(obj)
-                    parents[task._id] = obj
-                else:
-                    missed.append(task)
-
-            children = missed
-            assert len(children) == 0, "All the children should have been sorted correctly"
+                continue
+
+            parent = objs.get(node.parent_id) or objs.get(node.root_id)
+            if parent is not None and parent is not obj:
+                parent["children"].append(obj)
 
         return roots
 
     @staticmethod
-    def get_task_tree(session, task_id):
-        return Task.get_task_forest(session, task_ids=[task_id])[0]
+    def child_counts(session, task_ids):
+        counts = dict(
+            session.query(Task.parent_id, func.count(Task._id))
+            .filter(Task.parent_id.in_(task_ids))
+            .group_by(Task.parent_id)
+            .all()
+        )
+        # Orphans are shown under their root
+        orphans = (
+            session.query(Task.root_id, func.count(Task._id))
+            .filter(Task.root_id.in_(task_ids), Task.orphaned())
+            .group_by(Task.root_id)
+        )
+        for root_id, count in orphans:
+            counts[root_id] = counts.get(root_id, 0) + count
+        return counts
+
+    @staticmethod
+    def get_task_forest(session, task_ids, depth=None):
+        """Trees of the given tasks; with `depth`, only that many levels below them
+
+        Depth limited trees report the `child_count` of every task, so the client
+        can lazily expand the branches it did not receive with `/tasks/<id>/children`.
+        """
+        tree = Task.subtree(task_ids, depth)
+
+        nodes = (
+            session.query(Task)
+            .filter(Task._id.in_(select(tree.c._id)))
+            .order_by(Task.priority.desc(), Task._id.asc())
+            .all()
+        )
+
+        forest = Task.build_forest(nodes, task_ids)
+
+        if depth is not None:
+            counts = Task.child_counts(session, select(tree.c._id))
+
+            stack = list(forest)
+            while stack:
+                obj = stack.pop()
+                obj["child_count"] = counts.get(obj["id"], 0)
+                stack.extend(obj["children"])
+
+        return forest
+
+    @staticmethod
+    def get_task_tree(session, task_id, depth=None):
+        forest = Task.get_task_forest(session, task_ids=[task_id], depth=depth)
+        return forest[0] if forest else None
+
+    @staticmethod
+    def is_descendant(session, task_id, ancestor_id):
+        """True if `task_id` is `ancestor_id` or one of its descendants"""
+        tree = Task.subtree([ancestor_id])
+        return session.query(select(tree.c._id).where(tree.c._id == task_id).exists()).scalar()
+
+    @staticmethod
+    def set_subtree_root(session, task_id, root_id):
+        """Point the whole subtree of a moved task to its new root, in one UPDATE"""
+        tree = Task.subtree([task_id])
+        session.execute(
+            update(Task)
+            .where(Task._id.in_(select(tree.c._id)))
+            .values(root_id=root_id)
+            .execution_options(synchronize_session=False)
+        )
 
     def to_json(self):
         return {
@@ -0,0 +1,87 @@
+"""
+Paginated summary shards for large collections.
+
+The static site cannot filter or slice a collection, so the frontend used to
+download the whole `/recipes.json` before rendering a list. Each paginated
+collection exposes two extra routes that the static generator crawls like any
+other exposed route:
+
+    <url>/page/index      manifest: total count, page size, one hash per page
+    <url>/page/<int:n>    summary projection of the rows of page n (1-based)
+
+The hashes let the client keep shards in cache and only refetch the pages
+whose content changed between two builds.
+"""
+import hashlib
+import json
+
+from flask import jsonify
+
+from .decorators import expose, depends_on
+
+
+PAGE_SIZE = 50
+
+
+def page_count(total: int, page_size: int = PAGE_SIZE) -> int:
+    return (total + page_size - 1) // page_size
+
+
+def shard_hash(items) -> str:
+    """Stable hash of a shard content"""
+    encoded = json.dumps(items, separators=(",", ":"), sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def page_manifest(items, page_size: int = PAGE_SIZE):
+    pages = []
+    for start in range(0, len(items), page_size):
+        shard = items[start:start + page_size]
+        pages.append({
+            "page": start // page_size + 1,
+            "count": len(shard),
+            "hash": shard_hash(shard),
+        })
+
+    return {
+        "count": len(items),
+        "page_size": page_size,
+        "hash": shard_hash([page["hash"] for page in pages]),
+        "pages": pages,
+    }
+
+
+def paginated_routes(app, name, url, query, summary, tables=(), page_size=PAGE_SIZE):
+    """Register the manifest and page routes of a collection
+
+    Args:
+        name: prefix used for the flask endpoints
+        url: url of the full collection, pages are served under `<url>/page/`
+        query: callable returning the ORM query of the collection, it needs a stable order
+        summary: callable projecting a row to its summary json
+        tables: tables the summary reads from, see `depends_on`
+    """
+
+    def collection_pages():
+        return range(1, page_count(query().count(), page_size) + 1)
+
+    @expose()
+    @depends_on(*tables)
+    def index():
+        items = [summary(row) for row in query().all()]
+        return jsonify(page_manifest(items, page_size))
+
+    @expose(page=collection_pages)
+    @depends_on(*tables)
+    def page(page: int):
+        if page < 1:
+            return jsonify({"error": "Page not found"}), 404
+
+        rows = query().offset((page - 1) * page_size).limit(page_size).all()
+        if not rows and page > 1:
+            return jsonify({"error": "Page not found"}), 404
+
+        return jsonify([summary(row) for row in rows])
+
+    app.add_url_rule(f"{url}/page/index", f"{name}_page_index", index, methods=["GET"])
+    app.add_url_rule(f"{url}/page/<int:page>", f"{name}_page", page, methods=["GET"])
@@ -0,0 +1,204 @@
+"""
+Daily plans: the routine of the day, the calendar events and the tasks due.
+
+Routines are template events drawn on the week of Monday 1970-01-05 (see
+`Routine.tsx`); a template keeps its offset from that Monday and is moved to the
+same offset in the planned week.
+
+Plans are computed a range at a time (three queries whatever the number of days)
+and cached per day. A cached plan is valid as long as the versions of the
+`events` and `tasks` tables did not change (see `changes.py`); the versions are
+bumped by every write, from any process, so a cached plan is never stale.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from .models import Event, Task, TableVersion
+
+
+ROUTINE_WEEK = datetime(1970, 1, 5)
+DEPENDENCIES = (Event.__tablename__, Task.__tablename__)
+
+
+def _iso(moment):
+    return moment.isoformat() + "Z"
+
+
+def _parse_iso(text):
+    return datetime.fromisoformat(text.rstrip("Z"))
+
+
+def routine_slots(templates, start, end):
+    """Routine templates moved to the week(s) of [start, end)"""
+    monday = datetime.combine(start.date() - timedelta(days=start.weekday()), time())
+
+    slots = []
+    for template in templates:
+        offset = template.datetime_start - ROUTINE_WEEK
+        duration = template.datetime_end - template.datetime_start
+
+        # Templates are stored in UTC, they can fall a day outside of the template week
+        week = monday - timedelta(weeks=1)
+        while week < end + timedelta(weeks=1):
+            slot = week + offset
+            if start <= slot < end:
+                slots.append({
+                    "kind": "routine",
+                    "id": template._id,
+                    "title": template.title,
+                    "color": template.color,
+                    "datetime_start": _iso(slot),
+                    "datetime_end": _iso(slot + duration),
+                })
+            week += timedelta(weeks=1)
+    return slots
+
+
+def task_item(task):
+    return {
+        "kind": "task",
+        "id": task._id,
+        "title": task.title,
+        "priority": task.priority or 0,
+        "datetime_deadline": _iso(task.datetime_deadline) if task.datetime_deadline else None,
+        "root_id": task.root_id,
+    }
+
+
+def open_tasks(session):
+    return session.query(Task).filter(
+        Task.done.isnot(True),
+        Task.active.isnot(False),
+        Task.template.isnot(True),
+    )
+
+
+def checklist(plan, utc_offset=0):
+    """Lines of a day plan, for the Telegram checklist"""
+    shift = timedelta(minutes=utc_offset)
+
+    lines = []
+    for item in plan["schedule"]:
+        local = _parse_iso(item["datetime_start"]) + shift
+        lines.append(f"{local:%H:%M} {item['title']}")
+    lines.extend(task["title"] for task in plan["tasks"])
+    return lines
+
+
+def compute_plans(session, owner, name, first_day, days, utc_offset=0):
+    """{day: plan} of `days` days; a day runs from local midnight, `utc_offset` minutes from UTC"""
+    shift = timedelta(minutes=utc_offset)
+    start = datetime.combine(first_day, time()) - shift
+    end = start + timedelta(days=days)
+
+    templates = []
+    if owner and name:
+        templates = session.query(Event).filter(
+            Event.template == True,
+            Event.owner == owner,
+            Event.name == name,
+        ).all()
+
+    fixed = routine_slots(templates, start, end)
+    fixed.extend({"kind": "event", **event} for event in Event.in_window(session, start, end, templates=False))
+    fixed.sort(key=lambda item: item["datetime_start"])
+
+    tasks = (
+        open_tasks(session)
+        .filter(Task.datetime_deadline >= start, Task.datetime_deadline < end)
+        .order_by(Task.priority.desc(), Task.datetime_deadline.asc())
+        .all()
+    )
+
+    plans = {}
+    for i in range(days):
+        day = first_day + timedelta(days=i)
+        plans[day] = {"date": day.isoformat(), "schedule": [], "tasks": []}
+
+    def day_of(moment):
+        return (moment + shift).date()
+
+    for item in fixed:
+        begin = max(_parse_iso(item["datetime_start"]), start)
+        finish = max(_parse_iso(item["datetime_end"]), begin + timedelta(microseconds=1))
+
+        # Events spanning several days are on each of them
+        day = day_of(begin)
+        while day in plans and datetime.combine(day, time()) - shift < finish:
+            plans[day]["schedule"].append(item)
+            day += timedelta(days=1)
+
+    for task in tasks:
+        plans[day_of(task.datetime_deadline)]["tasks"].append(task_item(task))
+
+    for plan in plans.values():
+        plan["checklist"] = checklist(plan, utc_offset)
+    return plans
+
+
+def backlog(session, before):
+    """Open tasks overdue at `before` or without deadline, most important first"""
+    tasks = (
+        open_tasks(session)
+        .filter((Task.datetime_deadline < before) | Task.datetime_deadline.is_(None))
+        .order_by(
+            Task.priority.desc(),
+            Task.datetime_deadline.is_(None),
+            Task.datetime_deadline.asc(),
+            Task._id.asc(),
+        )
+        .all()
+    )
+    return [task_item(task) for task in tasks]
+
+
+class PlanCache:
+    """Day plans of the recent requests, valid while their dependencies did not change"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def versions(session):
+        rows = dict(
+            session.query(TableVersion.table_name, TableVersion.version)
+            .filter(TableVersion.table_name.in_(DEPENDENCIES))
+            .all()
+        )
+        return tuple(rows.get(table, 0) for table in DEPENDENCIES)
+
+    def plans(self, session, owner, name, first_day, days, utc_offset=0):
+        versions = self.versions(session)
+        keys = [(owner, name, utc_offset, first_day + timedelta(days=i)) for i in range(days)]
+
+        with self.lock:
+            cached = [self.entries.get(key) for key in keys]
+            if all(entry is not None and entry[0] == versions for entry in cached):
+                self.hits += days
+                for key in keys:
+                    self.entries.move_to_end(key)
+                return [entry[1] for entry in cached]
+
+        # Compute the whole range, it costs the same queries as a single day
+        computed = compute_plans(session, owner, name, first_day, days, utc_offset)
+
+        with self.lock:
+            self.misses += days
+            for key in keys:
+                self.entries[key] = (versions, computed[key[3]])
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return [computed[key[3]] for key in keys]
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,476 @@
+"""
+Preforking WSGI server, the production counterpart of `app.run`.
+
+The master loads the application and binds the socket, then forks the workers.
+They share the loaded code and accept the connections of the same socket, each
+serving them with a pool of threads. Threads share the GIL: the throughput
+grows with the workers (up to one per core), the threads cover the time spent
+waiting on SQLite, the disk or a long poll. Only state kept outside of the
+process (the database, files) is seen by every worker.
+
+Signals to the master:
+
+    TERM, INT   graceful stop: the workers stop accepting and finish their requests
+    HUP         graceful reload: the master re-executes itself (new code) on the
+                same socket, the old workers finish their requests meanwhile
+
+Connections are kept alive for `keepalive` seconds between requests, unless
+other connections are waiting for a thread: an idle connection holds its thread.
+A worker serving a request for more than `timeout` seconds, or stuck, is killed
+and replaced; workers that do not stop within `graceful_timeout` are killed.
+A stopping worker runs `pre_exit` once its requests are done, to finish the
+background work of the application within that time.
+"""
+from __future__ import annotations
+
+import io
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.sharedctypes import RawArray
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+# Set by a reloading master for the master it executes
+LISTEN_FD = 'RECIPES_SERVER_FD'
+DRAINING = 'RECIPES_SERVER_DRAINING'
+
+# Unread request bodies up to this size are skipped to keep the connection
+DRAIN_LIMIT = 1024 ** 2
+
+# Seconds between the checks of an idle kept-alive connection
+IDLE_CHECK = 0.25
+
+
+class PoolServer(BaseWSGIServer):
+    """Werkzeug server handing the connections to a bounded pool of threads"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, keepalive=5, fd=None):
+        handler = type("RequestHandler", (RequestHandler,), {"timeout": keepalive})
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self.threads = threads
+        # Connections accepted and not closed yet, those past `threads` wait for a thread
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.active = {}
+        self.stopping = False
+        super().__init__(host, port, app, handler=handler, fd=fd)
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.lock:
+                self.connections -= 1
+
+    def saturated(self):
+        """Connections are waiting for a thread, the idle ones must not keep theirs"""
+        return self.connections > self.threads
+
+    def oldest_request(self):
+        """Start of the oldest request in progress, None when idle"""
+        return min(self.active.values(), default=None)
+
+
+class RequestBody(io.RawIOBase):
+    """wsgi.input stopping at the Content-Length, the next request follows"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size == 0:
+            return 0
+        read = self.stream.readinto(memoryview(buffer)[:size])
+        if not read:
+            raise ConnectionError("Client disconnected")
+        self.remaining -= read
+        return read
+
+
+def drain(body, limit=DRAIN_LIMIT):
+    """Read the rest of a request body, False if more than `limit` bytes are left"""
+    while limit > 0:
+        data = body.read(min(limit, 64 * 1024))
+        if not data:
+            return True
+        limit -= len(data)
+    return False
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Werkzeug's handler, keeping the connections alive
+
+    Werkzeug closes the connection after every response, it drains the socket
+    without knowing where the request ends. Here the body is read up to its
+    length, so the connection is ready for the next request.
+    """
+    protocol_version = "HTTP/1.1"
+    # Requests served on the connection
+    requests = 0
+
+    def setup(self):
+        super().setup()
+        # Headers and body are separate writes, do not wait for the ACK of the first
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip() == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        self.environ = environ = self.make_environ()
+        if environ.get("wsgi.input_terminated"):
+            # Chunked, werkzeug reads up to the last chunk
+            body = environ["wsgi.input"]
+        else:
+            try:
+                length = max(int(environ.get("CONTENT_LENGTH") or 0), 0)
+            except ValueError:
+                self.send_error(400, "Invalid Content-Length")
+                return
+            body = RequestBody(self.rfile, length)
+            environ["wsgi.input"] = io.BufferedReader(body)
+
+        status = headers = None
+        sent = chunked = False
+
+        def write(data):
+            nonlocal sent, chunked
+            if not sent:
+                code, _, reason = status.partition(" ")
+                code = int(code)
+                self.send_response(code, reason)
+                names = set()
+                for name, value in headers:
+                    self.send_header(name, value)
+                    names.add(name.lower())
+
+                if "content-length" not in names and self.command != "HEAD" \
+                        and not (100 <= code < 200 or code in (204, 304)):
+                    chunked = True
+                    self.send_header("Transfer-Encoding", "chunked")
+                if self.server.stopping or self.server.saturated():
+                    self.send_header("Connection", "close")
+                    self.close_connection = True
+                self.end_headers()
+                sent = True
+
+            if data and chunked:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            elif data:
+                self.wfile.write(data)
+
+        def start_response(new_status, new_headers, exc_info=None):
+            nonlocal status, headers
+            if exc_info is not None and sent:
+                raise exc_info[1].with_traceback(exc_info[2])
+            status, headers = new_status, new_headers
+            return write
+
+        def execute(app):
+            response = app(environ, start_response)
+            try:
+                for data in response:
+                    write(data)
+                if not sent:
+                    write(b"")
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(response, "close"):
+                    response.close()
+
+        try:
+            execute(self.server.app)
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+            return
+        except Exception:
+            self.close_connection = True
+            if not sent:
+                status = headers = None
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+            self.server.log("error", f"Error on request:\n{traceback.format_exc()}")
+            return
+
+        # What the application did not read of the body is before the next request
+        if not drain(body):
+            self.close_connection = True
+
+    def idle_until_request(self):
+        """True once the next request arrives, False to close the idle connection
+
+        Waits up to the keepalive timeout, less when the server stops or other
+        connections are waiting for this thread.
+        """
+        # A pipelined request is already read into the buffer
+        self.connection.setblocking(False)
+        try:
+            if self.rfile.peek(1):
+                return True
+        finally:
+            self.connection.settimeout(self.timeout)
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.server.stopping or self.server.saturated():
+                return False
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, IDLE_CHECK))
+            if readable:
+                return True
+
+    def handle_one_request(self):
+        if self.requests and not self.idle_until_request():
+            self.close_connection = True
+            return
+        self.requests += 1
+
+        self.server.active[threading.get_ident()] = time.monotonic()
+        try:
+            super().handle_one_request()
+        finally:
+            self.server.active.pop(threading.get_ident(), None)
+
+        if self.server.stopping:
+            self.close_connection = True
+
+
+def worker_loop(server, heartbeat=None, slot=0):
+    """Accept connections until SIGTERM, then let the pool finish the requests"""
+    def stop(signum, frame):
+        server.stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # Wake up every second to check the flag and report
+    server.timeout = 1.0
+    while not server.stopping:
+        server.handle_request()
+        if heartbeat is not None:
+            oldest = server.oldest_request()
+            heartbeat[slot] = oldest if oldest is not None else time.monotonic()
+
+    server.socket.close()
+    server.pool.shutdown(wait=True)
+
+
+def run_pre_exit(pre_exit):
+    """1 if the hook failed"""
+    if pre_exit is None:
+        return 0
+    try:
+        pre_exit()
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+class Master:
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=2, threads=8,
+                 timeout=120, graceful_timeout=30, keepalive=5, backlog=2048, post_fork=None, pre_exit=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+        self.backlog = backlog
+        self.post_fork = post_fork
+        self.pre_exit = pre_exit
+
+        self.listener = None
+        # slot -> pid of the worker
+        self.children = {}
+        # pid -> deadline of the workers being stopped
+        self.draining = {}
+        self.heartbeat = RawArray('d', workers)
+        self.state = "running"
+
+    def bind(self):
+        fd = os.environ.pop(LISTEN_FD, None)
+        if fd is not None:
+            self.listener = socket.socket(fileno=int(fd))
+        else:
+            self.listener = socket.create_server((self.host, self.port), backlog=self.backlog)
+        # Every worker is woken up by a connection, the ones that lose the race
+        # must not block in accept
+        self.listener.setblocking(False)
+
+    def spawn(self, slot):
+        self.heartbeat[slot] = time.monotonic()
+        pid = os.fork()
+        if pid:
+            self.children[slot] = pid
+            return
+
+        # Worker
+        status = 0
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            if self.post_fork is not None:
+                self.post_fork()
+            server = PoolServer(
+                self.host, self.port, self.app,
+                threads=self.threads, keepalive=self.keepalive, fd=self.listener.fileno(),
+            )
+            server.multiprocess = True
+            server.socket.setblocking(False)
+            self.listener.close()
+            worker_loop(server, self.heartbeat, slot)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            status = run_pre_exit(self.pre_exit) or status
+            os._exit(status)
+
+    def stop_worker(self, pid, sig=signal.SIGTERM):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            return
+        self.draining.setdefault(pid, time.monotonic() + self.graceful_timeout)
+
+    def reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            self.draining.pop(pid, None)
+            for slot, child in list(self.children.items()):
+                if child == pid:
+                    del self.children[slot]
+
+    def check(self):
+        now = time.monotonic()
+
+        if self.timeout:
+            for slot, pid in list(self.children.items()):
+                if now - self.heartbeat[slot] > self.timeout:
+                    print(f"Worker {pid} timed out, restarting", file=sys.stderr)
+                    os.kill(pid, signal.SIGKILL)
+                    del self.children[slot]
+                    self.draining[pid] = now
+
+        for pid, deadline in list(self.draining.items()):
+            if now > deadline:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.draining.pop(pid)
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            self.state = "reloading"
+        elif signum in (signal.SIGTERM, signal.SIGINT):
+            self.state = "stopping"
+
+    def reload(self):
+        """Execute the command again, the new master takes over the socket"""
+        for pid in self.children.values():
+            self.stop_worker(pid)
+
+        os.set_inheritable(self.listener.fileno(), True)
+        os.environ[LISTEN_FD] = str(self.listener.fileno())
+        os.environ[DRAINING] = ",".join(str(pid) for pid in self.draining)
+        os.execv(sys.executable, sys.orig_argv)
+
+    def run(self):
+        self.bind()
+
+        # Workers left running by the master before a reload
+        for pid in filter(None, os.environ.pop(DRAINING, "").split(",")):
+            self.draining[int(pid)] = time.monotonic() + self.graceful_timeout
+
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.handle_signal)
+
+        print(f"Serving on {self.host}:{self.port}, {self.workers} workers of {self.threads} threads")
+        while self.state == "running":
+            for slot in range(self.workers):
+                if slot not in self.children:
+                    self.spawn(slot)
+
+            time.sleep(1)
+            self.reap()
+            self.check()
+
+        if self.state == "reloading":
+            self.reload()
+
+        for pid in self.children.values():
+            self.stop_worker(pid)
+        self.children = {}
+
+        while self.draining:
+            self.reap()
+            self.check()
+            time.sleep(0.1)
+        self.listener.close()
+
+
+def serve(app, host='0.0.0.0', port=5000, workers=None, threads=8, timeout=120,
+          graceful_timeout=30, keepalive=5, backlog=2048, post_fork=None, pre_exit=None):
+    """Serve a WSGI application with `workers` processes (one per core) of `threads` threads
+
+    `post_fork` runs in every worker after the fork, to drop the resources that
+    cannot be shared with the master (database connections). `pre_exit` runs in
+    every worker before it exits, after its last request.
+
+    A single worker is still supervised by a master, for the reload and the timeout.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if hasattr(os, "fork"):
+        Master(
+            app, host, port, workers, threads, timeout, graceful_timeout, keepalive, backlog,
+            post_fork, pre_exit,
+        ).run()
+        return
+
+    # No fork (Windows): a single process, no master to supervise it
+    server = PoolServer(host, port, app, threads=threads, keepalive=keepalive)
+    print(f"Serving on {host}:{port}, 1 worker of {threads} threads")
+    try:
+        worker_loop(server)
+    finally:
+        run_pre_exit(pre_exit)
@@ -1,15 +1,21 @@
+import itertools
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any
 from datetime import datetime
 from traceback import print_exc
 
-from flask import jsonify, request
-from sqlalchemy import select, event
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import select, event, insert, delete, update, bindparam
 from sqlalchemy.orm import Session, with_loader_criteria
 
-from .models.article import Article, ArticleBlock
-from .decorators import expose
+from . import article_export
+from .models.article import Article, ArticleBlock, ArticleBlockTombstone
+from .decorators import expose, depends_on
+from .executors import register_executor
+from .pagination import paginated_routes
 from .query_context import is_public_only
+from ..tools.fractional import key_between, keys_between, spread_keys, needs_rebalance
 
 
 @event.listens_for(Session, "do_orm_execute")
@@ -26,11 +32,326 @@ def _filter_public_articles(execute_state):
         )
 
 
+class ArticleRevisions(dict):
+    """Revision of each article written by a request, bumped once on first use"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    def __missing__(self, page_id):
+        revision = self[page_id] = Article.bump_revision(self.session, page_id)
+        return revision
+
+
+def record_tombstones(session, deleted, revisions):
+    """Remember the deleted (block_id, page_id) for the clients syncing the article"""
+    rows = [
+        {"page_id": page_id, "block_id": block_id, "revision": revisions[page_id]}
+        for block_id, page_id in deleted
+        if page_id is not None
+    ]
+    if rows:
+        session.execute(insert(ArticleBlockTombstone), rows)
+
+
+def _siblings(model, parent, page_id=None):
+    filters = [model.parent.is_(None) if parent is None else model.parent == parent]
+    if page_id is not None:
+        filters.append(model.page_id == page_id)
+    return filters
+
+
+def _ranks_between(before, after, n=1):
+    # Neighbours out of order (legacy float sequences), insert after `before`
+    if before is not None and after is not None and before >= after:
+        after = None
+    return keys_between(before, after, n)
+
+
+def block_neighbour_ranks(session, page_id, parent, low=None, high=None, exclude=None):
+    """Ranks around a position given as float sequences, the end of the list without them"""
+    query = session.query(ArticleBlock.rank).filter(
+        *_siblings(ArticleBlock, parent, page_id),
+        ArticleBlock.rank.isnot(None),
+    )
+    if exclude is not None:
+        query = query.filter(ArticleBlock._id != exclude)
+
+    if low is None:
+        return query.order_by(ArticleBlock.rank.desc()).limit(1).scalar(), None
+
+    before = query.filter(ArticleBlock.sequence < low).order_by(ArticleBlock.rank.desc()).limit(1).scalar()
+
+    after = query.filter(ArticleBlock.sequence > high)
+    if before is not None:
+        # Sequences and ranks can disagree after moves by id, stay right after `before`
+        after = after.filter(ArticleBlock.rank > before)
+    after = after.order_by(ArticleBlock.rank.asc()).limit(1).scalar()
+    return before, after
+
+
+def rebalance_siblings(session, model, parent, page_id=None):
+    """Give a sibling list short evenly spread ranks again, in one executemany UPDATE
+
+    Respaced blocks are stamped with a new revision of their article, their rank changed.
+    """
+    ids = [
+        row[0]
+        for row in session.query(model._id)
+        .filter(*_siblings(model, parent, page_id))
+        .order_by(model.rank.asc(), model.sequence.asc(), model._id.asc())
+    ]
+
+    if ids:
+        values = dict(rank=bindparam("b_rank"))
+        if model is ArticleBlock and page_id is not None:
+            values["revision"] = Article.bump_revision(session, page_id)
+
+        session.execute(
+            update(model.__table__)
+            .where(model.__table__.c._id == bindparam("b_id"))
+            .values(**values),
+            [{"b_id": i, "b_rank": rank} for i, rank in zip(ids, spread_keys(len(ids)))],
+        )
+    return len(ids)
+
+
+def _insert_rows(session, rows):
+    """Bulk insert blocks, returns their ids in the order of `rows`"""
+    if not rows:
+        return []
+
+    # Multi VALUES INSERT ... RETURNING; asking SQLAlchemy to sort the rows falls back
+    # to one INSERT per row on SQLite. Rows are inserted in order and the rowid
+    # grows, so sorting the new ids gives them back in the order of `rows`.
+    result = session.execute(insert(ArticleBlock).returning(ArticleBlock._id), rows)
+    return sorted(row[0] for row in result)
+
+
+def insert_block_actions(session, inserts, crowded=None, revisions=None):
+    """Insert the nested blocks of all the insert actions, one statement per depth level
+
+    The inserted blocks get ranks between their neighbours, located from the float
+    sequences the editor sends; nested blocks start fresh sibling lists.
+    Sibling lists whose keys grew long are added to `crowded`.
+    The blocks are stamped with the new revision of their article.
+
+    Returns one reply per action: {"action": "insert", "children": [{"id", "page_id", "children"}]}
+    """
+    replies = []
+    level = []
+    revisions = revisions if revisions is not None else ArticleRevisions(session)
+
+    for action in inserts:
+        reply = {"action": "insert", "children": []}
+        replies.append(reply)
+
+        children = action.get("children", [])
+        sequences = [child.get("sequence") for child in children]
+        if any(sequence is None for sequence in sequences):
+            before, after = block_neighbour_ranks(session, action["page_id"], action["parent"])
+        else:
+            before, after = block_neighbour_ranks(
+                session, action["page_id"], action["parent"], min(sequences), max(sequences)
+            )
+
+        ranks = _ranks_between(before, after, len(children))
+        if crowded is not None and any(needs_rebalance(rank) for rank in ranks):
+            crowded.add((action["parent"], action["page_id"]))
+
+        for child, rank in zip(children, ranks):
+            level.append((child, rank, action["parent"], action["page_id"], reply["children"]))
+
+    while level:
+        rows = [
+            {
+                "page_id": page_id,
+                "parent": parent,
+                "kind": child["kind"],
+                "data": child.get("data", {}),
+                "extension": child.get("extension", {}),
+                "sequence": child.get("sequence"),
+                "rank": rank,
+                "revision": revisions[page_id],
+            }
+            for child, rank, parent, page_id, _ in level
+        ]
+
+        next_level = []
+        for (child, _, _, page_id, siblings), block_id in zip(level, _insert_rows(session, rows)):
+            node = {"id": block_id, "children": [], "page_id": page_id}
+            siblings.append(node)
+
+            grandchildren = child.get("children", [])
+            for grandchild, rank in zip(grandchildren, spread_keys(len(grandchildren))):
+                next_level.append((grandchild, rank, block_id, page_id, node["children"]))
+
+        level = next_level
+
+    return replies
+
+
+def delete_block_subtrees(session, block_ids, revisions=None):
+    """Delete blocks and all their descendants with a recursive CTE, leaving tombstones
+
+    Returns {block_id: {"action": "delete", "id", "children"}} for the blocks that existed
+    """
+    if not block_ids:
+        return {}
+
+    tree = (
+        select(ArticleBlock._id, ArticleBlock.parent, ArticleBlock.page_id)
+        .where(ArticleBlock._id.in_(block_ids))
+        .cte("subtree", recursive=True)
+    )
+    tree = tree.union(
+        select(ArticleBlock._id, ArticleBlock.parent, ArticleBlock.page_id)
+        .join(tree, ArticleBlock.parent == tree.c._id)
+    )
+
+    rows = session.execute(select(tree.c._id, tree.c.parent, tree.c.page_id)).all()
+    if not rows:
+        return {}
+
+    session.execute(
+        delete(ArticleBlock).where(ArticleBlock._id.in_(select(tree.c._id))),
+        execution_options={"synchronize_session": False},
+    )
+
+    revisions = revisions if revisions is not None else ArticleRevisions(session)
+    record_tombstones(session, [(block_id, page_id) for block_id, _, page_id in rows], revisions)
+
+    nodes = {block_id: {"action": "delete", "id": block_id, "children": []} for block_id, _, _ in rows}
+    for block_id, parent, _ in rows:
+        if parent in nodes and parent != block_id and block_id not in block_ids:
+            nodes[parent]["children"].append(nodes[block_id])
+
+    return {block_id: nodes[block_id] for block_id in block_ids if block_id in nodes}
+
+
+def reorder_block(session, block, action, blocks, crowded=None):
+    """New rank of a moved block, only this row changes
+
+    The neighbours are given by id (`after`/`before`) or located from the float `sequence`.
+    """
+    if "after" in action or "before" in action:
+        before = blocks.get(action.get("after"))
+        after = blocks.get(action.get("before"))
+        before, after = (before.rank if before else None), (after.rank if after else None)
+    else:
+        sequence = action["sequence"]
+        before, after = block_neighbour_ranks(
+            session, block.page_id, block.parent, sequence, sequence, exclude=block._id
+        )
+
+    if "sequence" in action:
+        block.sequence = action["sequence"]
+
+    block.rank = _ranks_between(before, after)[0]
+    if crowded is not None and needs_rebalance(block.rank):
+        crowded.add((block.parent, block.page_id))
+
+
+def update_block_actions(session, edits, crowded=None, revisions=None):
+    """Apply update and reorder actions on the blocks loaded with a single IN query
+
+    Returns one reply per applied action, actions on unknown blocks are skipped.
+    """
+    revisions = revisions if revisions is not None else ArticleRevisions(session)
+
+    edit_ids = set()
+    for action in edits:
+        edit_ids.add(action.get("id", action.get("block_id")))
+        edit_ids.update(action[key] for key in ("after", "before") if action.get(key) is not None)
+
+    blocks = {
+        block._id: block
+        for block in session.query(ArticleBlock).filter(ArticleBlock._id.in_(edit_ids))
+    }
+
+    replies = []
+    for action in edits:
+        block = blocks.get(action.get("id", action.get("block_id")))
+        if block is None:
+            continue
+
+        page_id = block.page_id
+        if action["op"] == "update":
+            block_def = dict(action["block_def"])
+            block_def.pop("children", None)
+            for item, value in block_def.items():
+                setattr(block, item, value)
+        else:
+            reorder_block(session, block, action, blocks, crowded)
+
+        if block.page_id != page_id:
+            # Moved to another article, it is gone from the old one
+            record_tombstones(session, [(block._id, page_id)], revisions)
+        block.revision = revisions[block.page_id]
+
+        replies.append({"action": action["op"], "id": block._id})
+
+    session.flush()
+    return replies
+
+
+# Actions applied together when they follow each other in a batch
+BLOCK_ACTION_GROUPS = {"insert": "insert", "update": "edit", "reorder": "edit", "delete": "delete"}
+
+
+def apply_block_actions(session, actions, crowded=None):
+    """Apply a batch of block edits in the order they were sent, the caller commits
+
+    Consecutive actions of the same kind run together: inserts with one statement
+    per nesting level, updates and reorders on the blocks loaded with one query,
+    deletes with one recursive CTE. An action sees the effect of the actions sent
+    before it. Unknown actions and deletes without `block_id` are skipped.
+    Replies are returned in the order of the actions.
+    """
+    replies = []
+    revisions = ArticleRevisions(session)
+
+    def group(action):
+        return BLOCK_ACTION_GROUPS.get(action.get("op"))
+
+    for kind, run in itertools.groupby(actions, key=group):
+        run = list(run)
+        if kind == "insert":
+            replies.extend(insert_block_actions(session, run, crowded, revisions))
+        elif kind == "edit":
+            replies.extend(update_block_actions(session, run, crowded, revisions))
+        elif kind == "delete":
+            block_ids = [action["block_id"] for action in run if "block_id" in action]
+            deleted = delete_block_subtrees(session, list(dict.fromkeys(block_ids)), revisions)
+            replies.extend(deleted[block_id] for block_id in block_ids if block_id in deleted)
+
+    return replies
+
+
 def article_routes(app, db):
     """
     Article routes for managing blog posts/articles with nested blocks.
     Supports batch updates to minimize frontend requests.
     """
+    # Sibling lists whose ranks grew long are respaced in the background
+    rebalancer = register_executor(app, ThreadPoolExecutor(max_workers=1, thread_name_prefix="rebalance"))
+
+    def rebalance(model, crowded):
+        def run():
+            with app.app_context():
+                try:
+                    for parent, page_id in crowded:
+                        rebalance_siblings(db.session, model, parent, page_id)
+                    db.session.commit()
+                except Exception:
+                    print_exc()
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+        if crowded:
+            rebalancer.submit(run)
 
     # Get all articles (metadata only) — admin use, returns all including drafts
     @app.route("/articles", methods=["GET"])
@@ -45,6 +366,7 @@ def article_routes(app, db):
     # Public article list — only published root articles, used by the static site
     @app.route("/articles/public", methods=["GET"])
     @expose()
+    @depends_on(Article)
     def get_public_articles() -> Dict[str, Any]:
         try:
             articles = (
@@ -57,14 +379,27 @@ def article_routes(app, db):
             print_exc()
             return jsonify({"error": str(e)}), 500
 
+    paginated_routes(
+        app, "public_articles", "/articles/public",
+        lambda: (
+            db.session.query(Article)
+            .filter(Article.parent.is_(None), Article.public == True)
+            .order_by(Article._id)
+        ),
+        Article.to_summary_json,
+        tables=(Article,),
+    )
+
     @app.route("/articles/last-accessed", methods=["GET"])
     @expose()
+    @depends_on(Article)
     def latest_accessed_articles() -> Dict[str, Any]:
         return get_articles()
 
     # Get a single article with all its blocks in tree structure
     @app.route("/articles/<int:article_id>", methods=["GET"])
     @expose(article_id=select(Article._id).where(Article.public == True))
+    @depends_on(Article, ArticleBlock)
     def get_article(article_id: int) -> Dict[str, Any]:
         try:
             article = db.session.query(Article).get(article_id)
@@ -85,6 +420,49 @@ def article_routes(app, db):
             print_exc()
             return jsonify({"error": str(e)}), 500
 
+    # Blocks written since a revision, for editors keeping a local copy of the article
+    @app.route("/articles/<int:article_id>/changes", methods=["GET"])
+    def get_article_changes(article_id: int) -> Dict[str, Any]:
+        try:
+            article = db.session.query(Article).get(article_id)
+            if not article:
+                return jsonify({"error": "Article not found"}), 404
+
+            since = request.args.get("since", type=int)
+            reset = since is None or since > article.revision
+
+            query = db.session.query(ArticleBlock).filter(ArticleBlock.page_id == article_id)
+            if not reset:
+                query = query.filter(ArticleBlock.revision > since)
+            blocks = query.order_by(ArticleBlock.rank.asc(), ArticleBlock._id.asc()).all()
+
+            deleted = []
+            if not reset:
+                written = {block._id for block in blocks}
+                deleted = [
+                    block_id
+                    for block_id, in db.session.query(ArticleBlockTombstone.block_id)
+                    .filter(
+                        ArticleBlockTombstone.page_id == article_id,
+                        ArticleBlockTombstone.revision > since,
+                    )
+                    .distinct()
+                    # SQLite can reuse the id of a deleted block
+                    if block_id not in written
+                ]
+
+            return jsonify({
+                "id": article_id,
+                "revision": article.revision,
+                # Unknown revision (no since, or the database was restored): send everything
+                "reset": reset,
+                "blocks": [block.to_json() for block in blocks],
+                "deleted": deleted,
+            })
+        except Exception as e:
+            print_exc()
+            return jsonify({"error": str(e)}), 500
+
     @app.route("/article/search/<string:name>", methods=["GET"])
     def search_article(name: str):
         try:
@@ -104,25 +482,24 @@ def article_routes(app, db):
         if not article or not parent:
             return jsonify({"error": "Article or parent not found"}), 404
 
-        root_id = parent.root_id if parent.root_id is not None else parent._id
+        try:
+            for node in (article, parent):
+                if not node.path:
+                    Article.materialize_path(db.session, node)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 409
 
-        # Update the parent ID
-        article.parent = parent._id
-        article.root_id = root_id
+        if parent.path.startswith(article.path):
+            return jsonify({"error": "Cannot move an article inside itself"}), 400
 
-        # Update the ROOT ID of all the children
-        #   This is expensive because we need to do recursive calls
-        queue = list(
-            db.session.query(Article).filter(Article.parent == article._id).all()
-        )
-        while len(queue) > 0:
-            child = queue.pop()
-            child.root_id = root_id
-            queue.extend(
-                db.session.query(Article).filter(Article.parent == child._id).all()
-            )
+        # Parent, root, rank and path of the whole subtree are rewritten in a single UPDATE
+        rank = key_between(Article.last_child_rank(db.session, parent._id), None)
+        Article.move_subtree(db.session, article, parent, rank)
 
         db.session.commit()
+        if needs_rebalance(rank):
+            rebalance(Article, {(parent._id, None)})
         return jsonify(article.to_json())
 
     # Create a new article
@@ -150,10 +527,15 @@ def article_routes(app, db):
                 extension=data.get("extension", {}),
                 parent=parent_id,
                 root_id=root_id,
+                rank=key_between(Article.last_child_rank(db.session, parent_id), None),
             )
 
             db.session.add(article)
+            db.session.flush()
+            article.assign_path(db.session.get(Article, parent_id) if parent_id else None)
             db.session.commit()
+            if needs_rebalance(article.rank):
+                rebalance(Article, {(parent_id, None)})
 
             return jsonify(article.to_json()), 201
         except Exception as e:
@@ -181,10 +563,15 @@ def article_routes(app, db):
                 extension=data.get("extension", {}),
                 parent=parent_id,
                 root_id=root_id,
+                rank=key_between(Article.last_child_rank(db.session, parent_id), None),
             )
 
             db.session.add(article)
+            db.session.flush()
+            article.assign_path(parent_article)
             db.session.commit()
+            if needs_rebalance(article.rank):
+                rebalance(Article, {(parent_id, None)})
 
             return jsonify(article.to_json()), 201
         except Exception as e:
@@ -195,6 +582,7 @@ def article_routes(app, db):
     # Get all child articles for a given parent
     @app.route("/articles/<int:parent_id>/children", methods=["GET"])
     @expose(parent_id=select(Article._id).where(Article.public == True))
+    @depends_on(Article)
     def get_child_articles(parent_id: int) -> Dict[str, Any]:
         try:
             parent_article = db.session.query(Article).get(parent_id)
@@ -202,7 +590,10 @@ def article_routes(app, db):
                 return jsonify({"error": "Parent article not found"}), 404
 
             child_articles = (
-                db.session.query(Article).filter(Article.parent == parent_id).all()
+                db.session.query(Article)
+                .filter(Article.parent == parent_id)
+                .order_by(Article.rank.asc(), Article._id.asc())
+                .all()
             )
             return jsonify([child.to_json() for child in child_articles])
         except Exception as e:
@@ -252,6 +643,9 @@ def article_routes(app, db):
             db.session.query(ArticleBlock).filter(
                 ArticleBlock.page_id == article_id
             ).delete()
+            db.session.query(ArticleBlockTombstone).filter(
+                ArticleBlockTombstone.page_id == article_id
+            ).delete()
 
             # Delete the article
             db.session.delete(article)
@@ -263,136 +657,76 @@ def article_routes(app, db):
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
 
-    @app.route("/blocks/insert", methods=["PUT"])
-    def insert_blocks(insert, parent=None, page_id=None, depth=0):
-        if parent is None:
-            parent = insert["parent"]
-
-        if page_id is None:
-            page_id = insert["page_id"]
-
-        # Insert Into a BLOCK
-        # Insert INTo an ARTICLE
-        blocks = []
-        for child in insert.get("children", []):
-            block = ArticleBlock(
-                page_id=page_id,
-                parent=parent,
-                kind=child["kind"],
-                data=child.get("data", {}),
-                extension=child.get("extension", {}),
-                sequence=child.get("sequence"),
-            )
-
-            db.session.add(block)
-            db.session.flush()  # Flush to get the ID
-
-            ids: list[dict] = []
-            if "children" in child:
-                result = insert_blocks(
-                    child, parent=block._id, page_id=page_id, depth=depth + 1
-                )
-                ids.extend(result["children"])
-
-            blocks.append({"id": block._id, "children": ids, "page_id": page_id})
-
-        if depth == 0:
-            db.session.commit()
-
-        return {"action": "insert", "children": blocks}
-
-    @app.route("/blocks/update", methods=["PUT"])
-    def update_blocks(update, depth=0):
-        block = db.session.query(ArticleBlock).get(update["id"])
-        children = update["block_def"].pop("children", [])
-
-        for item, value in update["block_def"].items():
-            setattr(block, item, value)
-
-        # for child in children:
-        #     update_blocks(child, depth=depth + 1)
-
-        if depth == 0:
-            db.session.commit()
-
-        return {"action": "update", "id": block._id}
-
-    @app.route("/blocks/reorder", methods=["PUT"])
-    def reorder_blocks(reorder, depth=0):
-        block = db.session.query(ArticleBlock).get(reorder["id"])
-
-        block.sequence = reorder["sequence"]
-
-        if depth == 0:
-            db.session.commit()
-
-        return {"action": "reorder", "id": block._id}
-
-    @app.route("/blocks/delete", methods=["PUT"])
-    def delete_blocks(delete, depth=0):
-        if hasattr(delete, "_id"):
-            block_id = delete._id
-        else:
-            block_id = delete["block_id"]
-
-        child_blocks = (
-            db.session.query(ArticleBlock).filter(ArticleBlock.parent == block_id).all()
-        )
-
-        children_id = []
-        for child in child_blocks:
-            children_id.append(delete_blocks(child))
-
-        block = db.session.query(ArticleBlock).get(block_id)
-        db.session.delete(block)
-
-        if depth == 0:
-            db.session.commit()
-
-        return {"action": "delete", "id": block._id, "children": children_id}
-
     @app.route("/blocks/batch", methods=["PUT"])
     def update_blocks_batch() -> Dict[str, Any]:
         # This returns message with the id of the modifed or created blocks
         # we can reconcile the reply with the front end to update the id
         try:
             actions = request.get_json()
-            results = []
-
-            for action in actions:
-                match action["op"]:
-                    case "insert":
-                        results.append(insert_blocks(action, depth=1))
-                    case "update":
-                        results.append(update_blocks(action, depth=1))
-                    case "reorder":
-                        results.append(reorder_blocks(action, depth=1))
-                    case "delete":
-                        try:
-                            results.append(delete_blocks(action, depth=1))
-                        except KeyError:
-                            pass
+            crowded = set()
+            results = apply_block_actions(db.session, actions, crowded)
 
+            # All or nothing, the frontend keeps the pending changes on error
             db.session.commit()
-            return results
-        except:
+            rebalance(ArticleBlock, crowded)
+            return jsonify(results)
+        except Exception as e:
             traceback.print_exc()
-            return {}
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
 
-    # Export article to JSON (for downloading)
+    # Export an article to JSON (for downloading), Markdown or HTML, streamed block by block
     @app.route("/articles/<int:article_id>/export", methods=["GET"])
     def export_article(article_id: int) -> Dict[str, Any]:
         try:
+            fmt = request.args.get("format", "json")
+            if fmt not in article_export.FORMATS:
+                return jsonify({"error": f"Unknown format: {fmt}"}), 400
+
             article = db.session.query(Article).get(article_id)
             if not article:
                 return jsonify({"error": "Article not found"}), 404
 
-            # Get article with full block tree
-            article_json = article.to_json(session=db.session, children=True)
-            articles = [article_json]
-            Article.get_block_forest(db.session, articles)
+            chunks = article_export.iter_article(db.session, article.to_json(), fmt)
+            response = Response(stream_with_context(chunks), mimetype=article_export.FORMATS[fmt])
+            if fmt != "json":
+                filename = f"{article_export.slugify(article.title)}.{fmt}"
+                response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+            return response
+        except Exception as e:
+            print_exc()
+            return jsonify({"error": str(e)}), 500
 
-            return jsonify(article_json)
+    def export_archive(archive, name, root=None):
+        fmt = request.args.get("format", "md")
+        if fmt not in article_export.FORMATS or archive not in article_export.ARCHIVES:
+            return jsonify({"error": f"Unknown format: {fmt}.{archive}"}), 400
+
+        articles = article_export.iter_articles(db.session, root, request.args.get("namespace"))
+        chunks = article_export.ARCHIVE_WRITERS[archive](db.session, articles, fmt)
+
+        response = Response(stream_with_context(chunks), mimetype=article_export.ARCHIVES[archive])
+        response.headers["Content-Disposition"] = f"attachment; filename={name}.{archive}"
+        return response
+
+    # Export an article and its sub pages as a tar or zip of documents
+    @app.route("/articles/<int:article_id>/export.<string:archive>", methods=["GET"])
+    def export_article_archive(article_id: int, archive: str):
+        try:
+            article = db.session.query(Article).get(article_id)
+            if not article:
+                return jsonify({"error": "Article not found"}), 404
+
+            return export_archive(archive, article_export.slugify(article.title), article)
+        except Exception as e:
+            print_exc()
+            return jsonify({"error": str(e)}), 500
+
+    # Export the whole wiki, or one namespace with ?namespace=
+    @app.route("/articles/export.<string:archive>", methods=["GET"])
+    def export_articles_archive(archive: str):
+        try:
+            return export_archive(archive, article_export.slugify(request.args.get("namespace") or "articles"))
         except Exception as e:
             print_exc()
             return jsonify({"error": str(e)}), 500
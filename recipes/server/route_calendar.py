@@ -1,13 +1,67 @@
 from typing import Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import traceback
 
 from flask import jsonify, request
 
 from .models import Event, Task
+from .planning import PlanCache, backlog
+from .route_messaging import send_todo_checklist
+from ..tools.recurrence import naive_utc
+
+
+def plan_range():
+    """(first day, number of days, minutes from UTC) of a planning request"""
+    utc_offset = max(-14 * 60, min(request.args.get('utc_offset', default=0, type=int), 14 * 60))
+    days = max(1, min(request.args.get('days', default=7, type=int), 366))
+
+    if request.args.get('start'):
+        first_day = date.fromisoformat(request.args['start'][:10])
+    else:
+        first_day = (datetime.utcnow() + timedelta(minutes=utc_offset)).date()
+
+    return first_day, days, utc_offset
 
 
 def calendar_routes(app, db):
+    plans = PlanCache()
+
+    # Day plans of ?start=YYYY-MM-DD&days=7: the routine, the events and the tasks due,
+    # plus the backlog of the overdue and undated tasks
+    @app.route('/planning', methods=['GET'])
+    @app.route('/planning/<owner>/<name>', methods=['GET'])
+    def get_plans(owner=None, name=None):
+        try:
+            first_day, days, utc_offset = plan_range()
+            start = datetime.combine(first_day, datetime.min.time()) - timedelta(minutes=utc_offset)
+
+            return jsonify({
+                "days": plans.plans(db.session, owner, name, first_day, days, utc_offset),
+                "backlog": backlog(db.session, start),
+            })
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/planning/stats', methods=['GET'])
+    def get_plan_stats():
+        return jsonify(plans.stats())
+
+    # Send the plan of a day (?start=, today by default) as a Telegram checklist
+    @app.route('/planning/<owner>/<name>/telegram', methods=['POST'])
+    def send_plan_checklist(owner, name):
+        try:
+            first_day, _, utc_offset = plan_range()
+            (plan,) = plans.plans(db.session, owner, name, first_day, 1, utc_offset)
+
+            send_todo_checklist(f"{name} {plan['date']}", plan["checklist"])
+            return jsonify(plan)
+        except Exception as e:
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
 
     @app.route('/routine/<owner>/<name>')
     def get_routine_events(owner: str, name: str):
@@ -42,16 +96,14 @@ def calendar_routes(app, db):
                 sunday = monday + timedelta(days=6)
                 end_date = sunday.replace(hour=23, minute=59, second=59, microsecond=999999).isoformat()
 
-            if start_date and end_date:
-                start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                query = query.filter(
-                    Event.datetime_start >= start_dt,
-                    Event.datetime_end <= end_dt
-                )
+            if not (start_date and end_date):
+                return jsonify([event.to_json() for event in query.all()])
 
-            events = query.all()
-            return jsonify([event.to_json() for event in events])
+            start_dt = naive_utc(datetime.fromisoformat(start_date.replace('Z', '+00:00')))
+            end_dt = naive_utc(datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+
+            result = Event.in_window(db.session, start_dt, end_dt)
+            return jsonify(result)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
@@ -78,6 +130,11 @@ def calendar_routes(app, db):
                 name=data.get('name')
             )
 
+            try:
+                event.set_recurrence(data.get('rrule'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
             db.session.add(event)
             db.session.commit()
 
@@ -127,6 +184,15 @@ def calendar_routes(app, db):
             if 'name' in data:
                 event.name = data.get('name')
 
+            try:
+                if 'rrule' in data:
+                    event.set_recurrence(data.get('rrule'))
+                else:
+                    event.update_recurrence_end()
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({"error": str(e)}), 400
+
             db.session.commit()
 
             return jsonify(event.to_json())
@@ -9,53 +9,49 @@ from datetime import datetime, timedelta
 import traceback
 
 from PIL import Image
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_file, send_from_directory
 from sqlalchemy.orm import sessionmaker, scoped_session
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
-from ..tools.images import centercrop_resize_image
+from ..tools.blobstore import BlobStore
+from ..tools.imagecache import ImageCache, MAX_DIMENSION, MIMETYPES
+from ..tools.phash import PerceptualIndex, DUPLICATE_THRESHOLD
+from ..tools.images import derivative_manifest_name
+from .executors import register_executor
+from .image_jobs import ImageJobs
 from .models import Base, Recipe, Ingredient, Category, UnitConversion, RecipeIngredient, Event, Task
 
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 
-def images_routes(app):
+def images_routes(app, db):
+    store = BlobStore(app.config['BLOB_FOLDER'])
+    hashes = PerceptualIndex(app.config['IMAGE_HASH_INDEX'])
+    jobs = ImageJobs(app, db, workers=app.config.get('IMAGE_WORKERS', 2), store=store, hashes=hashes)
+    register_executor(app, jobs.executor)
+    cache = ImageCache(app.config['IMAGE_CACHE_FOLDER'], max_bytes=app.config['IMAGE_CACHE_MAX_BYTES'])
+    max_age = app.config['IMAGE_CACHE_MAX_AGE']
+
     def allowed_file(filename):
         """Check if the file extension is allowed"""
         return '.' in filename and \
                 filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    def save_original_image(file, filename):
-        # Save the original image without modification
+    def originals_folder():
+        # The network share is not always mounted, keep the original locally then
         if os.path.exists(app.config["ORIGINALS_FOLDER"]):
-            original_path = os.path.join(app.config["ORIGINALS_FOLDER"], filename)
-            folder_path = os.path.dirname(original_path)
-            os.makedirs(folder_path, exist_ok=True)
-
-            if os.path.exists(original_path):
-                os.rename(original_path, original_path + '.old')
-
-            file.save(original_path)
-        # ---
-
-    def save_production_image(file, namespace, extension):
-        try:
-            image = Image.open(file.stream)
-
-            path = centercrop_resize_image(
-                app.config['UPLOAD_FOLDER'],
-                image,
-                namespace,
-                extension
-            )
+            return app.config["ORIGINALS_FOLDER"]
+        return app.config["LOCAL_ORIGINALS_FOLDER"]
 
-            return path
-
-        except Exception as err:
-            print(err)
+    def store_file(file, path):
+        """Save an uploaded file in the blob store and link it at `path`"""
+        digest, _ = store.add_stream(file.stream)
+        store.link(digest, path)
+        return digest
 
     @app.route('/upload', methods=['POST'])
     def upload_file() -> Dict[str, Any]:
@@ -87,24 +83,69 @@ def images_routes(app):
                 # Use namespace directly as filename with extension
                 filename = f"{namespace}.{file_extension}"
 
-                save_original_image(file, filename)
-
-                filename = save_production_image(file, namespace, file_extension)
-
-                # Return the file URL
-                file_url = f"/uploads/{filename}"
-
+                # Streamed to the local blob store in chunks; copying the original to the
+                # (network) originals folder and decoding it happen in the background.
+                # A re-upload only moves the reference, the previous blob lives until garbage collection
+                digest, _ = store.add_stream(file.stream)
+
+                job = jobs.submit(
+                    store.blob_path(digest),
+                    app.config['UPLOAD_FOLDER'],
+                    namespace,
+                    file_extension,
+                    widths=app.config['IMAGE_DERIVATIVE_WIDTHS'],
+                    formats=app.config['IMAGE_DERIVATIVE_FORMATS'],
+                    digest=digest,
+                    original=os.path.join(originals_folder(), filename),
+                )
+
+                # The image is served once the job wrote it, its url is in the job status
                 return jsonify({
-                    "url": file_url,
-                    "filename": filename,
-                    "folder": ""
-                }), 201
+                    "job": job["id"],
+                    "status": f"/upload/jobs/{job['id']}",
+                    "derivatives": f"/uploads/{derivative_manifest_name(namespace)}",
+                }), 202
             
             return jsonify({"error": "missing namespace"}), 500
         except Exception as e:
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
 
+    @app.route('/upload/jobs/<string:job_id>', methods=['GET'])
+    def upload_job(job_id):
+        """Status of the background processing of an upload"""
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+
+    @app.route('/images/store', methods=['GET'])
+    def image_store_stats():
+        """Number of references and unique blobs of the image store"""
+        return jsonify(store.stats())
+
+    @app.route('/images/duplicates', methods=['GET'])
+    def image_duplicates():
+        """Groups of near duplicate uploads, within `threshold` bits of perceptual hash"""
+        try:
+            threshold = request.args.get('threshold', DUPLICATE_THRESHOLD, type=int)
+            scan = hashes.scan(app.config['UPLOAD_FOLDER'])
+            groups = hashes.duplicates(threshold)
+            return jsonify({"threshold": threshold, "scan": scan, "groups": groups})
+        except Exception as e:
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/images/gc', methods=['POST'])
+    def image_store_gc():
+        """Remove the image blobs that are not referenced anymore"""
+        try:
+            dry_run = request.args.get('dry_run', '0') in ('1', 'true')
+            return jsonify(store.collect_garbage(dry_run=dry_run))
+        except Exception as e:
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+
     @app.route('/download-image', methods=['POST'])
     def download_image() -> Dict[str, Any]:
         """Download/save a dropped image into uploads under an article path"""
@@ -129,7 +170,6 @@ def images_routes(app):
 
             filename = secure_filename(file.filename)
             dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], *safe_parts)
-            os.makedirs(dest_dir, exist_ok=True)
 
             dest_path = os.path.join(dest_dir, filename)
             if os.path.exists(dest_path):
@@ -137,7 +177,7 @@ def images_routes(app):
                 filename = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
                 dest_path = os.path.join(dest_dir, filename)
 
-            file.save(dest_path)
+            store_file(file, dest_path)
 
             relative = '/'.join(safe_parts + [filename])
             file_url = f"/api/uploads/{relative}"
@@ -147,14 +187,46 @@ def images_routes(app):
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
 
+    def dimension(name):
+        value = request.args.get(name, type=int)
+        if value is not None and not 0 < value <= MAX_DIMENSION:
+            raise ValueError(f"{name} must be between 1 and {MAX_DIMENSION}")
+        return value
+
+    def resized_file(filepath):
+        """Resized variant of an upload, generated on first request then served from the cache"""
+        try:
+            width, height = dimension('w'), dimension('h')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        fmt = request.args.get('fmt', filepath.rsplit('.', 1)[-1]).lower()
+        if fmt not in MIMETYPES:
+            return jsonify({"error": f"Unsupported format, use one of: {', '.join(MIMETYPES)}"}), 400
+
+        source = safe_join(app.config['UPLOAD_FOLDER'], filepath)
+        if source is None or not os.path.isfile(source):
+            return jsonify({"error": "Image not found"}), 404
+
+        try:
+            path, etag = cache.get(source, width, height, fmt)
+        except (OSError, Image.DecompressionBombError) as e:
+            return jsonify({"error": f"Cannot resize image: {e}"}), 415
+
+        # send_file answers If-None-Match with 304 and honours Range requests
+        return send_file(path, mimetype=MIMETYPES[fmt], etag=etag, conditional=True, max_age=max_age)
+
     @app.route('/uploads/<path:filepath>')
     def uploaded_file(filepath):
         """Serve uploaded files from recipe-specific folders or direct files"""
+        if any(name in request.args for name in ('w', 'h', 'fmt')):
+            return resized_file(filepath)
+
         # Split the filepath to get folder and filename
         if '/' in filepath:
             folder, filename = filepath.split('/', 1)
             folder_path = os.path.join(app.config['UPLOAD_FOLDER'], folder)
-            return send_from_directory(folder_path, filename)
+            return send_from_directory(folder_path, filename, max_age=max_age)
         else:
             # Files saved directly in upload folder (when namespace is used)
-            return send_from_directory(app.config['UPLOAD_FOLDER'], filepath)
+            return send_from_directory(app.config['UPLOAD_FOLDER'], filepath, max_age=max_age)
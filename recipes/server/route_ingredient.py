@@ -18,10 +18,18 @@ from werkzeug.utils import secure_filename
 from sqlalchemy import select
 from ..tools.images import centercrop_resize_image
 from .models import Base, Recipe, Ingredient, Category, UnitConversion, RecipeIngredient, Event, Task, IngredientComposition
-from .decorators import expose
+from .decorators import expose, depends_on
+from .pagination import paginated_routes
 
 
 def ingredient_routes(app, db):
+    paginated_routes(
+        app, "ingredients", "/ingredients",
+        lambda: db.session.query(Ingredient).order_by(Ingredient._id),
+        Ingredient.to_summary_json,
+        tables=(Ingredient,),
+    )
+
     @app.route('/ingredients/<int:start>/<int:end>', methods=['GET'])
     def get_ingredients_range(start: int, end: int) -> Dict[str, Any]:
         ingredients = db.session.query(Ingredient).offset(start).limit(end - start).all()
@@ -29,6 +37,7 @@ def ingredient_routes(app, db):
 
     @app.route('/ingredients', methods=['GET'])
     @expose()
+    @depends_on(Ingredient)
     def get_ingredients() -> Dict[str, Any]:
         ingredients = db.session.query(Ingredient).all()
         return jsonify([ingredient.to_json() for ingredient in ingredients])
@@ -47,6 +56,7 @@ def ingredient_routes(app, db):
 
     @app.route('/ingredients/<int:ingredient_id>', methods=['GET'])
     @expose(ingredient_id=select(Ingredient._id))
+    @depends_on(Ingredient)
     def get_ingredient(ingredient_id: int) -> Dict[str, Any]:
         ingredient = db.session.get(Ingredient, ingredient_id)
         if not ingredient:
@@ -58,6 +68,7 @@ def ingredient_routes(app, db):
         name.lower().replace(' ', '-')
         for (name,) in db.session.query(Ingredient.name).all()
     ])
+    @depends_on(Ingredient)
     def get_ingredient_by_name(ingredient_name: str) -> Dict[str, Any]:
         # Replace hyphens with spaces for URL-friendly names
         formatted_name = ingredient_name.replace('-', ' ')
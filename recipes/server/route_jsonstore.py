@@ -1,81 +1,96 @@
 import os
 import json
-import re
-from flask import jsonify, request, send_file
+from flask import Response, jsonify, request, send_file
 
 from .decorators import expose
+from ..tools.jsonstore import JsonStore, parse_condition, safe_name
 
 
-def safe_name(name: str) -> str:
-    """Sanitize a name to be safe as a filename component."""
-    return re.sub(r'[^a-zA-Z0-9_\-]', '_', name)
-
-
-def _all_collections(app):
+def _all_collections(store):
     """Return list of all collection names in the store."""
-    root = os.path.join(app.config['UPLOAD_FOLDER'], 'data')
-    if not os.path.isdir(root):
-        return []
-    return [d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d))]
+    return store.names()
 
 
-def _all_collection_keys(app):
+def _all_collection_keys(store):
     """Return (collection, key) pairs for every stored item."""
-    root = os.path.join(app.config['UPLOAD_FOLDER'], 'data')
-    if not os.path.isdir(root):
-        return []
     pairs = []
-    for col in os.listdir(root):
-        col_dir = os.path.join(root, col)
-        if not os.path.isdir(col_dir):
-            continue
-        for f in os.listdir(col_dir):
-            if f.endswith('.json') and not f.startswith('_'):
-                pairs.append({'collection': col, 'key': os.path.splitext(f)[0]})
+    for col in store.names():
+        for key in store.collection(col).keys():
+            pairs.append({'collection': col, 'key': key})
     return pairs
 
 
+def iter_full_collection(collection, keys=None):
+    """{key: document} of a whole collection, or of `keys`, documents are sent as stored"""
+    yield '{'
+    for i, (key, text) in enumerate(collection.iter_documents(keys)):
+        yield (',' if i else '') + json.dumps(key) + ':' + text
+    yield '}'
+
+
 def jsonstore_routes(app):
-    def store_dir():
-        return os.path.join(app.config['UPLOAD_FOLDER'], 'data')
+    store = JsonStore(os.path.join(app.config['UPLOAD_FOLDER'], 'data'))
 
+    # Sorted keys, or every document with ?full=1. Queries on the indexed fields:
+    # ?where=date>=2024-01-01&where=tags:soup (= is :), ?sort=-date, ?limit=
     @app.route('/store/<string:collection>', methods=['GET'])
-    @expose(collection=lambda: _all_collections(app))
+    @expose(collection=lambda: _all_collections(store))
     def jsonstore_list(collection: str):
-        folder = os.path.join(store_dir(), safe_name(collection))
-        if not os.path.isdir(folder):
-            return jsonify([])
-        names = sorted(
-            os.path.splitext(f)[0]
-            for f in os.listdir(folder)
-            if f.endswith('.json') and not f.startswith('_')
-        )
-        return jsonify(names)
+        col = store.collection(collection)
+        full = request.args.get('full', '0') in ('1', 'true')
+        where = request.args.getlist('where')
+        sort = request.args.get('sort')
+        limit = request.args.get('limit', type=int)
+
+        keys = None
+        if where or sort:
+            try:
+                conditions = [parse_condition(condition) for condition in where]
+                descending = bool(sort) and sort.startswith('-')
+                keys = col.index.query(conditions, sort and sort.lstrip('-'), descending, limit)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        elif limit is not None:
+            keys = col.keys()[:limit]
+
+        if full:
+            return Response(iter_full_collection(col, keys), mimetype='application/json')
+        return jsonify(col.keys() if keys is None else keys)
+
+    # Indexed fields of a collection: {"fields": ["date", "tags"]}
+    @app.route('/store/<string:collection>/_index', methods=['GET'])
+    def jsonstore_index(collection: str):
+        return jsonify(store.collection(collection).index.describe())
+
+    @app.route('/store/<string:collection>/_index', methods=['PUT'])
+    def jsonstore_declare_index(collection: str):
+        data = request.get_json(silent=True) or {}
+        fields = data.get('fields')
+        if not isinstance(fields, list) or not all(isinstance(f, str) for f in fields):
+            return jsonify({"error": "fields is required, a list of field names"}), 400
+        try:
+            return jsonify(store.collection(collection).index.declare(fields))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
     @app.route('/store/<string:collection>/<string:key>', methods=['GET'])
-    @expose(lambda: _all_collection_keys(app))
+    @expose(lambda: _all_collection_keys(store))
     def jsonstore_get(collection: str, key: str):
-        path = os.path.join(store_dir(), safe_name(collection), safe_name(key) + '.json')
+        path = store.collection(collection).path(safe_name(key))
         if not os.path.isfile(path):
             return jsonify({"error": "Not found"}), 404
         return send_file(path, mimetype='application/json')
 
     @app.route('/store/<string:collection>/<string:key>', methods=['PUT'])
     def jsonstore_put(collection: str, key: str):
-        folder = os.path.join(store_dir(), safe_name(collection))
-        os.makedirs(folder, exist_ok=True)
-        path = os.path.join(folder, safe_name(key) + '.json')
         data = request.get_json(silent=True)
         if data is None:
             return jsonify({"error": "Invalid JSON body"}), 400
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=2)
+        store.collection(collection).write(safe_name(key), data)
         return jsonify({"message": "Saved", "path": f"data/{safe_name(collection)}/{safe_name(key)}.json"})
 
     @app.route('/store/<string:collection>/<string:key>', methods=['DELETE'])
     def jsonstore_delete(collection: str, key: str):
-        path = os.path.join(store_dir(), safe_name(collection), safe_name(key) + '.json')
-        if os.path.isfile(path):
-            os.remove(path)
+        if store.collection(collection).delete(safe_name(key)):
             return jsonify({"message": "Deleted"})
         return jsonify({"error": "Not found"}), 404
@@ -1,10 +1,225 @@
+import re
+import threading
+import time
+from collections import Counter
+from traceback import print_exc
 from typing import List, Dict, Any
 from flask import jsonify, request
+from sqlalchemy import func, select, type_coerce, JSON
 from sqlalchemy.dialects.sqlite import insert
-from .models import KeyValueStore
+from .changes import data_version
+from .models import KeyValueStore, KeyValueTopic
+
+
+MAX_BATCH = 1000
+SCAN_LIMIT = 100
+
+# SQLite binds at most 32766 parameters per statement, 5 per row
+INSERT_CHUNK = 500
+
+# Long polls wait at most this long. Each holds a thread of the worker, past
+# MAX_WATCHERS per worker process they are answered 503 with a Retry-After.
+# Writes made by other processes are noticed within WATCH_RECHECK seconds
+WATCH_TIMEOUT = 25
+MAX_WATCH_TIMEOUT = 60
+MAX_WATCHERS = 4
+WATCH_RECHECK = 0.5
+
+FIELD = re.compile(r'^[A-Za-z0-9_\-]+(\.[A-Za-z0-9_\-]+|\[\d+\])*$')
+
+
+def value_column(fields=None):
+    """The value, or a projection of some of its fields computed by SQLite
+
+    `fields` are paths inside the JSON value (`layout.width`, `items[0]`); the
+    projection is an object keyed by path, missing fields are null.
+    """
+    if not fields:
+        return KeyValueStore.value
+
+    args = []
+    for field in fields:
+        if not FIELD.match(field):
+            raise ValueError(f"Invalid field: {field}")
+        path = field if field.startswith("[") else f".{field}"
+        args.extend([field, func.json_extract(KeyValueStore.value, f"${path}")])
+
+    return type_coerce(func.json_object(*args), JSON)
+
+
+def entry_json(row):
+    """Same fields as `KeyValueStore.to_json`, from a row"""
+    return {
+        'topic': row.topic,
+        'key': row.key,
+        'value': row.value,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None
+    }
+
+
+def entries_query(topic, fields=None):
+    return select(
+        KeyValueStore.topic,
+        KeyValueStore.key,
+        value_column(fields).label("value"),
+        KeyValueStore.created_at,
+        KeyValueStore.updated_at,
+    ).where(KeyValueStore.topic == topic)
+
+
+def next_sequence(session, topic):
+    """Bump the change sequence of a topic, in the transaction of the write
+
+    SQLite serializes the writers, so the sequences are committed in order.
+    """
+    stmt = insert(KeyValueTopic).values(topic=topic, seq=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['topic'],
+        set_=dict(seq=KeyValueTopic.seq + 1)
+    ).returning(KeyValueTopic.seq)
+    return session.execute(stmt).scalar()
+
+
+def current_sequence(session, topic):
+    seq = session.execute(
+        select(KeyValueTopic.seq).where(KeyValueTopic.topic == topic)
+    ).scalar()
+    return seq or 0
+
+
+class TopicWatchers:
+    """Wakes the `_watch` requests of this process when a topic changes
+
+    Writes of this process notify directly. Writes of the other worker processes
+    are found by a single poller thread per process, running while requests wait:
+    every `interval` seconds it calls `read_sequences(topics, state)` for all the
+    watched topics at once, which only queries the database when it changed. The
+    `connection` it leaves in `state` is closed when the poller stops.
+    """
+
+    def __init__(self, read_sequences=None, interval=WATCH_RECHECK):
+        self.condition = threading.Condition()
+        self.sequences = {}
+        # topic -> number of waiting requests
+        self.watched = Counter()
+        self.read_sequences = read_sequences
+        self.interval = interval
+        self.poller = None
+
+    def notify(self, topic, seq):
+        with self.condition:
+            if seq > self.sequences.get(topic, 0):
+                self.sequences[topic] = seq
+            self.condition.notify_all()
+
+    def wait(self, topic, since, timeout):
+        """True if the topic went past `since` before the timeout"""
+        with self.condition:
+            self.watched[topic] += 1
+            self._start_poller()
+            try:
+                return self.condition.wait_for(lambda: self.sequences.get(topic, 0) > since, timeout)
+            finally:
+                self.watched[topic] -= 1
+                if not self.watched[topic]:
+                    del self.watched[topic]
+
+    def _start_poller(self):
+        # Threads do not survive a fork, a worker starts its own
+        if self.read_sequences is None or (self.poller is not None and self.poller.is_alive()):
+            return
+        self.poller = threading.Thread(target=self._poll, name="kv-watch", daemon=True)
+        self.poller.start()
+
+    def _poll(self):
+        state = {}
+        try:
+            while True:
+                with self.condition:
+                    topics = sorted(self.watched)
+                    if not topics:
+                        # The next waiting request starts another one
+                        self.poller = None
+                        return
+
+                try:
+                    for topic, seq in self.read_sequences(topics, state).items():
+                        self.notify(topic, seq)
+                except Exception:
+                    print_exc()
+                time.sleep(self.interval)
+        finally:
+            if state.get("connection") is not None:
+                state["connection"].close()
+
+
+def prefix_end(prefix):
+    """Smallest string greater than all the strings starting with `prefix`
+
+    SQLite compares text byte by byte and UTF-8 keeps the code point order.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def upsert_many(session, topic, items, seq=None):
+    """Insert or update many keys, one multi VALUES statement per chunk"""
+    for i in range(0, len(items), INSERT_CHUNK):
+        rows = [
+            {
+                'topic': topic,
+                'key': key,
+                'value': value,
+                'created_at': func.datetime('now'),
+                'updated_at': func.datetime('now'),
+                'seq': seq,
+            }
+            for key, value in items[i:i + INSERT_CHUNK]
+        ]
+
+        stmt = insert(KeyValueStore).values(rows)
+        # created_at is only written for the new keys
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['topic', 'key'],
+            set_=dict(
+                value=stmt.excluded.value,
+                updated_at=stmt.excluded.updated_at,
+                seq=stmt.excluded.seq
+            )
+        )
+        session.execute(stmt)
+
+
+def read_sequences(engine, topics, state):
+    """Sequences of `topics`, read again only when another connection committed
+
+    `state` keeps the connection of the poller and what it last read.
+    """
+    connection = state.get("connection")
+    if connection is None:
+        connection = state["connection"] = engine.connect()
+
+    # PRAGMA data_version moves on the commits of the other connections
+    version = (data_version(connection), topics)
+    if version == state.get("version"):
+        return {}
+    state["version"] = version
+
+    rows = connection.execute(
+        select(KeyValueTopic.topic, KeyValueTopic.seq).where(KeyValueTopic.topic.in_(topics))
+    ).all()
+    connection.rollback()
+    return dict(rows)
 
 
 def key_value_routes(app, db):
+    with app.app_context():
+        engine = db.engine
+
+    watchers = TopicWatchers(lambda topics, state: read_sequences(engine, topics, state))
+    # Bounds the threads held by long polls in this worker
+    watch_slots = threading.BoundedSemaphore(app.config.get('KV_MAX_WATCHERS', MAX_WATCHERS))
+
     @app.route('/kv', methods=['GET'])
     def list_topics() -> List[str]:
         # select topic from key_value_store UNIQUE
@@ -50,6 +265,7 @@ def key_value_routes(app, db):
                 return jsonify({"error": "Value is required in request body"}), 400
             
             value = data['value']
+            seq = next_sequence(db.session, topic)
             
             # Single upsert query using SQLite's INSERT OR REPLACE with COALESCE to preserve created_at
             stmt = insert(KeyValueStore).values(
@@ -62,7 +278,8 @@ def key_value_routes(app, db):
                     .scalar_subquery(),
                     db.func.datetime('now')
                 ),
-                updated_at=db.func.datetime('now')
+                updated_at=db.func.datetime('now'),
+                seq=seq
             )
             
             # Use ON CONFLICT to handle the upsert (works because we have composite primary key)
@@ -70,15 +287,150 @@ def key_value_routes(app, db):
                 index_elements=['topic', 'key'],
                 set_=dict(
                     value=stmt.excluded.value,
-                    updated_at=stmt.excluded.updated_at
+                    updated_at=stmt.excluded.updated_at,
+                    seq=stmt.excluded.seq
                 )
             )
             
             db.session.execute(stmt)
             db.session.commit()
+            watchers.notify(topic, seq)
             return jsonify({"message": "Value stored successfully"})
             
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
-    
\ No newline at end of file
+
+    # Many keys in one request: {"keys": [...], "fields": ["layout.width"]}
+    @app.route('/kv/<string:topic>/_mget', methods=['POST'])
+    def get_many(topic):
+        try:
+            data = request.get_json() or {}
+            keys = data.get('keys') or []
+            if len(keys) > MAX_BATCH:
+                return jsonify({"error": f"At most {MAX_BATCH} keys per request"}), 400
+
+            rows = db.session.execute(
+                entries_query(topic, data.get('fields')).where(KeyValueStore.key.in_(keys))
+            ).all()
+            found = {row.key: entry_json(row) for row in rows}
+
+            return jsonify({
+                "items": [found[key] for key in keys if key in found],
+                "missing": [key for key in keys if key not in found],
+            })
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # Store many keys at once: {"items": {"key": value, ...}}
+    @app.route('/kv/<string:topic>/_mput', methods=['POST'])
+    def put_many(topic):
+        try:
+            data = request.get_json() or {}
+            items = data.get('items')
+            if not isinstance(items, dict):
+                return jsonify({"error": "items is required, an object of key: value"}), 400
+            if len(items) > MAX_BATCH:
+                return jsonify({"error": f"At most {MAX_BATCH} keys per request"}), 400
+
+            seq = next_sequence(db.session, topic)
+            upsert_many(db.session, topic, list(items.items()), seq)
+            db.session.commit()
+            watchers.notify(topic, seq)
+            return jsonify({"message": f"{len(items)} values stored successfully"})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    # Keys in order, by ?prefix= or ?start=&end= (end excluded), ?limit= per page
+    # and ?cursor= to continue; ?fields= projects the values, ?keys_only=1 omits them
+    @app.route('/kv/<string:topic>/_scan', methods=['GET'])
+    def scan_keys(topic):
+        try:
+            limit = max(1, min(request.args.get('limit', default=SCAN_LIMIT, type=int), MAX_BATCH))
+            prefix = request.args.get('prefix')
+            start = request.args.get('start')
+            end = request.args.get('end')
+            cursor = request.args.get('cursor')
+            fields = request.args.getlist('fields')
+            keys_only = request.args.get('keys_only', '0') in ('1', 'true')
+
+            if keys_only:
+                query = select(KeyValueStore.key).where(KeyValueStore.topic == topic)
+            else:
+                query = entries_query(topic, fields)
+
+            # Range scan on the (topic, key) primary key
+            if prefix:
+                query = query.where(KeyValueStore.key >= prefix, KeyValueStore.key < prefix_end(prefix))
+            if start:
+                query = query.where(KeyValueStore.key >= start)
+            if end:
+                query = query.where(KeyValueStore.key < end)
+            if cursor:
+                query = query.where(KeyValueStore.key > cursor)
+
+            rows = db.session.execute(query.order_by(KeyValueStore.key).limit(limit + 1)).all()
+            more = len(rows) > limit
+            rows = rows[:limit]
+
+            return jsonify({
+                "items": [row.key if keys_only else entry_json(row) for row in rows],
+                "cursor": rows[-1].key if more else None,
+            })
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # Long poll: the keys written after ?since=<seq>, waits up to ?timeout= seconds
+    # for a write when there is none; without since, returns the current sequence
+    @app.route('/kv/<string:topic>/_watch', methods=['GET'])
+    def watch_topic(topic):
+        if not watch_slots.acquire(blocking=False):
+            response = jsonify({"error": "Too many watchers, retry later"})
+            response.headers["Retry-After"] = "1"
+            return response, 503
+        try:
+            since = request.args.get('since', type=int)
+            timeout = request.args.get('timeout', default=WATCH_TIMEOUT, type=float)
+            timeout = max(0, min(timeout, MAX_WATCH_TIMEOUT))
+            fields = request.args.getlist('fields')
+
+            # Without since, or past the sequence (the database was replaced), the client
+            # starts over from the current sequence
+            current = current_sequence(db.session, topic)
+            if since is None or since > current:
+                return jsonify({"items": [], "seq": current})
+
+            query = (
+                entries_query(topic, fields)
+                .add_columns(KeyValueStore.seq)
+                .where(KeyValueStore.seq > since)
+                .order_by(KeyValueStore.seq, KeyValueStore.key)
+            )
+
+            deadline = time.monotonic() + timeout
+            while True:
+                rows = db.session.execute(query).all()
+                remaining = deadline - time.monotonic()
+                if rows or remaining <= 0:
+                    break
+
+                # End the read transaction (and give the connection back to the pool),
+                # the next query must see the new writes
+                db.session.rollback()
+                watchers.wait(topic, since, remaining)
+
+            return jsonify({
+                "items": [dict(entry_json(row), seq=row.seq) for row in rows],
+                "seq": rows[-1].seq if rows else since,
+            })
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            watch_slots.release()
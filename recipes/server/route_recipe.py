@@ -10,15 +10,20 @@ import traceback
 
 from PIL import Image
 from flask import Flask, jsonify, request, send_from_directory
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, selectinload
 from sqlalchemy import select
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
 from ..tools.images import centercrop_resize_image
-from .models import Base, Recipe, Ingredient, Category, UnitConversion, RecipeIngredient, Event, Task, IngredientComposition
-from .decorators import expose
+from .models import Base, Recipe, Ingredient, Category, UnitConversion, RecipeIngredient, Event, Task, IngredientComposition, recipe_categories
+from .decorators import expose, depends_on
+from .pagination import paginated_routes
+
+
+# Recipe json embeds its ingredients, nested recipes and categories
+RECIPE_TABLES = (Recipe, RecipeIngredient, Ingredient, Category, recipe_categories)
 
 
 def recipes_routes(app, db):
@@ -37,11 +42,19 @@ def recipes_routes(app, db):
 
     @app.route('/recipes', methods=['GET'])
     @expose()
+    @depends_on(*RECIPE_TABLES)
     def get_recipes() -> Dict[str, Any]:
         # recipes = db.session.query(Recipe).filter(Recipe.component == False).all()
         recipes = db.session.query(Recipe).all()
         return jsonify([recipe.to_json() for recipe in recipes])
 
+    paginated_routes(
+        app, "recipes", "/recipes",
+        lambda: db.session.query(Recipe).options(selectinload(Recipe.categories)).order_by(Recipe._id),
+        Recipe.to_summary_json,
+        tables=(Recipe, Category, recipe_categories),
+    )
+
     @app.route('/recipes/<int:start>/<int:end>', methods=['GET'])
     def get_recipes_range(start: int, end: int) -> Dict[str, Any]:
         recipes = db.session.query(Recipe).offset(start).limit(end - start).all()
@@ -134,6 +147,7 @@ def recipes_routes(app, db):
 
     @app.route('/recipes/<int:recipe_id>', methods=['GET'])
     @expose(recipe_id=select(Recipe._id))
+    @depends_on(*RECIPE_TABLES)
     def get_recipe(recipe_id: int) -> Dict[str, Any]:
         recipe = db.session.get(Recipe, recipe_id)
         if not recipe:
@@ -145,6 +159,7 @@ def recipes_routes(app, db):
         title.lower().replace(' ', '-')
         for (title,) in db.session.query(Recipe.title).all()
     ])
+    @depends_on(*RECIPE_TABLES)
     def get_recipe_by_name(recipe_name: str) -> Dict[str, Any]:
         # Replace hyphens with spaces for URL-friendly names
         formatted_name = recipe_name.replace('-', ' ')
@@ -257,6 +272,7 @@ def recipes_routes(app, db):
 
     @app.route('/recipes/nutrition/<int:recipe_id>', methods=['GET'])
     @expose(recipe_id=select(Recipe._id))
+    @depends_on(Recipe, IngredientComposition)
     def get_recipe_nutrition(recipe_id: int):
         compositions = db.session.query(IngredientComposition).filter_by(recipe_id=recipe_id).all()
         return jsonify([comp.to_json() for comp in compositions])
@@ -8,21 +8,18 @@ from .models import Task
 
 
 def tasks_routes(app, db):
-    # Get all the root task
+    # Get all the root task, ?depth=0 only returns the roots with their child_count
     @app.route('/tasks', methods=['GET'])
     def get_tasks() -> Dict[str, Any]:
         try:
             # 1. Fetch all the roots
             # 2. Fetch all the nodes
             
-            task_ids = (db.session.query(Task._id)
-                .filter(Task.parent_id.is_(None))
-                # get_task_forest reorder the nodes anyway
-                # .order_by(Task.priority.desc(), Task._id)
-                .all()
-            )
+            # get_task_forest reorder the nodes anyway
+            task_ids = Task.root_ids(db.session)
 
-            return jsonify(Task.get_task_forest(db.session, [t[0] for t in task_ids]))
+            depth = request.args.get('depth', type=int)
+            return jsonify(Task.get_task_forest(db.session, task_ids, depth=depth))
         except Exception as e:
             print_exc()
             return jsonify({"error": str(e)}), 500
@@ -73,12 +70,28 @@ def tasks_routes(app, db):
     @app.route('/tasks/<int:task_id>', methods=['GET'])
     def get_task(task_id: int) -> Dict[str, Any]:
         try:
-            tree = Task.get_task_tree(session=db.session, task_id=task_id)
+            depth = request.args.get('depth', type=int)
+            tree = Task.get_task_tree(session=db.session, task_id=task_id, depth=depth)
+            if tree is None:
+                return jsonify({"error": "Task not found"}), 404
             return jsonify(tree)
         except Exception as e:
             print_exc()
             return jsonify({"error": str(e)}), 500
 
+    # Lazy expansion of a branch: the children of a task, `depth` levels down (1 by default)
+    @app.route('/tasks/<int:task_id>/children', methods=['GET'])
+    def get_task_children(task_id: int) -> Dict[str, Any]:
+        try:
+            depth = max(request.args.get('depth', default=1, type=int), 1)
+            tree = Task.get_task_tree(session=db.session, task_id=task_id, depth=depth)
+            if tree is None:
+                return jsonify({"error": "Task not found"}), 404
+            return jsonify(tree["children"])
+        except Exception as e:
+            print_exc()
+            return jsonify({"error": str(e)}), 500
+
     @app.route('/tasks/<int:task_id>', methods=['PUT'])
     def update_task(task_id: int) -> Dict[str, Any]:
         try:
@@ -109,6 +122,10 @@ def tasks_routes(app, db):
                 # Update root_id if parent changed
                 if task.parent_id != old_parent_id:
                     if task.parent_id:
+                        if Task.is_descendant(db.session, task.parent_id, task._id):
+                            db.session.rollback()
+                            return jsonify({"error": "A task cannot be moved under itself"}), 400
+
                         parent = db.session.query(Task).get(task.parent_id)
                         if parent:
                             task.root_id = parent.root_id if parent.root_id else parent._id
@@ -116,6 +133,9 @@ def tasks_routes(app, db):
                         # If parent is removed, this becomes a root task
                         task.root_id = task._id
 
+                    # The subtasks follow their parent to its new tree
+                    Task.set_subtree_root(db.session, task._id, task.root_id)
+
             db.session.commit()
             return jsonify({})
         except Exception as e:
@@ -3,7 +3,7 @@ from typing import List, Dict, Any
 from flask import jsonify
 
 from .models import Ingredient, UnitConversion, RecipeIngredient
-from .decorators import expose
+from .decorators import expose, depends_on
 
 
 # Hard coded defaults
@@ -280,6 +280,7 @@ def units_routes(app, db):
         .filter(UnitConversion.from_unit == UnitConversion.to_unit)
         .distinct().all()
     ])
+    @depends_on(UnitConversion)
     def flask_get_unit(name):
         unit =  get_unit(db, name)
         if unit is not None:
@@ -296,6 +297,7 @@ def units_routes(app, db):
         from_unit=lambda: [u for (u,) in db.session.query(UnitConversion.from_unit).distinct().all()],
         to_unit=lambda: [u for (u,) in db.session.query(UnitConversion.to_unit).distinct().all()],
     )
+    @depends_on(UnitConversion)
     def convert(from_unit, to_unit):
         conversion = conversion_factor(db, from_unit, to_unit)
         if conversion is not None:
@@ -304,6 +306,7 @@ def units_routes(app, db):
 
     @app.route('/units/available', methods=['GET'])
     @expose()
+    @depends_on(UnitConversion)
     def all_units() -> List[str]:
         conversions = (
             db.session.query(UnitConversion.to_unit)
@@ -314,6 +317,7 @@ def units_routes(app, db):
 
     @app.route('/units/available/volume', methods=['GET'])
     @expose()
+    @depends_on(UnitConversion)
     def get_volume_units():
         conversions = (
             db.session.query(UnitConversion.to_unit)
@@ -342,6 +346,7 @@ def units_routes(app, db):
 
     @app.route('/units/available/mass', methods=['GET'])
     @expose()
+    @depends_on(UnitConversion)
     def get_mass_units():
         conversions = (
             db.session.query(UnitConversion.to_unit)
@@ -354,6 +359,7 @@ def units_routes(app, db):
 
     @app.route('/unit/conversions', methods=['GET'])
     @expose()
+    @depends_on(UnitConversion)
     def get_all_conversions() -> Dict[str, Any]:
         conversions = (
             db.session.query(UnitConversion)
@@ -556,6 +562,7 @@ def units_routes(app, db):
 
     @app.route('/units/used-in-recipes', methods=['GET'])
     @expose()
+    @depends_on(RecipeIngredient, UnitConversion)
     def get_units_used_in_recipes() -> Dict[str, Any]:
         """Get all units currently used in recipe ingredients"""
         try:
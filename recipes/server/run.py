@@ -3,6 +3,17 @@
 Recipe API Server Runner
 
 Simple script to run the Flask development server with the Recipe API.
+
+With FLASK_ENV=production, the API is served by the preforking server (see
+prefork.py), configured by:
+
+    RECIPES_WORKERS             worker processes (default: one per core)
+    RECIPES_THREADS             threads per worker (default: 8)
+    RECIPES_TIMEOUT             seconds before a busy worker is restarted (default: 120)
+    RECIPES_GRACEFUL_TIMEOUT    seconds given to the workers to stop (default: 30)
+    RECIPES_KEEPALIVE           seconds an idle connection is kept open (default: 5)
+
+Send SIGHUP to the master to reload the code without dropping connections.
 """
 
 import os
@@ -11,6 +22,16 @@ import sys
 from .server import RecipeApp, STATIC_FOLDER
 
 
+def production_options():
+    return {
+        "workers": int(os.getenv('RECIPES_WORKERS', os.cpu_count() or 1)),
+        "threads": int(os.getenv('RECIPES_THREADS', 8)),
+        "timeout": float(os.getenv('RECIPES_TIMEOUT', 120)),
+        "graceful_timeout": float(os.getenv('RECIPES_GRACEFUL_TIMEOUT', 30)),
+        "keepalive": float(os.getenv('RECIPES_KEEPALIVE', 5)),
+    }
+
+
 def main():
     """Run the Recipe API server"""
     
@@ -24,13 +45,19 @@ def main():
     print(f"📍 Host: {host}")
     print(f"🔌 Port: {port}")
     print(f"🐛 Debug: {debug}")
+    if not debug:
+        options = production_options()
+        print(f"👷 Workers: {options['workers']} x {options['threads']} threads")
     print(f"🌐 Access at: http://localhost:{port}")
     print(f"STATIC_FOLDER {STATIC_FOLDER}")
     print("=" * 50)
     
     try:
         app = RecipeApp()
-        app.run(host=host, port=port, debug=debug)
+        if debug:
+            app.run(host=host, port=port, debug=debug)
+        else:
+            app.serve(host=host, port=port, **options)
     except KeyboardInterrupt:
         print("\n👋 Server stopped")
     except Exception as e:
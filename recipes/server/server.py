@@ -15,7 +15,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
-from ..tools.images import centercrop_resize_image
+from ..tools.images import centercrop_resize_image, DERIVATIVE_WIDTHS, DERIVATIVE_FORMATS
 from .models import Base, Recipe, Ingredient, Category, UnitConversion, RecipeIngredient, Event, Task
 from .route_keyvalue import key_value_routes
 from .route_messaging import messaging_routes
@@ -30,7 +30,10 @@ from .route_usda import usda_routes
 from .route_article import article_routes
 from .projects.graph import code_conversion
 from .route_jsonstore import jsonstore_routes
-from .decorators import expose
+from .decorators import expose, depends_on
+from .changes import track_table_changes
+from .executors import shutdown_executors
+from .dbconfig import engine_options, install_sqlite_profile, sqlite_pragmas
 
 # from .mcp import routes as mcp_routes
 
@@ -66,10 +69,29 @@ class RecipeApp:
         self.app = Flask(__name__, static_folder=STATIC_FOLDER)
         self.app.config['JSON_SORT_KEYS'] = False
         self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{STATIC_FOLDER}/database.db"
+        # WAL, busy timeout and page cache of every connection, see dbconfig
+        self.app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
+        self.app.config["SQLITE_PRAGMAS"] = sqlite_pragmas()
 
         # Configure file uploads
         self.app.config['UPLOAD_FOLDER'] = STATIC_UPLOAD_FOLDER
         self.app.config['ORIGINALS_FOLDER'] = '/mnt/xshare/projects/recipes/originals'
+        self.app.config['LOCAL_ORIGINALS_FOLDER'] = os.path.join(STATIC_FOLDER, 'originals')
+        self.app.config['BLOB_FOLDER'] = os.path.join(STATIC_FOLDER, 'blobs')
+
+        # On demand resized uploads, /uploads/<path>?w=&h=&fmt=
+        self.app.config['IMAGE_CACHE_FOLDER'] = os.path.join(STATIC_FOLDER, 'cache', 'images')
+        self.app.config['IMAGE_CACHE_MAX_BYTES'] = int(os.getenv("RECIPES_IMAGE_CACHE_MB", 512)) * 1024 ** 2
+        self.app.config['IMAGE_CACHE_MAX_AGE'] = 24 * 3600
+        self.app.config['IMAGE_HASH_INDEX'] = os.path.join(STATIC_FOLDER, 'cache', 'phash.db')
+
+        # Long polls of /kv/<topic>/_watch served at once by a worker, see route_keyvalue
+        self.app.config['KV_MAX_WATCHERS'] = int(os.getenv("RECIPES_KV_MAX_WATCHERS", 4))
+
+        # Background image processing, see route_images
+        self.app.config['IMAGE_WORKERS'] = int(os.getenv("RECIPES_IMAGE_WORKERS", 2))
+        self.app.config['IMAGE_DERIVATIVE_WIDTHS'] = DERIVATIVE_WIDTHS
+        self.app.config['IMAGE_DERIVATIVE_FORMATS'] = DERIVATIVE_FORMATS
         # No file size limit
 
         # Create uploads directory if it doesn't exist
@@ -89,9 +111,12 @@ class RecipeApp:
         self.db.init_app(self.app)
 
         with self.app.app_context():
+            install_sqlite_profile(self.db.engine, self.app.config["SQLITE_PRAGMAS"])
             self.db.create_all()
             # self._seed_data()
 
+        track_table_changes(self.db.session)
+
         # users = db.session.execute(db.select(User).order_by(User.username)).scalars()
         self.setup_routes()
 
@@ -100,7 +125,7 @@ class RecipeApp:
         calendar_routes(self.app, self.db)
         tasks_routes(self.app, self.db)
         units_routes(self.app, self.db)
-        images_routes(self.app)
+        images_routes(self.app, self.db)
         recipes_routes(self.app, self.db)
         ingredient_routes(self.app, self.db)
         projects_routes(self.app, self.db)
@@ -126,11 +151,13 @@ class RecipeApp:
 
         @self.app.route('/health')
         @expose()
+        @depends_on()
         def health_check() -> Dict[str, str]:
             return jsonify({"status": "healthy"})
 
         @self.app.route('/categories', methods=['GET'])
         @expose()
+        @depends_on(Category)
         def get_categories() -> Dict[str, Any]:
             categories = self.db.session.query(Category).all()
             return jsonify([category.to_json() for category in categories])
@@ -151,6 +178,21 @@ class RecipeApp:
     def run(self, host: str = '0.0.0.0', port: int = 5000, debug: bool = True) -> None:
         self.app.run(host=host, port=port, debug=debug)
 
+    def serve(self, host: str = '0.0.0.0', port: int = 5000, **options) -> None:
+        """Production server, see `prefork.serve` for the options"""
+        from .prefork import serve
+
+        def post_fork():
+            # Connections opened by the master must not be shared with the workers
+            with self.app.app_context():
+                self.db.engine.dispose(close=False)
+
+        def pre_exit():
+            # Uploads were answered 202, their images are still to be written
+            shutdown_executors(self.app)
+
+        serve(self.app, host, port, post_fork=post_fork, pre_exit=pre_exit, **options)
+
 if __name__ == '__main__':
     app = RecipeApp()
     app.run()
@@ -0,0 +1,254 @@
+"""
+Content addressed storage of the uploaded images.
+
+Every file is stored once under `objects/<2 hex>/<sha256>`; the namespaced paths
+the application serves (`uploads/recipes/1/preview.jpg`, originals, ...) are
+hardlinks to the blob and are recorded as references in `refs.db`. The number
+of references of a blob is its reference count, blobs nobody points to anymore
+are removed by `collect_garbage`.
+
+The references are a SQLite table shared by every process using the store (the
+server workers, `preprocess_images`): a change only writes its row, and the
+counts are always read from the table, never from a copy in memory.
+
+Derived files (crops, resized variants) can be remembered under a key built from
+the digest of their source and the parameters used, so identical derivatives are
+computed only once.
+
+Files materialized from the store share their inode with the blob; they must be
+replaced (write a temporary file then `os.replace`) and never written in place.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .syncdir import file_hash
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS refs (path TEXT PRIMARY KEY, digest TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_refs_digest ON refs (digest);
+CREATE TABLE IF NOT EXISTS derived (key TEXT PRIMARY KEY, digest TEXT NOT NULL);
+"""
+
+
+class BlobStore:
+    def __init__(self, root, base=None):
+        self.root = os.path.abspath(root)
+        self.base = os.path.abspath(base or os.path.dirname(self.root))
+        self.index_path = os.path.join(self.root, "refs.db")
+        # One connection per thread and process
+        self.local = threading.local()
+
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+
+        with self.transaction() as db:
+            for statement in filter(str.strip, SCHEMA.split(";")):
+                db.execute(statement)
+            self._import_json(db)
+
+    def _import_json(self, db):
+        """References of the stores saved as `refs.json`, before the table"""
+        legacy = os.path.join(self.root, "refs.json")
+        try:
+            with open(legacy) as fp:
+                index = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        db.executemany("INSERT OR IGNORE INTO refs (path, digest) VALUES (?, ?)", index.get("refs", {}).items())
+        db.executemany("INSERT OR IGNORE INTO derived (key, digest) VALUES (?, ?)", index.get("derived", {}).items())
+        os.replace(legacy, f"{legacy}.imported")
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            # Autocommit, transactions are explicit; writers wait for each other
+            db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction, the changes of the other processes are visible inside"""
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @property
+    def refs(self):
+        """{path: digest} of every reference"""
+        return dict(self.connection().execute("SELECT path, digest FROM refs"))
+
+    def ref_key(self, path):
+        """References are relative to the static folder when possible"""
+        path = os.path.abspath(path)
+        if path.startswith(self.base + os.sep):
+            return os.path.relpath(path, self.base)
+        return path
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def temporary_path(self, suffix=""):
+        """Scratch file on the same device as the blobs, for `add_file(..., move=True)`"""
+        return os.path.join(self.root, "tmp", uuid.uuid4().hex + suffix)
+
+    def refcount(self, digest):
+        (count,) = self.connection().execute("SELECT count(*) FROM refs WHERE digest = ?", (digest,)).fetchone()
+        return count
+
+    def add_file(self, path, move=False, digest=None):
+        """Store the content of `path` and return its digest, no reference is created"""
+        digest = digest or file_hash(path)
+        blob = self.blob_path(digest)
+
+        if os.path.exists(blob):
+            # Stored again, the reference is coming: restart the grace period of `collect_garbage`
+            os.utime(blob)
+            if move:
+                os.remove(path)
+            return digest
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp = f"{blob}.{uuid.uuid4().hex[:8]}.tmp"
+        if move:
+            shutil.move(path, tmp)
+        else:
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copy2(path, tmp)
+        os.replace(tmp, blob)
+
+        return digest
+
+    def add_stream(self, stream, chunk_size=1024 * 1024):
+        """Store a stream read in chunks, hashing as it is written; returns (digest, size)"""
+        digest = hashlib.sha256()
+        size = 0
+
+        tmp = self.temporary_path()
+        try:
+            with open(tmp, "wb") as fp:
+                while chunk := stream.read(chunk_size):
+                    digest.update(chunk)
+                    fp.write(chunk)
+                    size += len(chunk)
+
+            return self.add_file(tmp, move=True, digest=digest.hexdigest()), size
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _set_ref(self, path, digest):
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO refs (path, digest) VALUES (?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET digest = excluded.digest",
+                (self.ref_key(path), digest),
+            )
+
+    def link(self, digest, path):
+        """Materialize the blob at `path` and reference it"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.link(self.blob_path(digest), tmp)
+        except OSError:
+            # Other device (network share), fallback to a copy
+            shutil.copy2(self.blob_path(digest), tmp)
+        os.replace(tmp, path)
+
+        self._set_ref(path, digest)
+
+    def adopt(self, path):
+        """Move an existing file into the store, leaving a link in its place"""
+        digest = self.add_file(path)
+        if not os.path.samefile(path, self.blob_path(digest)):
+            self.link(digest, path)
+        else:
+            self._set_ref(path, digest)
+        return digest
+
+    def release(self, path):
+        """Drop the reference held by `path`, the file itself is left untouched"""
+        with self.transaction() as db:
+            row = db.execute("DELETE FROM refs WHERE path = ? RETURNING digest", (self.ref_key(path),)).fetchone()
+        return row[0] if row is not None else None
+
+    def derived(self, key):
+        """Digest of a derivative computed before, if its blob still exists"""
+        row = self.connection().execute("SELECT digest FROM derived WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.exists(row[0]):
+            return row[0]
+        return None
+
+    def remember(self, key, digest):
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO derived (key, digest) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET digest = excluded.digest",
+                (key, digest),
+            )
+
+    def collect_garbage(self, dry_run=False, min_age=3600):
+        """Remove the blobs without references
+
+        Blobs younger than `min_age` seconds are kept, an upload being processed
+        is stored before the background job links it. The references cannot change
+        while the blobs are removed, the other processes wait for the transaction.
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - min_age
+
+        with self.transaction() as db:
+            alive = {digest for (digest,) in db.execute("SELECT DISTINCT digest FROM refs")}
+
+            objects = os.path.join(self.root, "objects")
+            for prefix in os.listdir(objects):
+                for digest in os.listdir(os.path.join(objects, prefix)):
+                    if digest in alive or digest.endswith(".tmp"):
+                        continue
+
+                    path = os.path.join(objects, prefix, digest)
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+
+                    removed += 1
+                    freed += stat.st_size
+                    if not dry_run:
+                        os.remove(path)
+
+            if not dry_run:
+                db.execute("DELETE FROM derived WHERE digest NOT IN (SELECT digest FROM refs)")
+
+        return {"removed": removed, "bytes": freed}
+
+    def stats(self):
+        db = self.connection()
+        (refs,) = db.execute("SELECT count(*) FROM refs").fetchone()
+        blobs = [digest for (digest,) in db.execute("SELECT DISTINCT digest FROM refs")]
+
+        size = sum(os.path.getsize(self.blob_path(d)) for d in blobs if self.exists(d))
+        return {"refs": refs, "blobs": len(blobs), "bytes": size}
@@ -0,0 +1,113 @@
+"""
+Per route profiling of the static website generation.
+
+Every exposed route is crawled inside `BuildProfiler.route`; SQL statements are
+counted through the SQLAlchemy `before_cursor_execute` engine event and each
+rendered combination reports its duration, the bytes written and whether it
+failed. The report is saved in `build-info.json` so two builds can be diffed.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+
+
+def percentile(values, q):
+    """Nearest rank percentile of an already sorted list"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+@dataclass
+class RouteProfile:
+    endpoint: str
+    rule: str
+    timings: list = field(default_factory=list)
+    queries: int = 0
+    bytes: int = 0
+    failures: int = 0
+    elapsed: float = 0
+
+    def to_json(self):
+        timings = sorted(self.timings)
+        return {
+            "endpoint": self.endpoint,
+            "rule": self.rule,
+            "combinations": len(timings),
+            "saved": len(timings) - self.failures,
+            "failures": self.failures,
+            "total_ms": round(self.elapsed * 1000, 3),
+            "render_ms": round(sum(timings) * 1000, 3),
+            "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+            "queries": self.queries,
+            "bytes": self.bytes,
+        }
+
+
+class BuildProfiler:
+    def __init__(self, engine):
+        self.engine = engine
+        self.routes = {}
+        self.current = None
+        self.queries = 0
+        event.listen(self.engine, "before_cursor_execute", self.on_cursor_execute)
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self.on_cursor_execute)
+
+    def on_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        if self.current is not None:
+            self.current.queries += 1
+
+    @contextmanager
+    def route(self, rule):
+        profile = self.routes.get(rule.endpoint)
+        if profile is None:
+            profile = RouteProfile(endpoint=rule.endpoint, rule=str(rule))
+            self.routes[rule.endpoint] = profile
+
+        self.current = profile
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profile.elapsed += time.perf_counter() - start
+            self.current = None
+
+    def sample(self, duration, nbytes=0, failed=False):
+        """Record one rendered combination of the current route"""
+        if self.current is None:
+            return
+
+        self.current.timings.append(duration)
+        self.current.bytes += nbytes
+        if failed:
+            self.current.failures += 1
+
+    def report(self):
+        routes = [profile.to_json() for profile in self.routes.values()]
+        routes.sort(key=lambda r: r["endpoint"])
+        return {
+            "total_ms": round(sum(r["total_ms"] for r in routes), 3),
+            "queries": self.queries,
+            "bytes": sum(r["bytes"] for r in routes),
+            "failures": sum(r["failures"] for r in routes),
+            "routes": routes,
+        }
+
+    def table(self, top=10):
+        routes = sorted(self.report()["routes"], key=lambda r: r["total_ms"], reverse=True)[:top]
+
+        header = f"{'endpoint':<40} {'comb':>6} {'total ms':>10} {'p95 ms':>8} {'queries':>8} {'KiB':>9} {'fail':>5}"
+        lines = [header, "-" * len(header)]
+        for r in routes:
+            lines.append(
+                f"{r['endpoint'][:40]:<40} {r['combinations']:>6} {r['total_ms']:>10.1f} "
+                f"{r['p95_ms']:>8.2f} {r['queries']:>8} {r['bytes'] / 1024:>9.1f} {r['failures']:>5}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,187 @@
+"""
+Fractional indexing: order keys that always have room in between.
+
+A key is a variable length integer followed by a fraction, both in base 62
+digits (in ASCII order, so keys compare like strings). The head letter of the
+integer gives its length: "a" to "z" start the integers of 1 to 26 digits from
+"a0" (zero) up, "Z" to "A" the negative ones of 1 to 26 digits down. The
+fraction is read as 0.d1d2d3... and never ends with "0", so there is always a
+key before any key. Inserting between two neighbours only computes a new key for
+the inserted row, the siblings are never renumbered.
+
+Appending or prepending increments or decrements the integer, its length only
+grows with the logarithm of the list size. Repeated inserts at the same spot in
+the middle make the fraction longer by one digit every few inserts;
+`spread_keys` gives a sibling list short keys again when rebalancing.
+"""
+from __future__ import annotations
+
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+INTEGER_ZERO = "a0"
+# No key is before it, the integer part of a key can never be the smallest integer
+SMALLEST_INTEGER = "A" + "0" * 26
+
+# Keys longer than this are worth a rebalance
+REBALANCE_LENGTH = 24
+
+
+def _midpoint(a: str, b: str | None) -> str:
+    """Fraction strictly between the fractions a and b (b None is 1)"""
+    if b is not None:
+        # Skip the common prefix, a is padded with zeros
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    low = DIGITS.index(a[0]) if a else 0
+    high = DIGITS.index(b[0]) if b is not None else BASE
+
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+
+    # Consecutive digits
+    if b is not None and len(b) > 1:
+        return b[:1]
+
+    return DIGITS[low] + _midpoint(a[1:], None)
+
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid order key head: {head!r}")
+
+
+def _split(key: str) -> tuple[str, str]:
+    """(integer, fraction) parts of a key"""
+    length = _integer_length(key[0])
+    if len(key) < length:
+        raise ValueError(f"Invalid order key: {key!r}")
+    return key[:length], key[length:]
+
+
+def _increment(integer: str) -> str | None:
+    """Next integer, None past the largest one"""
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) + 1
+        if d < BASE:
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = DIGITS[0]
+
+    # Carried out of every digit, one more digit (one less below zero)
+    if head == "Z":
+        return "a" + DIGITS[0]
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def _decrement(integer: str) -> str | None:
+    """Previous integer, None past the smallest one"""
+    head, digits = integer[0], list(integer[1:])
+    for i in reversed(range(len(digits))):
+        d = DIGITS.index(digits[i]) - 1
+        if d >= 0:
+            digits[i] = DIGITS[d]
+            return head + "".join(digits)
+        digits[i] = DIGITS[-1]
+
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+
+def validate_key(key: str):
+    if not key or any(c not in DIGITS for c in key):
+        raise ValueError(f"Invalid order key: {key!r}")
+
+    integer, fraction = _split(key)
+    if integer == SMALLEST_INTEGER or fraction.endswith("0"):
+        raise ValueError(f"Invalid order key: {key!r}")
+
+
+def key_between(a: str | None, b: str | None) -> str:
+    """Key between a and b, None is the start (for a) or the end (for b) of the list"""
+    if a is not None:
+        validate_key(a)
+    if b is not None:
+        validate_key(b)
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a!r} is not before {b!r}")
+
+    if a is None:
+        if b is None:
+            return INTEGER_ZERO
+
+        integer, fraction = _split(b)
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint("", fraction)
+        if fraction:
+            return integer
+        previous = _decrement(integer)
+        if previous is None:
+            raise ValueError(f"No key before {b!r}")
+        return previous
+
+    integer, fraction = _split(a)
+    following = _increment(integer)
+
+    if b is None:
+        if following is None:
+            return integer + _midpoint(fraction, None)
+        return following
+
+    b_integer, b_fraction = _split(b)
+    if integer == b_integer:
+        return integer + _midpoint(fraction, b_fraction)
+    if following is None:
+        raise ValueError(f"No key after {a!r}")
+    if following < b:
+        return following
+    return integer + _midpoint(fraction, None)
+
+
+def keys_between(a: str | None, b: str | None, n: int) -> list[str]:
+    """n ordered keys between a and b, bisecting so they stay short"""
+    if n == 0:
+        return []
+
+    mid = key_between(a, b)
+    half = n // 2
+    return keys_between(a, mid, half) + [mid] + keys_between(mid, b, n - half - 1)
+
+
+def spread_keys(n: int) -> list[str]:
+    """n short keys for a fresh sibling list, consecutive integers from zero"""
+    keys = []
+    key = INTEGER_ZERO
+    for _ in range(n):
+        keys.append(key)
+        key = _increment(key)
+    return keys
+
+
+def needs_rebalance(key: str | None) -> bool:
+    return key is not None and len(key) > REBALANCE_LENGTH
@@ -0,0 +1,173 @@
+"""
+Size bounded LRU disk cache of resized images.
+
+`/uploads/<path>?w=&h=&fmt=` resizes the upload on the first request and keeps
+the result here. Entries are keyed by the source path, its size and mtime and the
+requested variant, so a re-upload never serves a stale variant. The least
+recently served entries are evicted once the cache grows past `max_bytes`.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from PIL import Image
+
+from .images import PIL_FORMATS, to_rgb
+
+
+# Refuse absurd sizes, each distinct request is a cache entry
+MAX_DIMENSION = 4096
+
+# Largest image decoded, after the JPEG draft: 40 megapixels take 160 MB in RGBA
+MAX_DECODE_PIXELS = 40_000_000
+
+MIMETYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "png": "image/png",
+}
+
+
+def open_scaled(path, width=None, height=None, max_pixels=MAX_DECODE_PIXELS):
+    """Open an image decoded at the smallest scale still larger than the requested box
+
+    JPEG can decode at 1/2, 1/4 or 1/8 of its size (`draft`), a thumbnail of a
+    20 megapixels photo never holds the full resolution image in memory. The
+    other formats (PNG, WebP, GIF) are decoded at full size: images that would
+    decode to more than `max_pixels` are refused before anything is decoded,
+    with `Image.DecompressionBombError`.
+    """
+    image = Image.open(path)
+    try:
+        if image.format == "JPEG" and (width or height):
+            box = (
+                width or round(image.width * height / image.height),
+                height or round(image.height * width / image.width),
+            )
+            image.draft("RGB", box)
+
+        # Only the header is read so far, the size is the decoded one
+        if image.width * image.height > max_pixels:
+            raise Image.DecompressionBombError(
+                f"{image.format} image of {image.width}x{image.height} pixels, "
+                f"more than the {max_pixels} pixels decoded at most"
+            )
+
+        image.load()
+    except BaseException:
+        image.close()
+        raise
+    return image
+
+
+def resize_to_fit(image, width=None, height=None):
+    """Fit in the box keeping the ratio, never upscale; resizes in place"""
+    width = min(width or image.width, image.width)
+    height = min(height or image.height, image.height)
+
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+class ImageCache:
+    def __init__(self, root, max_bytes=512 * 1024 ** 2, quality=82):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.entries = OrderedDict()
+        self.size = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order from the modification times, they are refreshed on every hit"""
+        found = []
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+
+        for _, rel, size in sorted(found):
+            self.entries[rel] = size
+            self.size += size
+
+    def key(self, source, width, height, fmt):
+        stat = os.stat(source)
+        identity = f"{source}:{stat.st_size}:{stat.st_mtime_ns}:{width}:{height}:{fmt}:{self.quality}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+    def entry_path(self, key, fmt):
+        return os.path.join(key[:2], f"{key}.{fmt}")
+
+    def get(self, source, width=None, height=None, fmt="jpg"):
+        """Return (path, etag) of the variant, generating it on a miss"""
+        key = self.key(source, width, height, fmt)
+        rel = self.entry_path(key, fmt)
+        path = os.path.join(self.root, rel)
+
+        with self.lock:
+            if rel in self.entries and os.path.exists(path):
+                self.entries.move_to_end(rel)
+                os.utime(path)
+                return path, key
+
+            # Concurrent requests of the same variant wait for a single resize
+            event = self.pending.get(rel)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self.pending[rel] = event
+
+        if not owner:
+            event.wait()
+            if os.path.exists(path):
+                return path, key
+
+        try:
+            self._generate(source, path, width, height, fmt)
+        finally:
+            if owner:
+                with self.lock:
+                    self.pending.pop(rel, None)
+                event.set()
+
+        with self.lock:
+            size = os.path.getsize(path)
+            self.size += size - self.entries.get(rel, 0)
+            self.entries[rel] = size
+            self.entries.move_to_end(rel)
+            self._evict()
+
+        return path, key
+
+    def _generate(self, source, path, width, height, fmt):
+        with open_scaled(source, width, height) as image:
+            resized = resize_to_fit(image, width, height)
+
+            if PIL_FORMATS[fmt] == "JPEG":
+                resized = to_rgb(resized)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            resized.save(tmp, format=PIL_FORMATS[fmt], quality=self.quality)
+            os.replace(tmp, path)
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            rel, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.root, rel))
+            except FileNotFoundError:
+                pass
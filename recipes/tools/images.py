@@ -1,12 +1,67 @@
+import json
 import os
 
 from PIL import Image
 
 
-def resize_image(image, target=(200, 150)):
-    target_width, target_height = target
-    target_ratio = target_width / target_height
+# Responsive variants generated for every upload, see `make_derivatives`
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = ("webp", "jpg")
+DERIVATIVE_QUALITY = 82
+
+# Width of the production image of namespaces without a fixed crop
+MAX_PRODUCTION_WIDTH = 1280
+
+PIL_FORMATS = {
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "webp": "WEBP",
+    "png": "PNG",
+}
+
+
+def save_image(image, path, fmt, **kwargs):
+    """Write through a temporary file, `path` might be a hardlink to a shared blob"""
+    tmp = f"{path}.tmp"
+    image.save(tmp, format=PIL_FORMATS[fmt], **kwargs)
+    os.replace(tmp, path)
+
+
+def store_result(store, key, path):
+    """Move a freshly written file into the blob store and remember how it was made"""
+    if store is None:
+        return
+    digest = store.adopt(path)
+    if key is not None:
+        store.remember(key, digest)
+
+
+def crop_target(namespace):
+    """Fixed size of the production image, None to keep the original ratio"""
+    purpose = namespace.split('/')[-1]
+
+    if 'preview' in purpose:
+        return (400, 400)
 
+    elif 'step' in purpose:
+        return (300, 225)
+
+    return None
+
+
+def to_rgb(image):
+    """JPEG cannot store alpha or palettes"""
+    if image.mode in ("RGB", "L"):
+        return image
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert("RGB")
+
+
+def center_crop(image, target_ratio):
     orig_ratio = image.width / image.height
 
     if orig_ratio > target_ratio:
@@ -23,24 +78,130 @@ def resize_image(image, target=(200, 150)):
     right = left + new_width
     bottom = top + new_height
 
-    cropped = image.crop((left, top, right, bottom))
+    return image.crop((left, top, right, bottom))
+
+
+def resize_image(image, target=(200, 150)):
+    target_width, target_height = target
+
+    cropped = center_crop(image, target_width / target_height)
     resized = cropped.resize((target_width, target_height), Image.LANCZOS)
 
     return resized
 
-def centercrop_resize_image(root, image, namespace, extension):
+def centercrop_resize_image(root, image, namespace, extension, store=None, source=None):
+    """Save the production image of `namespace`
+
+    With a blob `store` and the digest of the `source` image, an identical production
+    image made before is linked instead of recomputed.
+    """
     file_path = os.path.join(root, f'{namespace}.jpg')
     folder_path = os.path.dirname(file_path)
     os.makedirs(folder_path, exist_ok=True)
 
-    purpose = namespace.split('/')[-1]
+    target = crop_target(namespace)
 
-    if 'preview' in purpose:
-        target = (400, 400)
+    key = None
+    if store is not None and source is not None:
+        key = f'{source}:production:{target}:{MAX_PRODUCTION_WIDTH}'
+        digest = store.derived(key)
+        if digest is not None:
+            store.link(digest, file_path)
+            return f'{namespace}.jpg'
 
-    elif 'step' in purpose:
-        target = (300, 225)
+    if target is not None:
+        resized = resize_image(image, target=target)
+    elif image.width > MAX_PRODUCTION_WIDTH:
+        height = round(image.height * MAX_PRODUCTION_WIDTH / image.width)
+        resized = image.resize((MAX_PRODUCTION_WIDTH, height), Image.LANCZOS)
+    else:
+        resized = image
 
-    resized = resize_image(image, target=target)
-    resized.save(file_path)
+    save_image(to_rgb(resized), file_path, "jpg")
+    store_result(store, key, file_path)
     return f'{namespace}.jpg'
+
+
+def derivative_name(namespace, width, fmt):
+    return f'{namespace}.{width}w.{fmt}'
+
+
+def derivative_manifest_name(namespace):
+    return f'{namespace}.derivatives.json'
+
+
+def make_derivatives(root, image, namespace, widths=DERIVATIVE_WIDTHS, formats=DERIVATIVE_FORMATS, quality=DERIVATIVE_QUALITY, store=None, source=None):
+    """Save `image` at several widths and formats for a responsive `srcset`
+
+    Images are never upscaled, widths larger than the source collapse to the source width.
+    Variants already computed from the same `source` digest are linked from the blob `store`.
+    Returns the manifest, also saved next to the derivatives.
+    """
+    image = to_rgb(image)
+
+    target = crop_target(namespace)
+    if target is not None:
+        image = center_crop(image, target[0] / target[1])
+
+    folder_path = os.path.dirname(os.path.join(root, namespace))
+    os.makedirs(folder_path, exist_ok=True)
+
+    sizes = sorted({min(width, image.width) for width in widths}, reverse=True)
+
+    def variant_key(width, fmt):
+        if store is None or source is None:
+            return None
+        return f'{source}:{target}:{width}:{fmt}:{quality}'
+
+    derivatives = []
+    current = image
+    for width in sizes:
+        height = max(1, round(image.height * width / image.width))
+
+        cached = {}
+        for fmt in formats:
+            key = variant_key(width, fmt)
+            digest = store.derived(key) if key is not None else None
+            if digest is not None:
+                cached[fmt] = digest
+
+        # Downscale from the previous (larger) variant, it is much cheaper than from the source
+        if len(cached) < len(formats) and current.width != width:
+            current = current.resize((width, height), Image.LANCZOS)
+
+        for fmt in formats:
+            name = derivative_name(namespace, width, fmt)
+            path = os.path.join(root, name)
+
+            if fmt in cached:
+                store.link(cached[fmt], path)
+            else:
+                save_image(current, path, fmt, quality=quality)
+                store_result(store, variant_key(width, fmt), path)
+
+            derivatives.append({
+                "path": name,
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "bytes": os.path.getsize(path),
+            })
+
+    derivatives.sort(key=lambda d: d["width"])
+    manifest = {
+        "namespace": namespace,
+        "width": image.width,
+        "height": image.height,
+        "derivatives": derivatives,
+        "srcset": {
+            fmt: ", ".join(
+                f"/uploads/{d['path']} {d['width']}w" for d in derivatives if d["format"] == fmt
+            )
+            for fmt in formats
+        },
+    }
+
+    with open(os.path.join(root, derivative_manifest_name(namespace)), "w") as fp:
+        json.dump(manifest, fp)
+
+    return manifest
@@ -0,0 +1,483 @@
+"""
+JSON document store: one file per document, `<root>/<collection>/<key>.json`.
+
+Documents are written compactly to a temporary file that is renamed over the
+previous version, a crash leaves either the old or the new document. Names
+starting with "_" are not documents (temporary files, sidecar indexes).
+
+Each collection keeps its keys in memory. The list is reloaded when the mtime of
+the directory changes; creating, renaming or removing a file changes it, so
+writes from other processes are seen, and the files themselves are never
+stat'ed to list a collection. Writes made through the store update the list
+at once; the directory is listed again after them, as another process could
+have changed it meanwhile. A reload keeps the mtimes already known: only the
+new documents and those replaced (a new inode, listed for free by scandir) are
+stat'ed again. Documents must be replaced, not edited in place.
+
+A collection can declare indexed fields. Their values are kept in memory, sorted,
+to answer equality and range queries without opening the documents, and saved
+in `<root>/_indexes/<collection>.json` with the mtime of every document. Writes
+made through the store update the index; before a query, the documents whose
+mtime changed since they were indexed (edited by another process) are read
+again.
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import re
+import tempfile
+import threading
+
+
+INDEX_FOLDER = '_indexes'
+# Writes indexed before the index file is saved again
+SAVE_AFTER = 100
+FIELD = r'[A-Za-z0-9_\-]+(?:\.[A-Za-z0-9_\-]+)*'
+CONDITION = re.compile(rf'^({FIELD})(:|>=|<=|>|<)(.*)$')
+
+
+def safe_name(name: str) -> str:
+    """Sanitize a name to be safe as a filename component."""
+    return re.sub(r'[^a-zA-Z0-9_\-]', '_', name)
+
+
+def is_document(filename):
+    return filename.endswith('.json') and not filename.startswith('_')
+
+
+def atomic_write(path, text):
+    """Write a file through a temporary file in the same directory and a rename"""
+    folder = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(text)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def encode(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+
+
+def field_values(document, field):
+    """Scalar values of a dotted field, the elements of a list are indexed separately"""
+    value = document
+    for part in field.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return []
+        value = value[part]
+
+    values = value if isinstance(value, list) else [value]
+    return [v for v in values if v is None or isinstance(v, (str, int, float, bool))]
+
+
+def sort_key(value):
+    """Values of different types never compare equal: null < booleans < numbers < strings"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    return (3, value)
+
+
+def query_values(text):
+    """A value from a query string matches the text and, when it is JSON, the decoded value
+
+    `priority>=3` compares with the numbers, `date>=2024-01-01` with the strings.
+    """
+    values = [text]
+    try:
+        decoded = json.loads(text)
+    except ValueError:
+        return values
+    if decoded is None or isinstance(decoded, (str, int, float, bool)):
+        if sort_key(decoded) != sort_key(text):
+            values.append(decoded)
+    return values
+
+
+def parse_condition(text):
+    """"date>=2024-01-01" -> ("date", ">=", "2024-01-01"), ":" is the equality"""
+    match = CONDITION.match(text)
+    if match is None:
+        raise ValueError(f"Invalid condition: {text}")
+    return match.groups()
+
+
+class Index:
+    """Values of the indexed fields of a collection"""
+
+    def __init__(self, path, collection):
+        self.path = path
+        self.collection = collection
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.fields = []
+        # key -> [mtime_ns, {field: [values]}]
+        self.entries = {}
+        # field -> [(sort key, document key)] sorted, built on demand
+        self._ordered = {}
+        # Version of the collection at the last sync
+        self._synced = None
+        self._unsaved = 0
+
+    def _load(self):
+        if self.loaded:
+            return
+        try:
+            with open(self.path) as fp:
+                saved = json.load(fp)
+            self.fields = saved['fields']
+            self.entries = saved['entries']
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        self.loaded = True
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, encode({'fields': self.fields, 'entries': self.entries}))
+        self._unsaved = 0
+
+    def _set(self, key, mtime, document):
+        """Replace the entry of a document, `document` None removes it"""
+        previous = self.entries.pop(key, None)
+        if document is not None:
+            values = {field: field_values(document, field) for field in self.fields}
+            self.entries[key] = [mtime, values]
+
+        for field, ordered in self._ordered.items():
+            if previous is not None:
+                for value in previous[1].get(field, ()):
+                    pair = (sort_key(value), key)
+                    i = bisect.bisect_left(ordered, pair)
+                    if i < len(ordered) and ordered[i] == pair:
+                        del ordered[i]
+            if document is not None:
+                for value in values[field]:
+                    bisect.insort(ordered, (sort_key(value), key))
+
+        self._unsaved += 1
+
+    def _sync(self):
+        """Index the documents written or removed behind our back, caller holds the lock"""
+        self._load()
+        if not self.fields:
+            return
+        version = self.collection.refresh()
+        if version == self._synced:
+            return
+
+        mtimes = self.collection.mtimes()
+        for key, mtime in mtimes.items():
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                continue
+            try:
+                self._set(key, mtime, self.collection.read(key))
+            except (FileNotFoundError, ValueError):
+                continue
+
+        for key in self.entries.keys() - mtimes.keys():
+            self._set(key, None, None)
+
+        self._synced = version
+        # The saved index is a cache checked against the mtimes, it can lag behind
+        if self._unsaved >= SAVE_AFTER:
+            self._save()
+
+    def written(self, key, mtime, document, version):
+        """Index a document written by the store, `document` None for a removal
+
+        `version` is the version of the collection after the write.
+        """
+        with self.lock:
+            if not self.loaded or not self.fields:
+                # Picked up by the next sync, from its mtime
+                return
+            self._set(key, mtime, document)
+            if self._synced == version - 1:
+                self._synced = version
+
+    def declare(self, fields):
+        for field in fields:
+            if not re.fullmatch(FIELD, field):
+                raise ValueError(f"Invalid field: {field}")
+
+        with self.lock:
+            self._load()
+            if list(fields) != self.fields:
+                self.fields = list(fields)
+                self.entries = {}
+                self._ordered = {}
+                self._synced = None
+            self._sync()
+            self._save()
+            return {'fields': self.fields, 'documents': len(self.entries)}
+
+    def describe(self):
+        with self.lock:
+            self._sync()
+            return {'fields': self.fields, 'documents': len(self.entries)}
+
+    def _order(self, field):
+        ordered = self._ordered.get(field)
+        if ordered is None:
+            ordered = sorted(
+                (sort_key(value), key)
+                for key, (_, values) in self.entries.items()
+                for value in values.get(field, ())
+            )
+            self._ordered[field] = ordered
+        return ordered
+
+    def _match(self, field, op, text):
+        ordered = self._order(field)
+
+        def lower(bound):
+            return bisect.bisect_left(ordered, bound, key=lambda pair: pair[0])
+
+        def upper(bound):
+            return bisect.bisect_right(ordered, bound, key=lambda pair: pair[0])
+
+        matched = set()
+        for value in query_values(text):
+            bound = sort_key(value)
+            # Comparisons stay within the values of the same type
+            first, last = lower((bound[0],)), lower((bound[0] + 1,))
+
+            if op == ':':
+                lo, hi = lower(bound), upper(bound)
+            elif op == '>':
+                lo, hi = upper(bound), last
+            elif op == '>=':
+                lo, hi = lower(bound), last
+            elif op == '<':
+                lo, hi = first, lower(bound)
+            else:
+                lo, hi = first, upper(bound)
+
+            matched.update(key for _, key in ordered[lo:hi])
+        return matched
+
+    def query(self, conditions=(), sort=None, descending=False, limit=None):
+        """Keys of the documents matching all the (field, op, value) conditions
+
+        Sorted by key, or by the `sort` field (documents without it last).
+        """
+        with self.lock:
+            self._sync()
+
+            for field in [c[0] for c in conditions] + ([sort] if sort else []):
+                if field not in self.fields:
+                    raise ValueError(f"{field} is not indexed")
+
+            selected = None
+            for field, op, text in conditions:
+                matched = self._match(field, op, text)
+                selected = matched if selected is None else selected & matched
+
+            if selected is None:
+                selected = set(self.entries)
+
+            if sort is None:
+                found = sorted(selected, reverse=descending)
+                return found[:limit] if limit is not None else found
+
+            found = []
+            seen = set()
+            ordered = self._order(sort)
+            for _, key in (reversed(ordered) if descending else ordered):
+                if key in selected and key not in seen:
+                    seen.add(key)
+                    found.append(key)
+                    if limit is not None and len(found) >= limit:
+                        return found
+
+            found.extend(sorted(selected - seen))
+            return found[:limit] if limit is not None else found
+
+
+class Collection:
+    def __init__(self, folder, index_path=None):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.index = Index(index_path, self) if index_path else None
+        # key -> mtime_ns, None until the file is stat'ed
+        self.entries = {}
+        # key -> inode the mtime was read from
+        self.inodes = {}
+        self.mtime = None
+        self._sorted = None
+        # Bumped when the keys or their mtimes may have changed
+        self.version = 0
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.json')
+
+    def _folder_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        """Reload the keys if the directory changed, caller holds the lock"""
+        mtime = self._folder_mtime()
+        if mtime == self.mtime:
+            return
+
+        entries, inodes = {}, {}
+        if mtime is not None:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if is_document(entry.name):
+                        key = entry.name[:-len('.json')]
+                        inodes[key] = inode = entry.inode()
+                        # A file replaced by another process keeps its name, not its inode
+                        entries[key] = self.entries.get(key) if self.inodes.get(key) == inode else None
+
+        self.entries, self.inodes = entries, inodes
+        self.mtime = mtime
+        self._sorted = None
+        self.version += 1
+
+    def _written(self, key):
+        """Record a write made by this process, caller holds the lock
+
+        The directory mtime is left as it was: another process can add or replace
+        a document while we write, the next reload lists the directory again.
+        """
+        mtime = None
+        try:
+            stat = os.stat(self.path(key))
+            mtime = self.entries[key] = stat.st_mtime_ns
+            self.inodes[key] = stat.st_ino
+        except FileNotFoundError:
+            self.entries.pop(key, None)
+            self.inodes.pop(key, None)
+        self._sorted = None
+        self.version += 1
+        return mtime
+
+    def refresh(self):
+        """Reload the keys if the directory changed, returns the version"""
+        with self.lock:
+            self._refresh()
+            return self.version
+
+    def keys(self):
+        """Sorted keys of the collection"""
+        with self.lock:
+            self._refresh()
+            if self._sorted is None:
+                self._sorted = sorted(self.entries)
+            return self._sorted
+
+    def __contains__(self, key):
+        with self.lock:
+            self._refresh()
+            return key in self.entries
+
+    def mtimes(self, keys=None):
+        """{key: mtime_ns} of the documents, stat'ing the files not seen yet"""
+        with self.lock:
+            self._refresh()
+            keys = list(self.entries) if keys is None else [k for k in keys if k in self.entries]
+            missing = [key for key in keys if self.entries[key] is None]
+
+        found = {}
+        for key in missing:
+            try:
+                found[key] = os.stat(self.path(key))
+            except FileNotFoundError:
+                continue
+
+        with self.lock:
+            mtimes = {key: self.entries[key] for key in keys if self.entries.get(key) is not None}
+            for key, stat in found.items():
+                mtimes[key] = stat.st_mtime_ns
+                # Kept if it is still the file listed, a replaced one is stat'ed again
+                if key in self.entries and self.inodes.get(key) == stat.st_ino:
+                    self.entries[key] = stat.st_mtime_ns
+            return mtimes
+
+    def read_text(self, key):
+        with open(self.path(key)) as fp:
+            return fp.read()
+
+    def read(self, key):
+        return json.loads(self.read_text(key))
+
+    def write(self, key, document):
+        os.makedirs(self.folder, exist_ok=True)
+        text = encode(document)
+
+        with self.lock:
+            self._refresh()
+            atomic_write(self.path(key), text)
+            mtime = self._written(key)
+            version = self.version
+
+        if self.index is not None:
+            self.index.written(key, mtime, document, version)
+
+    def delete(self, key):
+        """False if the document did not exist"""
+        with self.lock:
+            self._refresh()
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                return False
+            self._written(key)
+            version = self.version
+
+        if self.index is not None:
+            self.index.written(key, None, None, version)
+        return True
+
+    def iter_documents(self, keys=None):
+        """(key, JSON text) of every document in key order, or of `keys` in their order"""
+        for key in self.keys() if keys is None else keys:
+            try:
+                yield key, self.read_text(key).strip()
+            except FileNotFoundError:
+                # Deleted since the listing
+                continue
+
+
+class JsonStore:
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def collection(self, name) -> Collection:
+        name = safe_name(name)
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                collection = Collection(
+                    os.path.join(self.root, name),
+                    os.path.join(self.root, INDEX_FOLDER, name + '.json'),
+                )
+                self.collections[name] = collection
+            return collection
+
+    def names(self):
+        if not os.path.isdir(self.root):
+            return []
+        with os.scandir(self.root) as it:
+            return [entry.name for entry in it if entry.is_dir() and not entry.name.startswith('_')]
@@ -0,0 +1,272 @@
+"""
+Perceptual hash index of the uploads, to find near duplicate images.
+
+Each image gets a 64 bits difference hash (dHash): the image is reduced to 9x8
+grey pixels and every bit tells if a pixel is brighter than its right neighbour.
+Re-encoded, resized or slightly edited copies of a photo end up within a few
+bits of each other; the hashes are searched by Hamming distance with a BK-tree.
+
+The hashes are a SQLite table shared by every worker process, with the size and
+mtime of every file: a rescan only hashes the files that changed. Each process
+keeps a BK-tree of the table, rebuilt when the version bumped by every write moved.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from PIL import Image
+
+from .imagecache import open_scaled
+from .syncdir import walk_files
+
+
+HASH_SIZE = 8
+DUPLICATE_THRESHOLD = 6
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+DERIVATIVE = re.compile(r'\.\d+w\.\w+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+def dhash(image, size=HASH_SIZE):
+    grey = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = grey.tobytes()
+
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def file_dhash(path):
+    with open_scaled(path, width=64, height=64) as image:
+        return dhash(image)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def is_indexed_image(filename):
+    """Production images only, the derivatives are resized copies of them"""
+    return filename.lower().endswith(IMAGE_EXTENSIONS) and not DERIVATIVE.search(filename)
+
+
+class BKTree:
+    """Metric tree over the Hamming distance, `search` only visits the branches that can match"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = (value, [item], {})
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value, threshold):
+        """[(distance, item)] of the items within `threshold` bits of `value`"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= threshold:
+                found.extend((distance, item) for item in node[1])
+
+            for edge, child in node[2].items():
+                if distance - threshold <= edge <= distance + threshold:
+                    stack.append(child)
+
+        found.sort()
+        return found
+
+
+class PerceptualIndex:
+    def __init__(self, path):
+        self.path = path
+        # One connection per thread and process
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # BK-tree of the index at `_version`, rebuilt once another writer changed it
+        self._tree = None
+        self._version = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.transaction() as db:
+            for statement in filter(str.strip, SCHEMA.split(";")):
+                db.execute(statement)
+            db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            self._import_json(db)
+
+    def _import_json(self, db):
+        """Hashes saved as `phash.json`, before the table"""
+        legacy = f"{os.path.splitext(self.path)[0]}.json"
+        try:
+            with open(legacy) as fp:
+                entries = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        db.executemany(
+            "INSERT OR IGNORE INTO hashes (name, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+            [(name, *entry) for name, entry in entries.items()],
+        )
+        self._bump(db)
+        os.replace(legacy, f"{legacy}.imported")
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None or self.local.pid != os.getpid():
+            # Autocommit, transactions are explicit; writers wait for each other
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _bump(db):
+        """New version of the index, readers rebuild their tree"""
+        (version,) = db.execute(
+            "UPDATE meta SET value = value + 1 WHERE key = 'version' RETURNING value"
+        ).fetchone()
+        return version
+
+    @property
+    def entries(self):
+        """{name: (size, mtime_ns, hash)} of every indexed image"""
+        rows = self.connection().execute("SELECT name, size, mtime_ns, hash FROM hashes")
+        return {name: (size, mtime_ns, int(value, 16)) for name, size, mtime_ns, value in rows}
+
+    @property
+    def tree(self):
+        db = self.connection()
+        (version,) = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        with self.lock:
+            if self._tree is None or self._version != version:
+                tree = BKTree()
+                for name, value in db.execute("SELECT name, hash FROM hashes"):
+                    tree.add(int(value, 16), name)
+                # The writes after the version read are seen again on the next call
+                self._tree, self._version = tree, version
+            return self._tree
+
+    def add(self, name, value, stat=None):
+        with self.transaction() as db:
+            previous = db.execute("SELECT 1 FROM hashes WHERE name = ?", (name,)).fetchone()
+            db.execute(
+                "INSERT INTO hashes (name, size, mtime_ns, hash) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, hash = excluded.hash",
+                (name, stat.st_size if stat else 0, stat.st_mtime_ns if stat else 0, f"{value:016x}"),
+            )
+            version = self._bump(db)
+
+        with self.lock:
+            # Our write follows the tree we have: extend it. BK-trees do not support removal
+            if previous is None and self._tree is not None and self._version == version - 1:
+                self._tree.add(value, name)
+                self._version = version
+
+    def similar(self, value, threshold=DUPLICATE_THRESHOLD, exclude=None):
+        return [
+            {"path": name, "distance": distance}
+            for distance, name in self.tree.search(value, threshold)
+            if name != exclude
+        ]
+
+    def scan(self, root):
+        """Hash the new and modified images of `root`, forget the deleted ones"""
+        entries = self.entries
+        seen = set()
+        hashed = 0
+
+        for name, stat in walk_files(root):
+            if not is_indexed_image(name):
+                continue
+            seen.add(name)
+
+            entry = entries.get(name)
+            if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                continue
+
+            try:
+                self.add(name, file_dhash(os.path.join(root, name)), stat)
+                hashed += 1
+            except (OSError, Image.DecompressionBombError):
+                continue
+
+        removed = entries.keys() - seen
+        if removed:
+            with self.transaction() as db:
+                db.executemany("DELETE FROM hashes WHERE name = ?", [(name,) for name in removed])
+                self._bump(db)
+
+        return {"images": len(seen), "hashed": hashed, "removed": len(removed)}
+
+    def duplicates(self, threshold=DUPLICATE_THRESHOLD):
+        """Groups of images within `threshold` bits of each other"""
+        entries = {name: entry[2] for name, entry in self.entries.items()}
+
+        tree = self.tree
+        parent = {}
+
+        def find(name):
+            while parent.get(name, name) != name:
+                name = parent[name]
+            return name
+
+        pairs = []
+        for name, value in entries.items():
+            for distance, other in tree.search(value, threshold):
+                if other <= name:
+                    continue
+                pairs.append((name, other, distance))
+                parent[find(other)] = find(name)
+
+        groups = {}
+        for a, b, distance in pairs:
+            group = groups.setdefault(find(a), {"images": set(), "pairs": []})
+            group["images"].update((a, b))
+            group["pairs"].append({"a": a, "b": b, "distance": distance})
+
+        report = [
+            {"images": sorted(group["images"]), "pairs": group["pairs"]}
+            for group in groups.values()
+        ]
+        report.sort(key=lambda g: (-len(g["images"]), g["images"][0]))
+        return report
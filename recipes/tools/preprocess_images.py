@@ -1,28 +1,46 @@
 #!/usr/bin/env python3
 """
-Script to preprocess images in the database and clean up orphaned images.
+Script to reprocess the images of the database and clean up orphaned images.
+
+    python -m recipes.tools.preprocess_images [--workers N] [--force] [--dry-run]
 
 This script will:
-1. Go through all recipes in the database and process their images using save_production_image
-2. Iterate through the upload folder and remove images that don't have their path in the database
+1. Stream the image references of the recipes from the database
+2. Regenerate the production image and the responsive derivatives of every image
+   on a process pool; images whose source and settings did not change since the
+   last run are skipped
+3. Remove the files of the recipe folders that no reference points to
+4. Remove the references to images that do not exist anymore
+
+Progress is saved in a manifest as images complete, an interrupted run resumes
+where it stopped.
 """
 
-import os
-import sys
 import argparse
-from pathlib import Path
+import hashlib
+import json
+import os
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from PIL import Image
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-
-# Add the server directory to the path so we can import models
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'server'))
-
-from models import Base, Recipe, ComposedRecipe
-from .images import centercrop_resize_image
+from sqlalchemy.orm.attributes import flag_modified
+
+from ..server.models import Recipe
+from .blobstore import BlobStore
+from .images import (
+    centercrop_resize_image,
+    make_derivatives,
+    DERIVATIVE_WIDTHS,
+    DERIVATIVE_FORMATS,
+    DERIVATIVE_QUALITY,
+    MAX_PRODUCTION_WIDTH,
+)
+from .syncdir import file_hash, load_manifest, save_manifest, walk_files
 
 # Configuration
 HERE = os.path.dirname(os.path.abspath(__file__))
@@ -32,6 +50,9 @@ STATIC_FOLDER_DEFAULT = os.path.join(ROOT, 'static')
 STATIC_FOLDER = os.path.abspath(os.getenv("FLASK_STATIC", STATIC_FOLDER_DEFAULT))
 STATIC_UPLOAD_FOLDER = os.path.join(STATIC_FOLDER, 'uploads')
 ORIGINALS_FOLDER = '/mnt/xshare/projects/recipes/originals'
+LOCAL_ORIGINALS_FOLDER = os.path.join(STATIC_FOLDER, 'originals')
+BLOB_FOLDER = os.path.join(STATIC_FOLDER, 'blobs')
+MANIFEST = os.path.join(STATIC_FOLDER, '.preprocess-manifest.json')
 
 # Database configuration
 DATABASE_URI = f"sqlite:///{STATIC_FOLDER}/database.db"
@@ -39,235 +60,231 @@ DATABASE_URI = f"sqlite:///{STATIC_FOLDER}/database.db"
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+# Recipe uploads live in `<id>_<title>/`, orphans are only looked for there
+RECIPE_FOLDER_PREFIX = tuple(str(i) for i in range(10))
 
-def image_found(image_path):
-    filename = image_path.replace('uploads/', '')
+# Bump to force a full reprocessing when the image code changes
+SETTINGS = {
+    "version": 1,
+    "widths": list(DERIVATIVE_WIDTHS),
+    "formats": list(DERIVATIVE_FORMATS),
+    "quality": DERIVATIVE_QUALITY,
+    "max_width": MAX_PRODUCTION_WIDTH,
+}
 
-    # Split namespace and extension
-    if '.' in filename:
-        namespace, extension = filename.rsplit('.', 1)
-    else:
-        namespace = filename
-        extension = 'jpg'  # Default extension
-
-    return os.path.exists(os.path.join(STATIC_UPLOAD_FOLDER, filename))
-
-
-def extract_all_image_paths(session):
-    """Extract all image paths from the database and identify missing images"""
-    image_paths = []
-    missing_image_objects = []  # List of (object, field_name, index) tuples
-
-    # Get images from Recipe table
-    recipes = session.query(Recipe).all()
-    for recipe in recipes:
-        # Check recipe images
-        if recipe.images:
-            for i, image_path in enumerate(recipe.images):
-                if image_path:
-                    # Remove leading slash if present
-                    clean_path = image_path.lstrip('/')
-                    image_paths.append(clean_path)
-
-                    # Check if image exists
-                    if not image_found(clean_path):
-                        missing_image_objects.append((recipe, 'images', i))
-
-        # Check recipe instructions/steps for images
-        if recipe.instructions:
-            for i, instruction in enumerate(recipe.instructions):
-                if isinstance(instruction, dict) and 'image' in instruction:
-                    image_path = instruction['image']
-                    if image_path:
-                        # Remove leading slash if present
-                        clean_path = image_path.lstrip('/')
-                        image_paths.append(clean_path)
-
-                        # Check if image exists
-                        if not image_found(clean_path):
-                            missing_image_objects.append((recipe, 'instructions', i))
-
-    # Get images from ComposedRecipe table
-    composed_recipes = session.query(ComposedRecipe).all()
-    for recipe in composed_recipes:
-        if recipe.images:
-            for i, image_path in enumerate(recipe.images):
-                if image_path:
-                    # Remove leading slash if present
-                    clean_path = image_path.lstrip('/')
-                    image_paths.append(clean_path)
-
-                    # Check if image exists
-                    if not image_found(clean_path):
-                        missing_image_objects.append((recipe, 'images', i))
-
-    return image_paths, missing_image_objects
-
-
-def get_all_files_in_upload_folder():
-    """Get all files in the upload folder"""
-    files = set()
-    if os.path.exists(STATIC_UPLOAD_FOLDER):
-        for root, dirs, filenames in os.walk(STATIC_UPLOAD_FOLDER):
-            for filename in filenames:
-                # Get relative path from upload folder
-                full_path = os.path.join(root, filename)
-                relative_path = os.path.relpath(full_path, STATIC_UPLOAD_FOLDER)
-                files.add(relative_path)
-    return files
-
-
-def process_image_path(image_path):
-    """Process a single image path"""
-    try:
-        # The image path inside the database is "/uploads/{filename}"
-        filename = image_path.replace('uploads/', '')
-
-        # Split namespace and extension
-        if '.' in filename:
-            namespace, extension = filename.rsplit('.', 1)
-        else:
-            namespace = filename
-            extension = 'jpg'  # Default extension
-
-        file_path = os.path.join(STATIC_UPLOAD_FOLDER, filename)
-
-        # Check if file exists in upload folder
-        if os.path.exists(file_path):
-            # Move the file to the original folder if it doesn't exist there
-            original_dest = os.path.join(ORIGINALS_FOLDER, filename)
-
-            if not os.path.exists(original_dest):
-                os.makedirs(os.path.dirname(original_dest), exist_ok=True)
-                shutil.copy2(file_path, original_dest)
-
-            # Process the image
-            image = Image.open(file_path)
-            result_path = centercrop_resize_image(STATIC_UPLOAD_FOLDER, image, namespace, extension)
-
-            return True, result_path
-        else:
-            return False, f"File not found: {file_path}"
-
-    except Exception as e:
-        return False, f"Error processing {image_path}: {e}"
-
-
-def process_database_images(session):
-    """Process all images in the database"""
-    print("Processing images in database...")
-
-    # Extract all image paths
-    image_paths, missing_image_objects = extract_all_image_paths(session)
-    print(f"Found {len(image_paths)} image paths in database")
-    print(f"Found {len(missing_image_objects)} missing image references")
-
-    # Remove duplicates while preserving order
-    unique_paths = []
-    seen = set()
-    for path in image_paths:
-        if path not in seen:
-            unique_paths.append(path)
-            seen.add(path)
-
-    print(f"Processing {len(unique_paths)} unique image paths...")
-
-    # Process each image
-    processed_count = 0
-    error_count = 0
-
-    for image_path in unique_paths:
-        success, result = process_image_path(image_path)
-        if success:
-            processed_count += 1
-            print(f"Processed: {result}")
-        else:
-            error_count += 1
-            print(f"Failed: {result}")
-
-    print(f"Processing complete. Processed: {processed_count}, Errors: {error_count}")
-
-    return missing_image_objects
-
-
-def remove_missing_image_references(missing_image_objects, session, dry_run=False):
-    """Remove references to missing images from database objects"""
-    print("Removing missing image references from database...")
 
-    removed_count = 0
-    modified_objects = set()  # Track which objects were modified
+def settings_hash(settings=SETTINGS):
+    encoded = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def originals_folder():
+    if os.path.exists(ORIGINALS_FOLDER):
+        return ORIGINALS_FOLDER
+    return LOCAL_ORIGINALS_FOLDER
+
+
+def upload_filename(image_path):
+    """The image path inside the database is "/uploads/{filename}" """
+    return image_path.lstrip('/').replace('uploads/', '', 1)
+
+
+def split_namespace(filename):
+    if '.' in filename:
+        return filename.rsplit('.', 1)
+    return filename, 'jpg'
+
+
+def namespace_stem(filename):
+    """`a/preview_1.640w.webp` and `a/preview_1.derivatives.json` belong to `a/preview_1`"""
+    folder, name = os.path.split(filename)
+    return os.path.join(folder, name.split('.', 1)[0])
+
+
+def image_references(session, batch_size=200):
+    """Stream (recipe_id, field, index, path) of every image referenced by a recipe"""
+    query = (
+        session.query(Recipe._id, Recipe.images, Recipe.instructions)
+        .order_by(Recipe._id)
+        .yield_per(batch_size)
+    )
+
+    for recipe_id, images, instructions in query:
+        for i, image_path in enumerate(images or []):
+            if image_path:
+                yield recipe_id, 'images', i, image_path
+
+        for i, instruction in enumerate(instructions or []):
+            if isinstance(instruction, dict) and instruction.get('image'):
+                yield recipe_id, 'instructions', i, instruction['image']
+
+
+def find_source(filename):
+    """Original of an upload, the upload itself is copied to the originals if there is none"""
+    namespace, extension = split_namespace(filename)
+    originals = originals_folder()
+
+    for ext in [extension] + sorted(ALLOWED_EXTENSIONS - {extension}):
+        candidate = os.path.join(originals, f"{namespace}.{ext}")
+        if os.path.exists(candidate):
+            return candidate
+
+    upload = os.path.join(STATIC_UPLOAD_FOLDER, filename)
+    if not os.path.exists(upload):
+        return None
+
+    original = os.path.join(originals, filename)
+    os.makedirs(os.path.dirname(original), exist_ok=True)
+    shutil.copy2(upload, original)
+    return original
+
+
+def source_digest(source, previous):
+    """Reuse the previous hash when the size and mtime of the source did not change"""
+    stat = os.stat(source)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime_ns:
+        return previous["source"], stat
+    return file_hash(source), stat
+
+
+def process_image(namespace, extension, source, root, settings):
+    """Worker: production image and derivatives of one namespace, returns the files written"""
+    with Image.open(source) as image:
+        image.load()
+        production = centercrop_resize_image(root, image, namespace, extension)
+        manifest = make_derivatives(
+            root,
+            image,
+            namespace,
+            widths=settings["widths"],
+            formats=settings["formats"],
+            quality=settings["quality"],
+        )
+
+    return [production] + [d["path"] for d in manifest["derivatives"]]
+
+
+def reprocess_images(references, workers=None, force=False, dry_run=False, store=None, checkpoint=50):
+    """Reprocess the unique images of `references`, returns the set of referenced filenames"""
+    manifest = load_manifest(MANIFEST)
+    settings = settings_hash()
+
+    referenced = set()
+    missing = []
+    skipped = 0
+    processed = 0
+    errors = 0
+    start = time.perf_counter()
+
+    def report():
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed > 0 else 0
+        print(f"  {processed} processed, {skipped} unchanged, {errors} errors, {rate:.1f} images/s")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+
+        for recipe_id, field, index, image_path in references:
+            filename = upload_filename(image_path)
+            if not os.path.exists(os.path.join(STATIC_UPLOAD_FOLDER, filename)):
+                missing.append((recipe_id, field, index))
+                continue
+
+            if filename in referenced:
+                continue
+            referenced.add(filename)
+
+            if dry_run:
+                continue
+
+            namespace, extension = split_namespace(filename)
+            previous = manifest.get(namespace)
+
+            source = find_source(filename)
+            digest, stat = source_digest(source, previous)
+            entry = {"source": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns, "settings": settings}
+
+            up_to_date = (
+                not force
+                and previous is not None
+                and previous.get("source") == digest
+                and previous.get("settings") == settings
+                and all(os.path.exists(os.path.join(STATIC_UPLOAD_FOLDER, p)) for p in previous.get("outputs", []))
+            )
+            if up_to_date:
+                skipped += 1
+                continue
+
+            future = executor.submit(process_image, namespace, extension, source, STATIC_UPLOAD_FOLDER, SETTINGS)
+            futures[future] = (namespace, entry)
+
+        print(f"Found {len(referenced)} unique images, {len(missing)} missing, {len(futures)} to process")
 
-    for obj, field_name, index in missing_image_objects:
         try:
-            if field_name == 'images':
-                # Handle recipe images array
-                if obj.images and index < len(obj.images):
-                    image_path = obj.images[index]
-                    if not dry_run:
-                        obj.images.pop(index)
-                        # Explicitly mark the field as modified
-                        from sqlalchemy.orm.attributes import flag_modified
-                        flag_modified(obj, 'images')
-                        modified_objects.add(obj)
-                        print(f"Removed missing image reference: {image_path}")
-                    else:
-                        print(f"Would remove missing image reference: {image_path}")
-                    removed_count += 1
-
-            elif field_name == 'instructions':
-                # Handle recipe instruction image
-                if obj.instructions and index < len(obj.instructions):
-                    instruction = obj.instructions[index]
-                    if isinstance(instruction, dict) and 'image' in instruction:
-                        image_path = instruction['image']
-                        if not dry_run:
-                            instruction['image'] = None
-                            # Explicitly mark the field as modified
-                            from sqlalchemy.orm.attributes import flag_modified
-                            flag_modified(obj, 'instructions')
-                            modified_objects.add(obj)
-                            print(f"Removed missing image reference from step: {image_path}")
-                        else:
-                            print(f"Would remove missing image reference from step: {image_path}")
-                        removed_count += 1
+            for future in as_completed(futures):
+                namespace, entry = futures[future]
+                try:
+                    outputs = future.result()
+                except Exception as err:
+                    errors += 1
+                    print(f"Failed: {namespace}: {err}")
+                    continue
+
+                if store is not None:
+                    for output in outputs:
+                        store.adopt(os.path.join(STATIC_UPLOAD_FOLDER, output))
+
+                manifest[namespace] = dict(entry, outputs=outputs)
+                processed += 1
+
+                # Checkpoint so an interrupted run does not redo the finished images
+                if processed % checkpoint == 0:
+                    save_manifest(MANIFEST, manifest)
+                    report()
+        except KeyboardInterrupt:
+            print("Interrupted, progress saved; run again to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            if not dry_run:
+                save_manifest(MANIFEST, manifest)
 
-        except Exception as e:
-            print(f"Error removing missing image reference: {e}")
+    print("Processing complete.")
+    report()
+    return referenced, missing
 
-    if dry_run:
-        print(f"Would remove {removed_count} missing image references")
-    else:
-        print(f"Removed {removed_count} missing image references")
-        print(f"Modified {len(modified_objects)} database objects")
 
-    return removed_count
+def find_orphaned_images(referenced):
+    """Files of the recipe folders that belong to no referenced image"""
+    stems = {namespace_stem(filename) for filename in referenced}
 
+    orphans = []
+    if not os.path.exists(STATIC_UPLOAD_FOLDER):
+        return orphans
 
-def cleanup_orphaned_images(session, dry_run=False):
-    """Remove images in upload folder that don't exist in database"""
-    print("Cleaning up orphaned images...")
+    with os.scandir(STATIC_UPLOAD_FOLDER) as entries:
+        folders = [e.name for e in entries if e.is_dir() and e.name.startswith(RECIPE_FOLDER_PREFIX)]
 
-    # Get all image paths from database
-    db_image_paths = set(extract_all_image_paths(session)[0])  # Only get the paths, not the missing objects
+    for folder in folders:
+        for filename, _ in walk_files(STATIC_UPLOAD_FOLDER, folder):
+            if namespace_stem(filename) not in stems:
+                orphans.append(filename)
 
-    # Get all files in upload folder
-    upload_files = get_all_files_in_upload_folder()
+    return sorted(orphans)
 
-    # Find orphaned files
-    orphaned_files = set()
-    for file_path in upload_files:
-        # Convert file path to database path format
-        db_path = f"uploads/{file_path}"
-        if db_path not in db_image_paths:
-            orphaned_files.add(file_path)
 
-    # Remove orphaned files
+def cleanup_orphaned_images(referenced, dry_run=False, store=None):
+    """Remove images in upload folder that don't exist in database"""
+    print("Cleaning up orphaned images...")
+
     removed_count = 0
-    for orphaned_file in orphaned_files:
+    for orphaned_file in find_orphaned_images(referenced):
+        full_path = os.path.join(STATIC_UPLOAD_FOLDER, orphaned_file)
         try:
-            full_path = os.path.join(STATIC_UPLOAD_FOLDER, orphaned_file)
             if not dry_run:
                 os.remove(full_path)
+                if store is not None:
+                    store.release(full_path)
                 print(f"Removed orphaned file: {orphaned_file}")
             else:
                 print(f"Would remove orphaned file: {orphaned_file}")
@@ -281,34 +298,73 @@ def cleanup_orphaned_images(session, dry_run=False):
         print(f"Cleanup complete. Removed {removed_count} orphaned files.")
 
 
+def remove_missing_image_references(missing, session, dry_run=False):
+    """Remove references to missing images from database objects"""
+    print("Removing missing image references from database...")
+
+    by_recipe = {}
+    for recipe_id, field_name, index in missing:
+        by_recipe.setdefault(recipe_id, []).append((field_name, index))
+
+    removed_count = 0
+    for recipe in session.query(Recipe).filter(Recipe._id.in_(by_recipe)).all():
+        # Pop from the end so the remaining indices stay valid
+        for field_name, index in sorted(by_recipe[recipe._id], key=lambda r: r[1], reverse=True):
+            if field_name == 'images':
+                image_path = recipe.images[index]
+                if not dry_run:
+                    recipe.images.pop(index)
+                    flag_modified(recipe, 'images')
+
+            else:
+                image_path = recipe.instructions[index]['image']
+                if not dry_run:
+                    recipe.instructions[index]['image'] = None
+                    flag_modified(recipe, 'instructions')
+
+            print(f"{'Would remove' if dry_run else 'Removed'} missing image reference: {image_path}")
+            removed_count += 1
+
+    print(f"{'Would remove' if dry_run else 'Removed'} {removed_count} missing image references")
+    return removed_count
+
+
 def main():
     """Main function to process images and clean up orphaned files"""
     parser = argparse.ArgumentParser(description='Preprocess images in database and clean up orphaned images')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done without actually doing it')
+    parser.add_argument('--force', action='store_true', help='Reprocess every image, ignoring the manifest')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: cpu count)')
     args = parser.parse_args()
 
     print("Starting image preprocessing and cleanup...")
     print(f"Static folder: {STATIC_FOLDER}")
     print(f"Upload folder: {STATIC_UPLOAD_FOLDER}")
-    print(f"Originals folder: {ORIGINALS_FOLDER}")
+    print(f"Originals folder: {originals_folder()}")
 
     if args.dry_run:
         print("DRY RUN MODE - No files will be modified")
 
+    store = BlobStore(BLOB_FOLDER) if not args.dry_run else None
+
     # Create database engine and session
     engine = create_engine(DATABASE_URI)
     Session = sessionmaker(bind=engine)
 
     with Session() as session:
-        # Process images in database and get missing image objects
-        missing_image_objects = process_database_images(session)
+        referenced, missing = reprocess_images(
+            image_references(session),
+            workers=args.workers,
+            force=args.force,
+            dry_run=args.dry_run,
+            store=store,
+        )
 
-        # Clean up orphaned images
-        cleanup_orphaned_images(session, dry_run=args.dry_run)
+        cleanup_orphaned_images(referenced, dry_run=args.dry_run, store=store)
 
         # Remove missing image references
-        if missing_image_objects:
-            remove_missing_image_references(missing_image_objects, session, dry_run=args.dry_run)
+        if missing:
+            remove_missing_image_references(missing, session, dry_run=args.dry_run)
 
             # Commit changes if not dry run
             if not args.dry_run:
@@ -0,0 +1,332 @@
+"""
+Recurrence rules of the calendar events, a subset of the iCalendar RRULE.
+
+    FREQ=DAILY|WEEKLY|MONTHLY|YEARLY
+    INTERVAL=<n>
+    COUNT=<n> or UNTIL=<YYYYMMDD[THHMMSS[Z]]>
+    BYDAY=MO,WE or, for monthly and yearly rules, 2TU,-1FR (second Tuesday, last Friday)
+    BYMONTHDAY=1,15,-1
+    BYMONTH=1,7
+
+As in RFC 5545 a day must match both BYDAY and BYMONTHDAY (BYDAY=FR;BYMONTHDAY=13
+is every Friday the 13th). A yearly rule without BYMONTH spans the whole year:
+BYDAY=MO is every Monday, BYDAY=20MO the 20th Monday of the year, BYMONTHDAY=1
+the first of every month.
+
+Occurrences keep the time of day of the first event. A series is never stored as
+rows: `expand` computes the occurrences overlapping a window, starting from the
+first period that can reach it, and caches the result per rule and window.
+"""
+from __future__ import annotations
+
+import calendar
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# A rule without COUNT nor UNTIL is expanded at most this many times per window
+MAX_OCCURRENCES = 5000
+
+# The Gregorian calendar repeats every 400 years: a rule without occurrence for
+# that long (times its interval) never matches again
+CALENDAR_CYCLE_DAYS = 146097
+
+# Longest month of each month, leap years included
+MONTH_LENGTHS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def naive_utc(moment):
+    """Events are stored as naive UTC datetimes"""
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_datetime(text):
+    text = text.rstrip("Z")
+    if "T" in text:
+        return datetime.strptime(text, "%Y%m%dT%H%M%S")
+    return datetime.strptime(text, "%Y%m%d").replace(hour=23, minute=59, second=59)
+
+
+def _parse_byday(value):
+    """"2TU" -> (2, 1), "FR" -> (None, 4)"""
+    day = value[-2:].upper()
+    if day not in WEEKDAYS:
+        raise ValueError(f"Invalid weekday: {value}")
+    ordinal = int(value[:-2]) if value[:-2] else None
+    if ordinal == 0:
+        raise ValueError(f"Invalid weekday: {value}")
+    return ordinal, WEEKDAYS.index(day)
+
+
+def _weekday_days(first, length, byday):
+    """Days of the `length` days from `first` matched by BYDAY, ordinals count within them"""
+    offsets = set()
+    for ordinal, weekday in byday:
+        matches = range((weekday - first.weekday()) % 7, length, 7)
+        if ordinal is None:
+            offsets.update(matches)
+        elif -len(matches) <= ordinal <= len(matches):
+            offsets.add(matches[ordinal - 1 if ordinal > 0 else ordinal])
+    return {first + timedelta(days=offset) for offset in offsets}
+
+
+def _monthday_days(year, month, bymonthday):
+    """Days of a month matched by BYMONTHDAY, negative days count from the end"""
+    length = calendar.monthrange(year, month)[1]
+    days = set()
+    for day in bymonthday:
+        day = day if day > 0 else length + day + 1
+        if 1 <= day <= length:
+            days.add(date(year, month, day))
+    return days
+
+
+def _month_days(year, month, byday, bymonthday, default_day):
+    """Days of a month matched by the BYDAY/BYMONTHDAY parts, both must match when both are set"""
+    length = calendar.monthrange(year, month)[1]
+
+    if byday and bymonthday:
+        days = _weekday_days(date(year, month, 1), length, byday) & _monthday_days(year, month, bymonthday)
+    elif byday:
+        days = _weekday_days(date(year, month, 1), length, byday)
+    elif bymonthday:
+        days = _monthday_days(year, month, bymonthday)
+    elif default_day <= length:
+        # Like iCalendar, a monthly event on the 31st skips the shorter months
+        days = {date(year, month, default_day)}
+    else:
+        days = set()
+
+    return sorted(days)
+
+
+def _year_days(year, byday, bymonthday):
+    """Days of a year matched by BYDAY, ordinals count within the year, and by BYMONTHDAY"""
+    length = 366 if calendar.isleap(year) else 365
+    days = _weekday_days(date(year, 1, 1), length, byday)
+    if bymonthday:
+        days &= set().union(*(_monthday_days(year, month, bymonthday) for month in range(1, 13)))
+    return sorted(days)
+
+
+class RRule:
+    def __init__(self, freq, interval=1, count=None, until=None, byday=(), bymonthday=(), bymonth=()):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"Unsupported frequency: {freq}")
+        if interval < 1:
+            raise ValueError("INTERVAL must be positive")
+        if count is not None and until is not None:
+            raise ValueError("COUNT and UNTIL are exclusive")
+
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = tuple(byday)
+        self.bymonthday = tuple(bymonthday)
+        self.bymonth = tuple(bymonth)
+
+        if freq in ("DAILY", "WEEKLY") and any(ordinal is not None for ordinal, _ in self.byday):
+            raise ValueError("Numbered weekdays need a MONTHLY or YEARLY frequency")
+        if any(not 1 <= month <= 12 for month in self.bymonth):
+            raise ValueError("BYMONTH must be between 1 and 12")
+        if any(not 1 <= abs(day) <= 31 for day in self.bymonthday):
+            raise ValueError("BYMONTHDAY must be between 1 and 31, or -31 and -1")
+
+        longest = max(MONTH_LENGTHS[month - 1] for month in self.bymonth or range(1, 13))
+        if self.bymonthday and all(abs(day) > longest for day in self.bymonthday):
+            raise ValueError("BYMONTHDAY does not exist in the months of BYMONTH")
+
+    @staticmethod
+    def parse(text):
+        parts = {}
+        for item in text.strip().removeprefix("RRULE:").split(";"):
+            if not item:
+                continue
+            key, _, value = item.partition("=")
+            parts[key.strip().upper()] = value.strip()
+
+        def numbers(key):
+            return [int(v) for v in parts[key].split(",")] if key in parts else []
+
+        try:
+            return RRule(
+                freq=parts.get("FREQ", "").upper(),
+                interval=int(parts.get("INTERVAL", 1)),
+                count=int(parts["COUNT"]) if "COUNT" in parts else None,
+                until=parse_datetime(parts["UNTIL"]) if "UNTIL" in parts else None,
+                byday=[_parse_byday(v) for v in parts["BYDAY"].split(",")] if "BYDAY" in parts else [],
+                bymonthday=numbers("BYMONTHDAY"),
+                bymonth=numbers("BYMONTH"),
+            )
+        except (KeyError, IndexError) as err:
+            raise ValueError(f"Invalid recurrence rule: {text}") from err
+
+    def __str__(self):
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until:%Y%m%dT%H%M%S}Z")
+        if self.byday:
+            days = [f"{ordinal or ''}{WEEKDAYS[weekday]}" for ordinal, weekday in self.byday]
+            parts.append(f"BYDAY={','.join(days)}")
+        if self.bymonthday:
+            parts.append(f"BYMONTHDAY={','.join(map(str, self.bymonthday))}")
+        if self.bymonth:
+            parts.append(f"BYMONTH={','.join(map(str, self.bymonth))}")
+        return ";".join(parts)
+
+    #
+    # Periods: the day, week, month or year number k of the series
+    #
+    def _period_of(self, dtstart, moment):
+        """Index of the period containing `moment`"""
+        if self.freq == "DAILY":
+            steps = (moment.date() - dtstart.date()).days
+        elif self.freq == "WEEKLY":
+            steps = (moment.date() - dtstart.date()).days + dtstart.weekday()
+            steps //= 7
+        elif self.freq == "MONTHLY":
+            steps = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+        else:
+            steps = moment.year - dtstart.year
+        return steps // self.interval
+
+    def _period_days(self, dtstart, k):
+        """Days of the period k matched by the rule, in order"""
+        start = dtstart.date()
+        steps = k * self.interval
+
+        if self.freq == "DAILY":
+            day = start + timedelta(days=steps)
+            days = [day]
+            if self.byday:
+                days = [d for d in days if d.weekday() in {w for _, w in self.byday}]
+            if self.bymonthday:
+                days = [d for d in days if d in _monthday_days(d.year, d.month, self.bymonthday)]
+
+        elif self.freq == "WEEKLY":
+            monday = start - timedelta(days=start.weekday()) + timedelta(weeks=steps)
+            weekdays = sorted({w for _, w in self.byday}) or [start.weekday()]
+            days = [monday + timedelta(days=w) for w in weekdays]
+
+        elif self.freq == "MONTHLY":
+            year, month = divmod(start.month - 1 + steps, 12)
+            days = _month_days(start.year + year, month + 1, self.byday, self.bymonthday, start.day)
+
+        else:
+            # RFC 5545: BYMONTH selects the months, ordinals then count within them;
+            # without it BYDAY spans the whole year and BYMONTHDAY every month
+            year = start.year + steps
+            if self.bymonth:
+                days = []
+                for month in sorted(self.bymonth):
+                    days.extend(_month_days(year, month, self.byday, self.bymonthday, start.day))
+            elif self.byday:
+                days = _year_days(year, self.byday, self.bymonthday)
+            elif self.bymonthday:
+                days = []
+                for month in range(1, 13):
+                    days.extend(_month_days(year, month, (), self.bymonthday, start.day))
+            else:
+                days = _month_days(year, start.month, (), (), start.day)
+            return days
+
+        if self.bymonth:
+            days = [d for d in days if d.month in self.bymonth]
+        return days
+
+    def _period_start(self, dtstart, k):
+        start = dtstart.date()
+        steps = k * self.interval
+        if self.freq == "DAILY":
+            return start + timedelta(days=steps)
+        if self.freq == "WEEKLY":
+            return start - timedelta(days=start.weekday()) + timedelta(weeks=steps)
+        if self.freq == "MONTHLY":
+            year, month = divmod(start.month - 1 + steps, 12)
+            return date(start.year + year, month + 1, 1)
+        return date(start.year + steps, 1, 1)
+
+    def occurrences(self, dtstart, after=None, before=None):
+        """Start times of the occurrences, from the first one starting at or after `after`
+
+        Without COUNT the periods before `after` are skipped arithmetically; with
+        COUNT they have to be walked to know how many occurrences were used.
+        Raises ValueError when the rule stops matching before its end.
+        """
+        clock = dtstart.time()
+        k = 0
+        if after is not None and self.count is None:
+            k = max(self._period_of(dtstart, after) - 1, 0)
+
+        produced = 0
+        last = dtstart.date()
+        while True:
+            try:
+                start = self._period_start(dtstart, k)
+                days = self._period_days(dtstart, k)
+            except (OverflowError, ValueError) as err:
+                raise ValueError(f"No occurrence of {self} before {date.max}") from err
+
+            if before is not None and datetime.combine(start, time()) >= before:
+                return
+            if self.until is not None and datetime.combine(start, time()) > self.until:
+                return
+            if (start - last).days > CALENDAR_CYCLE_DAYS * self.interval:
+                raise ValueError(f"{self} never matches after {last}")
+
+            for day in days:
+                moment = datetime.combine(day, clock)
+                if moment < dtstart:
+                    continue
+                if self.until is not None and moment > self.until:
+                    return
+                if before is not None and moment >= before:
+                    return
+
+                produced += 1
+                last = day
+                if after is None or moment >= after:
+                    yield moment
+                if self.count is not None and produced >= self.count:
+                    return
+            k += 1
+
+    def last_occurrence(self, dtstart):
+        """Start of the last occurrence, None for a series without end"""
+        if self.count is None and self.until is None:
+            return None
+
+        last = None
+        for last in self.occurrences(dtstart):
+            pass
+        return last
+
+
+@lru_cache(maxsize=512)
+def _expand(rule, dtstart, duration, start, end):
+    occurrences = []
+    for moment in RRule.parse(rule).occurrences(dtstart, after=start - duration, before=end):
+        if moment >= start or moment + duration > start:
+            occurrences.append(moment)
+            if len(occurrences) >= MAX_OCCURRENCES:
+                break
+    return tuple(occurrences)
+
+
+def expand(rule, dtstart, duration, start, end):
+    """Start times of the occurrences overlapping [start, end)
+
+    Results are cached per rule, first occurrence, duration and window; editing
+    an event changes one of them, so a cached expansion is never stale.
+    """
+    return _expand(str(rule), dtstart, duration, start, end)
@@ -0,0 +1,198 @@
+"""
+Compact inverted index for the static website search.
+
+The static site has no server to run `/ingredient/search` or `/article/search`,
+so the build ships a prebuilt index the UI can query on its own.
+
+Layout (all files are compact JSON):
+
+    search/index.json           manifest: document count, prefix length, bucket sizes
+    search/docs.json            document table [[kind, id, title], ...]
+    search/terms/<prefix>.json  {term: delta encoded postings} for terms starting with <prefix>
+
+A query only downloads the manifest, the document table and the buckets
+matching the prefixes of the words typed, never the content itself.
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+
+
+PREFIX_LENGTH = 2
+MIN_TERM_LENGTH = 2
+
+_word = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lower case and strip accents so `Soufflé` matches `souffle`"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str):
+    if not text:
+        return []
+    return [t for t in _word.findall(normalize(text)) if len(t) >= MIN_TERM_LENGTH]
+
+
+def json_strings(data):
+    """Yield all the strings nested inside a JSON value (block data)"""
+    if isinstance(data, str):
+        yield data
+    elif isinstance(data, dict):
+        for value in data.values():
+            yield from json_strings(value)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            yield from json_strings(value)
+
+
+def bucket_name(term: str, prefix_length: int = PREFIX_LENGTH) -> str:
+    return term[:prefix_length]
+
+
+def delta_encode(values):
+    previous = 0
+    encoded = []
+    for value in values:
+        encoded.append(value - previous)
+        previous = value
+    return encoded
+
+
+def delta_decode(values):
+    total = 0
+    decoded = []
+    for value in values:
+        total += value
+        decoded.append(total)
+    return decoded
+
+
+def _dump(data) -> bytes:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class SearchIndex:
+    """Build the inverted index document by document, then save it sharded by term prefix"""
+
+    def __init__(self, prefix_length: int = PREFIX_LENGTH):
+        self.prefix_length = prefix_length
+        self.documents = []
+        self.postings = defaultdict(set)
+
+    def add(self, kind: str, id, title: str, *texts):
+        doc = len(self.documents)
+        self.documents.append([kind, id, title])
+
+        for text in (title,) + texts:
+            for term in tokenize(text):
+                self.postings[term].add(doc)
+
+        return doc
+
+    def buckets(self):
+        buckets = defaultdict(dict)
+        for term in sorted(self.postings):
+            buckets[bucket_name(term, self.prefix_length)][term] = delta_encode(sorted(self.postings[term]))
+        return buckets
+
+    def save(self, folder):
+        """Write the index to `folder`, returns the manifest"""
+        terms_folder = os.path.join(folder, "terms")
+        os.makedirs(terms_folder, exist_ok=True)
+
+        bucket_sizes = {}
+        for prefix, terms in self.buckets().items():
+            content = _dump(terms)
+            with open(os.path.join(terms_folder, f"{prefix}.json"), "wb") as fp:
+                fp.write(content)
+            bucket_sizes[prefix] = {"terms": len(terms), "bytes": len(content)}
+
+        docs = _dump(self.documents)
+        with open(os.path.join(folder, "docs.json"), "wb") as fp:
+            fp.write(docs)
+
+        manifest = {
+            "version": 1,
+            "documents": len(self.documents),
+            "terms": len(self.postings),
+            "prefix_length": self.prefix_length,
+            "min_term_length": MIN_TERM_LENGTH,
+            "docs_bytes": len(docs),
+            "buckets": bucket_sizes,
+        }
+        with open(os.path.join(folder, "index.json"), "wb") as fp:
+            fp.write(_dump(manifest))
+
+        return manifest
+
+
+class SearchIndexReader:
+    """Python version of the client side lookup, loads buckets lazily like the UI does"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "index.json")) as fp:
+            self.manifest = json.load(fp)
+        with open(os.path.join(folder, "docs.json")) as fp:
+            self.documents = json.load(fp)
+        self.cache = {}
+
+    def bucket(self, prefix):
+        if prefix not in self.cache:
+            if prefix in self.manifest["buckets"]:
+                with open(os.path.join(self.folder, "terms", f"{prefix}.json")) as fp:
+                    self.cache[prefix] = json.load(fp)
+            else:
+                self.cache[prefix] = {}
+        return self.cache[prefix]
+
+    def lookup(self, word):
+        """Documents containing a term starting with `word`"""
+        terms = self.bucket(bucket_name(word, self.manifest["prefix_length"]))
+        found = set()
+        for term, postings in terms.items():
+            if term.startswith(word):
+                found.update(delta_decode(postings))
+        return found
+
+    def search(self, query, limit=20):
+        words = tokenize(query)
+        if not words:
+            return []
+
+        matches = None
+        for word in words:
+            docs = self.lookup(word)
+            matches = docs if matches is None else matches & docs
+            if not matches:
+                return []
+
+        return [self.documents[doc] for doc in sorted(matches)[:limit]]
+
+
+def benchmark(folder, queries):
+    """Measure the query latency against the saved index, buckets are loaded on first use like in the UI"""
+    reader = SearchIndexReader(folder)
+
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        reader.search(query)
+        timings.append(time.perf_counter() - start)
+
+    if not timings:
+        return {"queries": 0}
+
+    timings.sort()
+    return {
+        "queries": len(timings),
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p95_ms": timings[int(0.95 * (len(timings) - 1))] * 1000,
+        "max_ms": timings[-1] * 1000,
+    }
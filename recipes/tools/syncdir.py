@@ -0,0 +1,207 @@
+"""
+Incremental one way sync of a directory tree.
+
+A manifest remembers the size, mtime and sha256 of every file synced. On the
+next run files with the same size and mtime are skipped without being read,
+touched files whose hash did not change are not copied, and files removed from
+the source are removed from the destination. Mirrors receive a hardlink to the
+destination file instead of a second copy, and so do files whose content is
+identical to a file already synced (the uploads are content addressed, the same
+image is often referenced under several namespaces).
+
+Top level directories are synced in parallel.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass
+class SyncStats:
+    files: int = 0
+    copied: int = 0
+    linked: int = 0
+    skipped: int = 0
+    removed: int = 0
+    bytes: int = 0
+
+    def add(self, other):
+        self.files += other.files
+        self.copied += other.copied
+        self.linked += other.linked
+        self.skipped += other.skipped
+        self.removed += other.removed
+        self.bytes += other.bytes
+
+    def to_json(self):
+        return {
+            "files": self.files,
+            "copied": self.copied,
+            "linked": self.linked,
+            "skipped": self.skipped,
+            "removed": self.removed,
+            "bytes": self.bytes,
+        }
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while chunk := fp.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fp:
+        json.dump(manifest, fp, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp, path)
+
+
+def walk_files(root, relative=""):
+    """Yield (relative path, stat) for all the files below root/relative"""
+    with os.scandir(os.path.join(root, relative)) as entries:
+        for entry in entries:
+            rel = os.path.join(relative, entry.name) if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(root, rel)
+            elif entry.is_file():
+                yield rel, entry.stat()
+
+
+def link_or_copy(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ContentIndex:
+    """Files with a given content already present in the destination, shared by the sync tasks"""
+
+    def __init__(self):
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def add(self, digest, rel):
+        with self.lock:
+            self.paths.setdefault(digest, rel)
+
+    def get(self, digest):
+        with self.lock:
+            return self.paths.get(digest)
+
+
+def _sync_files(src, dest, mirrors, manifest, files, contents=None):
+    stats = SyncStats()
+    entries = {}
+
+    for rel, stat in files:
+        stats.files += 1
+        target = os.path.join(dest, rel)
+        previous = manifest.get(rel)
+
+        up_to_date = (
+            previous is not None
+            and os.path.exists(target)
+            and all(os.path.exists(os.path.join(mirror, rel)) for mirror in mirrors)
+        )
+
+        if up_to_date and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+            entries[rel] = previous
+            stats.skipped += 1
+            if contents is not None:
+                contents.add(previous[2], rel)
+            continue
+
+        digest = file_hash(os.path.join(src, rel))
+        entries[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        if up_to_date and previous[2] == digest:
+            stats.skipped += 1
+            if contents is not None:
+                contents.add(digest, rel)
+            continue
+
+        same = contents.get(digest) if contents is not None else None
+        if same is not None:
+            link_or_copy(os.path.join(dest, same), target)
+            stats.linked += 1
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.tmp"
+            shutil.copy2(os.path.join(src, rel), tmp)
+            os.replace(tmp, target)
+            stats.copied += 1
+            stats.bytes += stat.st_size
+
+        for mirror in mirrors:
+            link_or_copy(target, os.path.join(mirror, rel))
+
+        if contents is not None:
+            contents.add(digest, rel)
+
+    return entries, stats
+
+
+def sync_tree(src, dest, mirrors=(), manifest_path=None, workers=8):
+    """Sync `src` into `dest` (and `mirrors`), returns SyncStats"""
+    manifest_path = manifest_path or os.path.join(dest, ".sync-manifest.json")
+    manifest = load_manifest(manifest_path)
+
+    os.makedirs(dest, exist_ok=True)
+
+    # One task per top level directory, files at the root are a task of their own
+    tasks = []
+    root_files = []
+    with os.scandir(src) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                tasks.append(entry.name)
+            elif entry.is_file():
+                root_files.append((entry.name, entry.stat()))
+
+    contents = ContentIndex()
+
+    def sync_directory(name):
+        return _sync_files(src, dest, mirrors, manifest, walk_files(src, name), contents)
+
+    stats = SyncStats()
+    new_manifest = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(sync_directory, name) for name in tasks]
+        futures.append(executor.submit(_sync_files, src, dest, mirrors, manifest, root_files, contents))
+
+        for future in futures:
+            entries, task_stats = future.result()
+            new_manifest.update(entries)
+            stats.add(task_stats)
+
+    for rel in manifest.keys() - new_manifest.keys():
+        for folder in (dest, *mirrors):
+            path = os.path.join(folder, rel)
+            if os.path.exists(path):
+                os.remove(path)
+        stats.removed += 1
+
+    save_manifest(manifest_path, new_manifest)
+    return stats
@@ -9,7 +9,6 @@ import {
   Badge,
   Flex,
   Spacer,
-  Image,
   Spinner,
   Link,
   Input,
@@ -17,7 +16,8 @@ import {
   IconButton,
   Heading,
 } from '@chakra-ui/react';
-import { recipeAPI, imagePath } from '../services/api';
+import { recipeAPI } from '../services/api';
+import ResponsiveImage from './ResponsiveImage';
 import type { RecipeData, RecipeIngredient, Instruction } from '../services/type';
 import { convert, getAvailableUnits } from '../utils/unit_cvt';
 import { formatQuantity, parseFractionToDecimal } from '../utils/fractions';
@@ -2203,8 +2203,9 @@ const InstructionStep: FC<InstructionStepProps> = ({
             <>
               {/* Step Image */}
               {instruction.image ? (
-                <Image
-                  src={imagePath(instruction.image)}
+                <ResponsiveImage
+                  image={instruction.image}
+                  sizes="200px"
                   alt={`Step ${instruction.step} image`}
                   width="200px"
                   height="150px"
@@ -3491,9 +3492,11 @@ const Recipe: FC<RecipeProps> = ({
               recipe.images && recipe.images.length > 0 ? (
                 <HStack wrap="wrap" gap={3}>
                   {recipe.images.map((imageUrl, index) => (
-                    <Image
+                    <ResponsiveImage
                       key={index}
-                      src={imagePath(imageUrl)}
+                      image={imageUrl}
+                      // Square previews, 300px high
+                      sizes="300px"
                       alt={`Recipe image ${index + 1}`}
                       maxHeight="300px"
                       objectFit="cover"
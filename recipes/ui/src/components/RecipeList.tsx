@@ -9,12 +9,12 @@ import {
   HStack,
   Heading,
   SimpleGrid,
-  Image,
   Badge,
   Input,
   Flex,
 } from '@chakra-ui/react';
-import { recipeAPI, imagePath } from '../services/api';
+import { recipeAPI } from '../services/api';
+import ResponsiveImage from './ResponsiveImage';
 import type { RecipeData } from '../services/type';
 
 // Component filter states
@@ -349,8 +349,10 @@ const RecipeList = () => {
                 {/* Recipe Image - Square */}
                 <Box position="relative" width="100%" paddingBottom="100%" overflow="hidden">
                   {recipe.images && recipe.images.length > 0 ? (
-                    <Image
-                      src={imagePath(recipe.images[0])}
+                    <ResponsiveImage
+                      image={recipe.images[0]}
+                      // One card per grid column, see SimpleGrid columns below the breakpoints
+                      sizes="(min-width: 1536px) 17vw, (min-width: 1280px) 20vw, (min-width: 1024px) 25vw, (min-width: 768px) 33vw, (min-width: 480px) 50vw, 100vw"
                       alt={recipe.title}
                       position="absolute"
                       top="0"
@@ -0,0 +1,63 @@
+import { useEffect, useState } from 'react';
+import { Image } from '@chakra-ui/react';
+import type { ComponentProps } from 'react';
+import { derivativeManifest, imagePath } from '../services/api';
+import type { DerivativeManifest } from '../services/type';
+
+
+interface ResponsiveImageProps extends Omit<ComponentProps<typeof Image>, 'src' | 'srcSet' | 'sizes'> {
+  image: string;        // Upload path as stored on the recipe, e.g. "/uploads/12_Pie/preview_1.jpg"
+  sizes?: string;       // Rendered width, the browser picks the smallest derivative covering it
+}
+
+function srcSet(manifest: DerivativeManifest, format: string): string | undefined {
+  const set = manifest.srcset[format];
+  if (!set) {
+    return undefined;
+  }
+  return set
+    .split(', ')
+    .map((entry) => {
+      const [url, width] = entry.split(' ');
+      return `${imagePath(url)} ${width}`;
+    })
+    .join(', ');
+}
+
+// Upload served from its responsive derivatives (WebP first, JPEG fallback) sized to the viewport,
+// the full production image is only requested when the upload has no derivatives.
+const ResponsiveImage: React.FC<ResponsiveImageProps> = ({ image, sizes = '100vw', ...props }) => {
+  // undefined while the manifest loads: no src yet, so the browser does not fetch the full image first
+  const [manifest, setManifest] = useState<DerivativeManifest | null | undefined>(undefined);
+
+  useEffect(() => {
+    let current = true;
+    setManifest(undefined);
+    derivativeManifest(image).then((loaded) => {
+      if (current) {
+        setManifest(loaded);
+      }
+    });
+    return () => {
+      current = false;
+    };
+  }, [image]);
+
+  const webp = manifest ? srcSet(manifest, 'webp') : undefined;
+  const jpg = manifest ? srcSet(manifest, 'jpg') : undefined;
+
+  return (
+    // display: contents keeps the <img> laid out as if <picture> was not there
+    <picture style={{ display: 'contents' }}>
+      {webp && <source type="image/webp" srcSet={webp} sizes={sizes} />}
+      <Image
+        src={manifest === undefined ? undefined : imagePath(image)}
+        srcSet={jpg}
+        sizes={jpg ? sizes : undefined}
+        {...props}
+      />
+    </picture>
+  );
+};
+
+export default ResponsiveImage;
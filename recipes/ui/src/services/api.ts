@@ -19,6 +19,8 @@ import type {
   PlannedMeal,
   MealPlan,
   KeyValueEntry,
+  ImageJob,
+  DerivativeManifest,
   Article,
   ArticleBlock
 } from './type';
@@ -49,6 +51,31 @@ export function imagePath(image: string): string {
   return SITE_BASE + path;
 }
 
+// Images uploaded before the derivatives existed have no manifest, they resolve to null
+const derivativeManifests = new Map<string, Promise<DerivativeManifest | null>>();
+
+export function derivativeManifestPath(image: string): string | null {
+  // "/uploads/<namespace>.jpg" -> "/uploads/<namespace>.derivatives.json"
+  const match = image.match(/^((?:\/api)?\/uploads\/.+)\.[^./]+$/);
+  return match ? `${match[1]}.derivatives.json` : null;
+}
+
+export function derivativeManifest(image: string): Promise<DerivativeManifest | null> {
+  const path = derivativeManifestPath(image);
+  if (!path) {
+    return Promise.resolve(null);
+  }
+
+  let manifest = derivativeManifests.get(path);
+  if (!manifest) {
+    manifest = fetch(imagePath(path))
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null);
+    derivativeManifests.set(path, manifest);
+  }
+  return manifest;
+}
+
 export { isStaticMode };
 
 class RecipeAPI {
@@ -329,7 +356,9 @@ class RecipeAPI {
   }
 
   // Image upload
-  async uploadImage(file: File, namespace?: string): Promise<{ url: string; filename: string; folder: string }> {
+  // The server answers once the original is stored, the image is produced in the
+  // background: poll the job and only return its url once the file is written.
+  async uploadImage(file: File, namespace?: string): Promise<{ url: string; job: ImageJob }> {
     if (isStaticMode()) {
       throw new Error('Image upload is not supported in static mode');
     }
@@ -357,13 +386,37 @@ class RecipeAPI {
         throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
       }
 
-      return await response.json();
+      const accepted: { job: string; status: string } = await response.json();
+      const job = await this.waitImageJob(accepted.status);
+      // A re-upload to the same namespace rewrote the derivatives
+      const manifest = derivativeManifestPath(job.url as string);
+      if (manifest) {
+        derivativeManifests.delete(manifest);
+      }
+      return { url: job.url as string, job };
     } catch (error) {
       console.error('Image upload failed:', error);
       throw error;
     }
   }
 
+  async waitImageJob(status: string, interval: number = 500, timeout: number = 120000): Promise<ImageJob> {
+    const deadline = Date.now() + timeout;
+    for (;;) {
+      const job = await this.request<ImageJob>(status);
+      if (job.state === 'failed') {
+        throw new Error(job.error || 'Image processing failed');
+      }
+      if (job.state === 'done') {
+        return job;
+      }
+      if (Date.now() > deadline) {
+        throw new Error('Image processing is taking too long');
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+  }
+
   async downloadImage(file: File, articlePath: string): Promise<{ url: string; filename: string }> {
     if (isStaticMode()) {
       throw new Error('Image download is not supported in static mode');
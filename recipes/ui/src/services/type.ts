@@ -246,6 +246,29 @@ export interface KeyValueEntry {
     updated_at: string;
 }
 
+// Background processing of an upload, GET /upload/jobs/<id>
+export interface ImageJob {
+    id: string;
+    namespace: string;
+    state: 'queued' | 'running' | 'done' | 'failed';
+    created_at: string;
+    finished_at: string | null;
+    image: string | null;
+    url: string | null;
+    derivatives: any[];
+    duplicates: any[];
+    error: string | null;
+}
+
+// Saved next to the production image by the upload job, see tools/images.py make_derivatives
+export interface DerivativeManifest {
+    namespace: string;
+    width: number;
+    height: number;
+    derivatives: { path: string; width: number; height: number; format: string; bytes: number }[];
+    srcset: Record<string, string>;   // format -> "/uploads/<namespace>.320w.webp 320w, ..."
+}
+
 // ============================================================================
 // User Models
 // ============================================================================
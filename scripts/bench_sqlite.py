@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Readers against a writer, with the bare SQLite defaults and with the app profile
+(see recipes/server/dbconfig.py).
+
+The writer plays the editor saving documents: transactions of a few thousand
+rows, back to back. The readers run small indexed queries and report their
+latency; with the default rollback journal they wait whenever the writer holds
+the lock, in WAL mode they read the last committed state.
+
+    python scripts/bench_sqlite.py --seconds 5 --readers 4
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from recipes.server.dbconfig import engine_options, install_sqlite_profile, sqlite_pragmas
+
+
+def make_engine(path, profile):
+    if not profile:
+        return create_engine(f"sqlite:///{path}")
+
+    engine = create_engine(f"sqlite:///{path}", **engine_options())
+    install_sqlite_profile(engine, sqlite_pragmas())
+    return engine
+
+
+def run(profile, seconds, readers, rows):
+    folder = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(folder, "bench.db"), profile)
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, topic INTEGER, body TEXT)"))
+        conn.execute(text("CREATE INDEX idx_notes_topic ON notes (topic)"))
+        conn.execute(
+            text("INSERT INTO notes (topic, body) VALUES (:topic, :body)"),
+            [{"topic": i % 100, "body": "x" * 500} for i in range(rows)],
+        )
+
+    stop = time.monotonic() + seconds
+    latencies = []
+    errors = {"read": 0, "write": 0}
+    commits = [0]
+
+    def writer():
+        i = 0
+        while time.monotonic() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT INTO notes (topic, body) VALUES (:topic, :body)"),
+                        [{"topic": (i + k) % 100, "body": "y" * 2000} for k in range(2000)],
+                    )
+                    conn.execute(text("DELETE FROM notes WHERE id IN (SELECT id FROM notes ORDER BY id LIMIT 2000)"))
+                commits[0] += 1
+            except Exception:
+                errors["write"] += 1
+            i += 1
+
+    def reader(n):
+        local = []
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT count(*), max(id) FROM notes WHERE topic = :t"), {"t": n}).all()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                errors["read"] += 1
+        latencies.extend(local)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "commits": commits[0],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, profile in (("default", False), ("profile", True)):
+        result = run(profile, args.seconds, args.readers, args.rows)
+        print(
+            f"{name:>8}: {result['reads']:6d} reads  p50 {result['p50_ms']:7.2f} ms"
+            f"  p99 {result['p99_ms']:7.2f} ms  max {result['max_ms']:7.2f} ms"
+            f"  {result['commits']} commits  errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from recipes.server.models import Base
+from recipes.server.route_article import article_routes
+from recipes.server.route_tasks import tasks_routes
+
+
+def make_client(tmp_path, *routes, **config):
+    """Test client of some routes of the app, on a fresh database"""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path}/database.db"
+    app.config.update(config)
+    db = SQLAlchemy(model_class=Base)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    for add_routes in routes:
+        add_routes(app, db)
+    app.db = db
+    return app.test_client()
+
+
+@pytest.fixture
+def client(tmp_path):
+    return make_client(tmp_path, article_routes)
+
+
+@pytest.fixture
+def tasks_client(tmp_path):
+    return make_client(tmp_path, tasks_routes)
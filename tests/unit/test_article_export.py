@@ -0,0 +1,101 @@
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+
+from recipes.server import article_export
+from recipes.server.article_export import iter_json, render_html, render_markdown
+from recipes.server.models import ArticleBlock
+
+
+def block(kind, data=None, *children):
+    node = {"id": 0, "kind": kind, "data": data or {}}
+    if children:
+        node["children"] = list(children)
+    return node
+
+
+def test_render_markdown():
+    paragraph = block("paragraph", {"text": "Hello"}, block("text", {"text": "world", "style": "em"}))
+    assert render_markdown(paragraph) == "Hello *world*"
+
+    items = block("list", {"ordered": True, "start": 3}, block("item", {}, block("text", {"text": "a"})))
+    assert render_markdown(items) == "3. a"
+
+    quote = block("blockquote", {}, block("paragraph", {"text": "one"}), block("paragraph", {"text": "two"}))
+    assert render_markdown(quote) == "> one\n> two"
+
+    table = block("table", {"data": json.dumps([{"a": 1, "b": 2}])})
+    assert render_markdown(table) == "| a | b |\n| --- | --- |\n| 1 | 2 |"
+
+
+def test_render_html_escapes():
+    assert render_html(block("paragraph", {"text": "<script>"})) == "<p>&lt;script&gt;</p>"
+    assert render_html(block("layout", {}, block("hr"))) == '<div class="block-layout"><hr></div>'
+
+
+def test_iter_json_is_the_article_document():
+    blocks = [block("paragraph", {"text": "a"}), block("hr")]
+    document = json.loads("".join(iter_json({"id": 1, "title": "T"}, blocks)))
+    assert document == {"id": 1, "title": "T", "blocks": blocks}
+
+
+def test_tar_follows_the_tree(monkeypatch):
+    monkeypatch.setattr(article_export, "iter_block_trees", lambda session, article_id: [block("hr")])
+
+    rows = [
+        SimpleNamespace(_id=1, parent=None, title="Root page"),
+        SimpleNamespace(_id=2, parent=1, title="Child"),
+    ]
+    monkeypatch.setattr(article_export, "article_json", lambda row: {"id": row._id, "title": row.title})
+
+    data = b"".join(article_export.iter_tar(None, rows, "md"))
+    archive = tarfile.open(fileobj=io.BytesIO(data))
+    assert archive.getnames() == ["root-page-1.md", "root-page-1/child-2.md"]
+    assert archive.extractfile("root-page-1/child-2.md").read() == b"# Child\n\n---\n\n"
+
+
+def test_export_content_type(client):
+    article = client.post("/articles", json={"title": "Soup"}).json
+
+    with client.get(f"/articles/{article['id']}/export?format=md") as response:
+        assert response.headers["Content-Type"] == "text/markdown; charset=utf-8"
+        assert response.headers["Content-Disposition"] == "attachment; filename=soup.md"
+
+    with client.get(f"/articles/{article['id']}/export?format=html") as response:
+        assert response.headers["Content-Type"] == "text/html; charset=utf-8"
+
+    with client.get(f"/articles/{article['id']}/export") as response:
+        assert response.headers["Content-Type"] == "application/json"
+
+
+def test_block_trees_are_streamed_in_order(client):
+    article = client.post("/articles", json={"title": "Soup"}).json
+    db = client.application.db
+
+    def row(_id, parent, rank, kind="paragraph"):
+        return {"_id": _id, "page_id": article["id"], "parent": parent, "rank": rank, "kind": kind, "data": {"text": str(_id)}}
+
+    with client.application.app_context():
+        db.session.execute(ArticleBlock.__table__.insert(), [
+            row(1, None, "a1", "list"),
+            row(2, None, "a0"),
+            row(3, 3, "a2"),
+            # Parent deleted
+            row(4, 99, "a3"),
+            row(5, 1, "a1", "item"),
+            row(6, 1, "a0", "item"),
+            row(7, 5, "a0", "text"),
+        ])
+        db.session.commit()
+
+        roots = list(article_export.iter_block_trees(db.session, article["id"], batch=2))
+
+    def shape(node):
+        return (node["id"], [shape(child) for child in node.get("children", [])])
+
+    assert [shape(root) for root in roots] == [(2, []), (1, [(6, []), (5, [(7, [])])]), (3, []), (4, [])]
+
+    document = client.get(f"/articles/{article['id']}/export").json
+    assert document["title"] == "Soup"
+    assert [block["id"] for block in document["blocks"]] == [2, 1, 3, 4]
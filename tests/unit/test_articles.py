@@ -0,0 +1,174 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from recipes.server.models import Article, Base
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def add(session, parent=None, **values):
+    article = Article(title="a", parent=parent._id if parent else None, **values)
+    session.add(article)
+    session.flush()
+    article.assign_path(parent)
+    return article
+
+
+def subtree(session, article):
+    rows = session.query(Article._id).filter(Article.in_subtree(article.path)).order_by(Article._id)
+    return [row[0] for row in rows]
+
+
+def test_in_subtree_is_a_prefix_range(session):
+    root = add(session)
+    child = add(session, root)
+    grandchild = add(session, child)
+    # /1/ must not match /10/
+    for _ in range(8):
+        add(session)
+    other = add(session)
+    assert other.path == f"/{other._id}/" and other.path.startswith(root.path[:-1])
+
+    assert subtree(session, root) == [root._id, child._id, grandchild._id]
+    assert subtree(session, child) == [child._id, grandchild._id]
+
+
+def test_move_subtree_rewrites_paths(session):
+    first = add(session)
+    second = add(session)
+    child = add(session, first, rank="a0")
+    grandchild = add(session, child)
+
+    Article.move_subtree(session, child, second, "b0")
+    session.commit()
+
+    assert (child.parent, child.rank, child.root_id) == (second._id, "b0", second._id)
+    assert child.path == f"/{second._id}/{child._id}/"
+    assert grandchild.path == f"{child.path}{grandchild._id}/"
+    # the parent of the descendants is unchanged
+    assert grandchild.parent == child._id
+    assert subtree(session, first) == [first._id]
+
+
+def test_materialize_path_of_orphans(session):
+    root = add(session)
+    # Parent deleted, and a child of it, both left without path
+    orphan = Article(title="orphan", parent=999)
+    session.add(orphan)
+    session.flush()
+    child = Article(title="child", parent=orphan._id)
+    session.add(child)
+    session.flush()
+
+    Article.materialize_path(session, child)
+    assert orphan.path == f"/{orphan._id}/"
+    assert child.path == f"/{orphan._id}/{child._id}/"
+
+    Article.move_subtree(session, orphan, root)
+    session.commit()
+    assert child.path == f"/{root._id}/{orphan._id}/{child._id}/"
+
+
+def test_materialize_path_detects_cycles(session):
+    first = Article(title="first")
+    second = Article(title="second")
+    session.add_all([first, second])
+    session.flush()
+    first.parent, second.parent = second._id, first._id
+
+    with pytest.raises(ValueError):
+        Article.materialize_path(session, first)
+
+
+def test_move_page_refuses_cycles(client):
+    root = client.post("/articles", json={"title": "root"}).json
+    child = client.post("/articles", json={"title": "child", "parent_id": root["id"]}).json
+
+    response = client.post(f"/article/move/{root['id']}/{child['id']}")
+    assert response.status_code == 400
+    response = client.post(f"/article/move/{root['id']}/{root['id']}")
+    assert response.status_code == 400
+
+    other = client.post("/articles", json={"title": "other"}).json
+    response = client.post(f"/article/move/{child['id']}/{other['id']}")
+    assert response.status_code == 200
+    assert response.json["path"] == f"/{other['id']}/{child['id']}/"
+
+
+def paragraph(text, sequence=None, *children):
+    return {"kind": "paragraph", "data": {"text": text}, "sequence": sequence, "children": list(children)}
+
+
+def block_texts(blocks):
+    return [(b["data"]["text"], block_texts(b.get("children", []))) for b in blocks]
+
+
+def test_blocks_batch_applies_actions_in_order(client):
+    article = client.post("/articles", json={"title": "post"}).json
+    (inserted,) = client.put("/blocks/batch", json=[{
+        "op": "insert", "page_id": article["id"], "parent": None,
+        "children": [paragraph("a", 1), paragraph("b", 2), paragraph("c", 3)],
+    }]).json
+    a, b, c = [child["id"] for child in inserted["children"]]
+
+    replies = client.put("/blocks/batch", json=[
+        {"op": "delete", "block_id": b},
+        {"op": "insert", "page_id": article["id"], "parent": None,
+         "children": [paragraph("d", 2, paragraph("d1"), paragraph("d2"))]},
+        {"op": "reorder", "id": c, "before": a},
+        # deleted by the first action
+        {"op": "update", "id": b, "block_def": {"data": {"text": "gone"}}},
+    ]).json
+
+    assert [reply["action"] for reply in replies] == ["delete", "insert", "reorder"]
+    (d,) = replies[1]["children"]
+    assert len(d["children"]) == 2
+
+    blocks = client.get(f"/articles/{article['id']}").json["blocks"]
+    assert block_texts(blocks) == [("c", []), ("a", []), ("d", [("d1", []), ("d2", [])])]
+
+
+def test_article_changes_since_revision(client):
+    article = client.post("/articles", json={"title": "post"}).json
+    other = client.post("/articles", json={"title": "other"}).json
+    (inserted,) = client.put("/blocks/batch", json=[{
+        "op": "insert", "page_id": article["id"], "parent": None,
+        "children": [paragraph("a", 1), paragraph("b", 2, paragraph("b1")), paragraph("c", 3)],
+    }]).json
+    a, b, c = [child["id"] for child in inserted["children"]]
+    (b1,) = [child["id"] for child in inserted["children"][1]["children"]]
+
+    changes = client.get(f"/articles/{article['id']}/changes").json
+    assert changes["reset"] and changes["revision"] == 1
+    assert len(changes["blocks"]) == 4
+
+    changes = client.get(f"/articles/{article['id']}/changes?since=1").json
+    assert (changes["reset"], changes["blocks"], changes["deleted"]) == (False, [], [])
+
+    client.put("/blocks/batch", json=[
+        {"op": "update", "id": a, "block_def": {"data": {"text": "a'"}}},
+        {"op": "delete", "block_id": b},
+        {"op": "update", "id": c, "block_def": {"page_id": other["id"]}},
+    ])
+
+    changes = client.get(f"/articles/{article['id']}/changes?since=1").json
+    assert changes["revision"] == 2 and not changes["reset"]
+    assert [block["data"]["text"] for block in changes["blocks"]] == ["a'"]
+    # the deleted subtree and the block moved away
+    assert sorted(changes["deleted"]) == sorted([b, b1, c])
+
+    changes = client.get(f"/articles/{other['id']}/changes?since=0").json
+    assert [block["id"] for block in changes["blocks"]] == [c]
+    assert changes["deleted"] == []
+
+    # revision the server does not know, everything is sent again
+    changes = client.get(f"/articles/{article['id']}/changes?since=99").json
+    assert changes["reset"] and changes["deleted"] == []
+    assert [block["id"] for block in changes["blocks"]] == [a]
@@ -0,0 +1,90 @@
+import os
+
+from recipes.tools.blobstore import BlobStore
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        fp.write(content)
+
+
+def test_blobstore_deduplicates_and_collects(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+
+    write(tmp_path / "uploads" / "a.jpg", "image")
+    write(tmp_path / "uploads" / "b.jpg", "image")
+
+    digest = store.adopt(tmp_path / "uploads" / "a.jpg")
+    assert store.adopt(tmp_path / "uploads" / "b.jpg") == digest
+    assert store.refcount(digest) == 2
+    assert os.path.samefile(tmp_path / "uploads" / "a.jpg", tmp_path / "uploads" / "b.jpg")
+    assert store.stats()["blobs"] == 1
+
+    # references survive a reload
+    store = BlobStore(tmp_path / "blobs")
+    assert store.refcount(digest) == 2
+    assert "uploads/a.jpg" in store.refs
+
+    # replacing a reference does not touch the other one
+    tmp = store.temporary_path()
+    write(tmp, "new image")
+    other = store.add_file(tmp, move=True)
+    store.link(other, tmp_path / "uploads" / "a.jpg")
+    assert (tmp_path / "uploads" / "b.jpg").read_text() == "image"
+
+    store.release(tmp_path / "uploads" / "b.jpg")
+    assert store.refcount(digest) == 0
+    # blobs just written could belong to an upload being processed
+    assert store.collect_garbage() == {"removed": 0, "bytes": 0}
+    assert store.collect_garbage(min_age=0) == {"removed": 1, "bytes": 5}
+    assert not store.exists(digest)
+    assert store.exists(other)
+
+
+def test_blobstore_derived(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    write(tmp_path / "uploads" / "a.320w.jpg", "variant")
+
+    digest = store.adopt(tmp_path / "uploads" / "a.320w.jpg")
+    store.remember("source:320:jpg", digest)
+    assert store.derived("source:320:jpg") == digest
+    assert store.derived("source:640:jpg") is None
+
+
+def test_blobstore_shared_between_processes(tmp_path):
+    # Two workers of the server, each with its own store on the same folder
+    first = BlobStore(tmp_path / "blobs")
+    second = BlobStore(tmp_path / "blobs")
+
+    write(tmp_path / "uploads" / "a.jpg", "image")
+    digest = first.adopt(tmp_path / "uploads" / "a.jpg")
+    assert second.refcount(digest) == 1
+
+    write(tmp_path / "uploads" / "b.jpg", "image")
+    second.adopt(tmp_path / "uploads" / "b.jpg")
+    first.release(tmp_path / "uploads" / "a.jpg")
+    assert second.refs == {os.path.join("uploads", "b.jpg"): digest}
+
+    # still referenced by the second worker
+    assert first.collect_garbage(min_age=0) == {"removed": 0, "bytes": 0}
+    assert first.exists(digest)
+
+
+def test_blobstore_grace_period_restarts_when_stored_again(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    write(tmp_path / "a.jpg", "image")
+    digest = store.add_file(tmp_path / "a.jpg")
+    os.utime(store.blob_path(digest), (0, 0))
+
+    assert store.add_file(tmp_path / "a.jpg") == digest
+    assert store.collect_garbage(min_age=60) == {"removed": 0, "bytes": 0}
+
+
+def test_blobstore_imports_json_index(tmp_path):
+    write(tmp_path / "blobs" / "refs.json", '{"refs": {"uploads/a.jpg": "abc"}, "derived": {"k": "abc"}}')
+
+    store = BlobStore(tmp_path / "blobs")
+    assert store.refs == {"uploads/a.jpg": "abc"}
+    assert store.refcount("abc") == 1
+    assert not (tmp_path / "blobs" / "refs.json").exists()
@@ -0,0 +1,61 @@
+import time
+
+from sqlalchemy import create_engine, text
+
+from recipes.tools.buildprofile import BuildProfiler
+
+
+class Rule:
+    def __init__(self, endpoint, rule):
+        self.endpoint = endpoint
+        self.rule = rule
+
+    def __str__(self):
+        return self.rule
+
+
+def test_queries_and_timings_per_route():
+    engine = create_engine("sqlite://")
+    profiler = BuildProfiler(engine)
+
+    with engine.connect() as conn:
+        with profiler.route(Rule("get_recipe", "/recipes/<int:id>")):
+            for _ in range(2):
+                start = time.perf_counter()
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+                profiler.sample(time.perf_counter() - start, nbytes=100)
+
+        with profiler.route(Rule("health", "/health")):
+            profiler.sample(0.5, failed=True)
+
+        # Outside of a route: counted in the total only
+        conn.execute(text("SELECT 3"))
+
+    report = profiler.report()
+    routes = {r["endpoint"]: r for r in report["routes"]}
+
+    assert routes["get_recipe"]["queries"] == 4
+    assert routes["get_recipe"]["combinations"] == 2
+    assert routes["get_recipe"]["bytes"] == 200
+    assert routes["get_recipe"]["rule"] == "/recipes/<int:id>"
+    assert routes["get_recipe"]["render_ms"] <= routes["get_recipe"]["total_ms"]
+
+    assert routes["health"]["queries"] == 0
+    assert routes["health"]["failures"] == 1
+    assert routes["health"]["saved"] == 0
+    assert routes["health"]["p95_ms"] == 500
+
+    assert report["queries"] == 5
+    assert report["failures"] == 1
+    assert "get_recipe" in profiler.table()
+
+
+def test_close_removes_the_listener():
+    engine = create_engine("sqlite://")
+    profiler = BuildProfiler(engine)
+    profiler.close()
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert profiler.queries == 0
@@ -0,0 +1,24 @@
+from sqlalchemy import text
+
+from recipes.server import server
+from recipes.server.dbconfig import engine_options, sqlite_pragmas
+
+
+def test_sqlite_pragmas_overrides():
+    pragmas = sqlite_pragmas({"RECIPES_SQLITE_SYNCHRONOUS": "FULL", "RECIPES_SQLITE_MMAP_SIZE": ""})
+    assert pragmas["synchronous"] == "FULL"
+    assert "mmap_size" not in pragmas
+    assert engine_options({"RECIPES_SQLITE_POOL_SIZE": "2"})["pool_size"] == 2
+
+
+def test_app_connections_use_the_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "STATIC_FOLDER", str(tmp_path))
+    monkeypatch.setattr(server, "STATIC_UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    recipes = server.RecipeApp()
+
+    with recipes.app.app_context():
+        with recipes.db.engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 10000
+            assert conn.execute(text("PRAGMA cache_size")).scalar() == -8000
+        recipes.db.engine.dispose()
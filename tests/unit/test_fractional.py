@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from recipes.tools.fractional import key_between, keys_between, needs_rebalance, spread_keys, validate_key
+
+
+def test_key_between_random_inserts():
+    rng = random.Random(0)
+    keys = []
+
+    for _ in range(5000):
+        i = rng.randint(0, len(keys))
+        before = keys[i - 1] if i > 0 else None
+        after = keys[i] if i < len(keys) else None
+
+        key = key_between(before, after)
+        assert before is None or before < key
+        assert after is None or key < after
+        validate_key(key)
+        keys.insert(i, key)
+
+    assert keys == sorted(keys)
+
+
+def test_key_between_rejects_bad_neighbours():
+    with pytest.raises(ValueError):
+        key_between("b", "a")
+
+    # Trailing zero in the fraction, integer shorter than its head says
+    with pytest.raises(ValueError):
+        key_between("a10", None)
+
+    with pytest.raises(ValueError):
+        key_between("b1", None)
+
+
+def test_keys_between_stay_short():
+    keys = keys_between("a5", "a6", 500)
+    assert keys == sorted(keys) and len(set(keys)) == 500
+    assert "a5" < keys[0] and keys[-1] < "a6"
+    assert max(map(len, keys)) <= 5
+
+
+def test_spread_keys():
+    for n in (1, 61, 62, 3000):
+        keys = spread_keys(n)
+        assert keys == sorted(keys) and len(set(keys)) == n
+        for key in keys:
+            validate_key(key)
+
+
+def test_appends_and_prepends_stay_short():
+    last = first = None
+    for _ in range(100000):
+        last = key_between(last, None)
+        first = key_between(None, first)
+
+    # Integers, one more digit every 62^n keys
+    assert len(last) == 4 and len(first) == 4
+    assert not needs_rebalance(last) and not needs_rebalance(first)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from PIL import Image
+
+from recipes.tools.imagecache import ImageCache, open_scaled
+
+
+def test_open_scaled_uses_draft(tmp_path):
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", (4000, 3000), (10, 20, 30)).save(path)
+
+    with open_scaled(path, width=300) as image:
+        # decoded at 1/8 of the size, still larger than requested
+        assert image.size == (500, 375)
+
+
+def test_open_scaled_refuses_large_images_before_decoding(tmp_path):
+    path = tmp_path / "scan.png"
+    Image.new("RGB", (2000, 1500)).save(path)
+
+    with pytest.raises(Image.DecompressionBombError):
+        open_scaled(path, width=300, max_pixels=1_000_000)
+
+    # JPEG is checked at its draft size
+    Image.new("RGB", (2000, 1500)).save(tmp_path / "photo.jpg")
+    with open_scaled(tmp_path / "photo.jpg", width=300, max_pixels=1_000_000) as image:
+        assert image.size == (500, 375)
+
+
+def test_image_cache_hit_and_eviction(tmp_path):
+    source = tmp_path / "photo.png"
+    Image.effect_noise((400, 300), 50).save(source)
+
+    cache = ImageCache(tmp_path / "cache", max_bytes=10 ** 9)
+    path, etag = cache.get(str(source), 100, None, "png")
+    with Image.open(path) as image:
+        assert image.size == (100, 75)
+
+    assert cache.get(str(source), 100, None, "png") == (path, etag)
+    assert cache.get(str(source), 200, None, "png")[1] != etag
+
+    # Reloaded from disk, then bounded to the most recent entry
+    cache = ImageCache(tmp_path / "cache", max_bytes=1)
+    assert len(cache.entries) == 2
+    cache.get(str(source), 50, None, "webp")
+    assert len(cache.entries) == 1
+    assert not os.path.exists(path)
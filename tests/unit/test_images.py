@@ -0,0 +1,72 @@
+import io
+import json
+
+from PIL import Image
+
+from recipes.server.executors import shutdown_executors
+from recipes.server.route_images import images_routes
+from recipes.tools.images import centercrop_resize_image, derivative_manifest_name, make_derivatives
+
+from conftest import make_client
+
+
+def test_make_derivatives_never_upscales(tmp_path):
+    image = Image.new("RGBA", (800, 400), (255, 0, 0, 128))
+
+    manifest = make_derivatives(tmp_path, image, "articles/1/hero", widths=(320, 640, 1280), formats=("webp", "jpg"))
+
+    widths = sorted({d["width"] for d in manifest["derivatives"]})
+    assert widths == [320, 640, 800]
+    assert all(d["height"] * 2 == d["width"] for d in manifest["derivatives"])
+    assert manifest["srcset"]["webp"].startswith("/uploads/articles/1/hero.320w.webp 320w")
+
+    for d in manifest["derivatives"]:
+        assert (tmp_path / d["path"]).exists()
+
+    with open(tmp_path / derivative_manifest_name("articles/1/hero")) as fp:
+        assert json.load(fp) == manifest
+
+
+def test_derivatives_follow_namespace_crop(tmp_path):
+    image = Image.new("RGB", (1200, 600))
+
+    manifest = make_derivatives(tmp_path, image, "recipes/1/preview", widths=(320,), formats=("jpg",))
+    assert [(d["width"], d["height"]) for d in manifest["derivatives"]] == [(320, 320)]
+
+    path = centercrop_resize_image(tmp_path, image, "recipes/1/steps/step", "png")
+    with Image.open(tmp_path / path) as saved:
+        assert saved.size == (300, 225)
+
+
+def image_config(tmp_path):
+    return dict(
+        UPLOAD_FOLDER=str(tmp_path / "uploads"),
+        ORIGINALS_FOLDER=str(tmp_path / "originals"),
+        LOCAL_ORIGINALS_FOLDER=str(tmp_path / "originals"),
+        BLOB_FOLDER=str(tmp_path / "blobs"),
+        IMAGE_CACHE_FOLDER=str(tmp_path / "cache"),
+        IMAGE_CACHE_MAX_BYTES=1024 ** 2,
+        IMAGE_CACHE_MAX_AGE=0,
+        IMAGE_HASH_INDEX=str(tmp_path / "phash.db"),
+        IMAGE_DERIVATIVE_WIDTHS=(320,),
+        IMAGE_DERIVATIVE_FORMATS=("jpg",),
+    )
+
+
+def test_upload_job_status_is_shared_between_workers(tmp_path):
+    client = make_client(tmp_path, images_routes, **image_config(tmp_path))
+
+    data = io.BytesIO()
+    Image.new("RGB", (800, 600), (10, 120, 200)).save(data, "PNG")
+    data.seek(0)
+    response = client.post("/upload", data={"file": (data, "hero.png"), "namespace": "1_Pie/preview_1"})
+    assert response.status_code == 202
+
+    shutdown_executors(client.application)
+
+    # Another worker process, same database
+    other = make_client(tmp_path, images_routes, **image_config(tmp_path))
+    job = other.get(response.json["status"]).get_json()
+    assert job["state"] == "done", job["error"]
+    assert job["url"] == "/uploads/1_Pie/preview_1.jpg"
+    assert [d["width"] for d in job["derivatives"]] == [320]
@@ -0,0 +1,159 @@
+import json
+import os
+
+import pytest
+
+from recipes.tools.jsonstore import Collection, JsonStore, atomic_write
+
+
+def test_atomic_write_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "doc.json"
+    atomic_write(str(path), '{"a":1}')
+    atomic_write(str(path), '{"a":2}')
+
+    assert json.loads(path.read_text()) == {"a": 2}
+    assert os.listdir(tmp_path) == ["doc.json"]
+
+
+def test_documents_are_compact(tmp_path):
+    col = Collection(str(tmp_path / "notes"))
+    col.write("a", {"title": "Pâte", "tags": [1, 2]})
+
+    assert (tmp_path / "notes" / "a.json").read_text() == '{"title":"Pâte","tags":[1,2]}'
+    assert col.read("a") == {"title": "Pâte", "tags": [1, 2]}
+
+
+def test_keys_follow_writes_and_deletes(tmp_path):
+    col = Collection(str(tmp_path / "notes"))
+    assert col.keys() == []
+
+    col.write("b", {})
+    col.write("a", {})
+    assert col.keys() == ["a", "b"]
+
+    assert col.delete("b")
+    assert not col.delete("b")
+    assert col.keys() == ["a"]
+
+
+def test_keys_see_files_written_by_others(tmp_path):
+    col = Collection(str(tmp_path / "notes"))
+    col.write("a", {})
+    col.keys()
+
+    (tmp_path / "notes" / "c.json").write_text("{}")
+    (tmp_path / "notes" / "_index.json").write_text("{}")
+    assert col.keys() == ["a", "c"]
+
+    os.remove(tmp_path / "notes" / "a.json")
+    assert col.keys() == ["c"]
+    assert col.mtimes().keys() == {"c"}
+
+
+def test_keys_see_files_created_during_a_write(tmp_path, monkeypatch):
+    from recipes.tools import jsonstore
+
+    store = JsonStore(str(tmp_path))
+    col = store.collection("events")
+    col.index.declare(["tags"])
+    col.write("a", {"tags": ["soup"]})
+    assert col.keys() == ["a"]
+
+    def write_with_another_process(path, text):
+        (tmp_path / "events" / "other.json").write_text('{"tags": ["soup"]}')
+        atomic_write(path, text)
+
+    monkeypatch.setattr(jsonstore, "atomic_write", write_with_another_process)
+    col.write("b", {"tags": []})
+
+    assert col.keys() == ["a", "b", "other"]
+    assert col.index.query([("tags", ":", "soup")]) == ["a", "other"]
+
+
+def test_full_collection_is_valid_json(tmp_path):
+    from recipes.server.route_jsonstore import iter_full_collection
+
+    store = JsonStore(str(tmp_path))
+    col = store.collection("my notes")
+    col.write("a", {"x": 1})
+    (tmp_path / "my_notes" / "b.json").write_text('{\n  "y": [1, 2]\n}\n')
+
+    assert store.names() == ["my_notes"]
+    assert json.loads("".join(iter_full_collection(col))) == {"a": {"x": 1}, "b": {"y": [1, 2]}}
+
+
+def events(tmp_path):
+    store = JsonStore(str(tmp_path))
+    col = store.collection("events")
+    col.write("a", {"date": "2024-01-05", "tags": ["soup", "winter"], "priority": 3})
+    col.write("b", {"date": "2024-02-10", "tags": ["salad"], "priority": 1})
+    col.write("c", {"date": "2024-01-20", "tags": ["soup"]})
+    col.index.declare(["date", "tags", "priority"])
+    return store, col
+
+
+def test_index_equality_and_ranges(tmp_path):
+    _, col = events(tmp_path)
+
+    assert col.index.query([("tags", ":", "soup")]) == ["a", "c"]
+    assert col.index.query([("date", ">=", "2024-01-10"), ("date", "<", "2024-02-01")]) == ["c"]
+    assert col.index.query([("priority", ">", "1")]) == ["a"]
+    assert col.index.query([("priority", "<=", "3")]) == ["a", "b"]
+
+
+def test_index_sort_and_limit(tmp_path):
+    _, col = events(tmp_path)
+
+    assert col.index.query(sort="date") == ["a", "c", "b"]
+    assert col.index.query(sort="date", descending=True, limit=2) == ["b", "c"]
+    # Documents without the field come last
+    assert col.index.query(sort="priority") == ["b", "a", "c"]
+
+
+def test_index_follows_writes(tmp_path):
+    store, col = events(tmp_path)
+    col.write("c", {"date": "2023-12-31", "tags": []})
+    col.delete("a")
+    assert col.index.query([("tags", ":", "soup")]) == []
+    assert col.index.query(sort="date") == ["c", "b"]
+
+    # Documents replaced by another process, seen by a new store
+    (tmp_path / "events" / "d.json").write_text('{"tags": ["soup"]}')
+    assert col.index.query([("tags", ":", "soup")]) == ["d"]
+    assert JsonStore(str(tmp_path)).collection("events").index.query([("tags", ":", "soup")]) == ["d"]
+
+
+def test_index_rejects_unindexed_fields(tmp_path):
+    _, col = events(tmp_path)
+    with pytest.raises(ValueError):
+        col.index.query([("title", ":", "x")])
+    with pytest.raises(ValueError):
+        col.index.declare(["a b"])
+
+
+def test_reload_only_stats_new_and_replaced_documents(tmp_path, monkeypatch):
+    from recipes.tools import jsonstore
+
+    store = JsonStore(str(tmp_path))
+    col = store.collection("events")
+    col.index.declare(["tags"])
+    for key in "abcdefgh":
+        col.write(key, {"tags": [key]})
+    col.mtimes()
+
+    # Another process replaces a document and adds one
+    atomic_write(str(tmp_path / "events" / "c.json"), '{"tags": ["soup"]}')
+    (tmp_path / "events" / "z.json").write_text('{"tags": ["soup"]}')
+    col.write("a", {"tags": ["soup"]})
+
+    stated = []
+    stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        stated.append(os.path.basename(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(jsonstore.os, "stat", counting_stat)
+
+    assert col.index.query([("tags", ":", "soup")]) == ["a", "c", "z"]
+    assert sorted(name for name in stated if name.endswith(".json")) == ["c.json", "z.json"]
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from recipes.server.route_keyvalue import TopicWatchers, key_value_routes, prefix_end, value_column
+
+from conftest import make_client
+
+
+def test_prefix_end_bounds_the_prefix():
+    keys = sorted(["widget", "widget.1", "widget.z￿", "widgeu", "widget/"])
+    end = prefix_end("widget.")
+    assert [k for k in keys if "widget." <= k < end] == ["widget.1", "widget.z￿"]
+
+
+@pytest.mark.parametrize("field", ["title", "layout.width", "items[0]", "a-b.c[12]"])
+def test_valid_fields(field):
+    value_column([field])
+
+
+@pytest.mark.parametrize("field", ["", "a b", "a'); drop", "$.a", "a..b"])
+def test_invalid_fields(field):
+    with pytest.raises(ValueError):
+        value_column([field])
+
+
+def test_watchers_wake_on_newer_sequence():
+    watchers = TopicWatchers()
+    threading.Timer(0.05, watchers.notify, ("layout", 3)).start()
+
+    start = time.monotonic()
+    assert watchers.wait("layout", 2, timeout=5)
+    assert time.monotonic() - start < 1
+
+
+def test_watchers_ignore_other_topics_and_old_sequences():
+    watchers = TopicWatchers()
+    watchers.notify("layout", 3)
+    watchers.notify("other", 10)
+    watchers.notify("layout", 2)
+
+    assert not watchers.wait("layout", 3, timeout=0.05)
+    assert watchers.wait("layout", 2, timeout=0)
+
+
+def test_watch_is_bounded_and_sees_other_workers(tmp_path):
+    client = make_client(tmp_path, key_value_routes, KV_MAX_WATCHERS=1)
+    assert client.post("/kv/layout/a", json={"value": 1}).status_code == 200
+
+    result = {}
+
+    def watch():
+        start = time.monotonic()
+        result["response"] = client.application.test_client().get("/kv/layout/_watch?since=1&timeout=10")
+        result["elapsed"] = time.monotonic() - start
+
+    thread = threading.Thread(target=watch)
+    thread.start()
+    time.sleep(0.3)
+
+    # The only watch slot of the worker is taken
+    response = client.get("/kv/layout/_watch?since=1&timeout=10")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    # Written by another worker process, seen by the poller
+    other = make_client(tmp_path, key_value_routes)
+    assert other.post("/kv/layout/b", json={"value": 2}).status_code == 200
+
+    thread.join()
+    assert [item["key"] for item in result["response"].json["items"]] == ["b"]
+    assert result["elapsed"] < 3
@@ -0,0 +1,29 @@
+from recipes.server.pagination import page_count, page_manifest, shard_hash
+
+
+def test_page_count():
+    assert page_count(0, 50) == 0
+    assert page_count(1, 50) == 1
+    assert page_count(50, 50) == 1
+    assert page_count(51, 50) == 2
+
+
+def test_page_manifest():
+    items = [{"id": i} for i in range(120)]
+    manifest = page_manifest(items, page_size=50)
+
+    assert manifest["count"] == 120
+    assert [page["count"] for page in manifest["pages"]] == [50, 50, 20]
+    assert manifest["pages"][0]["hash"] == shard_hash(items[:50])
+
+
+def test_page_manifest_only_changed_shard_hash_changes():
+    items = [{"id": i} for i in range(120)]
+    before = page_manifest(items, page_size=50)
+
+    items[60] = {"id": 60, "title": "changed"}
+    after = page_manifest(items, page_size=50)
+
+    changed = [a["page"] for a, b in zip(after["pages"], before["pages"]) if a["hash"] != b["hash"]]
+    assert changed == [2]
+    assert after["hash"] != before["hash"]
@@ -0,0 +1,68 @@
+import json
+import random
+
+from PIL import Image
+
+from recipes.tools.phash import BKTree, PerceptualIndex, dhash, hamming
+
+
+def test_bktree_matches_linear_scan():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, i)
+
+    query = values[42] ^ 0b1011
+    expected = sorted((hamming(query, v), i) for i, v in enumerate(values) if hamming(query, v) <= 10)
+    assert tree.search(query, 10) == expected
+    assert tree.search(query, 3)[0] == (3, 42)
+
+
+def test_dhash_resists_resize(tmp_path):
+    image = Image.effect_noise((32, 24), 80).convert("RGB").resize((640, 480))
+    other = Image.effect_noise((32, 24), 80).convert("RGB").resize((640, 480))
+
+    assert hamming(dhash(image), dhash(image.resize((320, 240)))) <= 4
+    assert hamming(dhash(image), dhash(other)) > 10
+
+
+def test_perceptual_index_scan(tmp_path):
+    uploads = tmp_path / "uploads"
+    (uploads / "a").mkdir(parents=True)
+
+    image = Image.effect_noise((32, 24), 80).convert("RGB").resize((640, 480))
+    image.save(uploads / "a" / "step_1.jpg")
+    image.resize((400, 300)).save(uploads / "a" / "step_2.jpg")
+    image.resize((320, 240)).save(uploads / "a" / "step_1.320w.jpg")
+
+    index = PerceptualIndex(str(tmp_path / "phash.db"))
+    assert index.scan(str(uploads)) == {"images": 2, "hashed": 2, "removed": 0}
+    assert [g["images"] for g in index.duplicates()] == [["a/step_1.jpg", "a/step_2.jpg"]]
+
+    index = PerceptualIndex(str(tmp_path / "phash.db"))
+    assert index.scan(str(uploads))["hashed"] == 0
+
+
+def test_perceptual_index_is_shared(tmp_path):
+    value = random.Random(1).getrandbits(64)
+
+    # Two worker processes, each with its own tree
+    a = PerceptualIndex(str(tmp_path / "phash.db"))
+    b = PerceptualIndex(str(tmp_path / "phash.db"))
+    assert b.similar(value) == []
+
+    a.add("a/step_1.jpg", value)
+    assert b.similar(value ^ 0b11) == [{"path": "a/step_1.jpg", "distance": 2}]
+
+    b.add("a/step_2.jpg", value ^ 0b1)
+    assert [m["path"] for m in a.similar(value)] == ["a/step_1.jpg", "a/step_2.jpg"]
+
+
+def test_perceptual_index_imports_json(tmp_path):
+    (tmp_path / "phash.json").write_text(json.dumps({"a/step_1.jpg": [10, 20, "00000000000000ff"]}))
+
+    index = PerceptualIndex(str(tmp_path / "phash.db"))
+    assert index.entries == {"a/step_1.jpg": (10, 20, 0xff)}
+    assert (tmp_path / "phash.json.imported").exists()
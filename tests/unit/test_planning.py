@@ -0,0 +1,32 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from recipes.server.planning import checklist, routine_slots
+
+
+def template(title, start, end):
+    return SimpleNamespace(_id=1, title=title, color=None, datetime_start=start, datetime_end=end)
+
+
+def test_routine_slots_follow_the_weekday():
+    # Wednesday of the template week
+    lunch = template("lunch", datetime(1970, 1, 7, 12), datetime(1970, 1, 7, 13))
+
+    slots = routine_slots([lunch], datetime(2026, 10, 19), datetime(2026, 11, 2))
+    assert [s["datetime_start"] for s in slots] == ["2026-10-21T12:00:00Z", "2026-10-28T12:00:00Z"]
+
+
+def test_routine_slots_outside_template_week():
+    # Sunday 22:00 at UTC-5 is stored as Monday 03:00 UTC of the next week
+    late = template("read", datetime(1970, 1, 12, 3), datetime(1970, 1, 12, 4))
+
+    slots = routine_slots([late], datetime(2026, 10, 19), datetime(2026, 10, 20))
+    assert [s["datetime_start"] for s in slots] == ["2026-10-19T03:00:00Z"]
+
+
+def test_checklist_local_time():
+    plan = {
+        "schedule": [{"title": "gym", "datetime_start": "2026-10-19T05:00:00Z"}],
+        "tasks": [{"title": "taxes"}],
+    }
+    assert checklist(plan, utc_offset=120) == ["07:00 gym", "taxes"]
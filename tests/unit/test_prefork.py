@@ -0,0 +1,202 @@
+import http.client
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from recipes.server.prefork import LISTEN_FD, Master, PoolServer, serve
+
+
+def make_app():
+    def app(environ, start_response):
+        if environ["PATH_INFO"] == "/stop":
+            app.server.stopping = True
+
+        if environ["PATH_INFO"] == "/echo":
+            body = environ["wsgi.input"].read()
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [body[:3], body[3:]]
+
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "5")])
+        return [b"hello"]
+    return app
+
+
+def test_pool_server_keeps_connections_alive():
+    app = make_app()
+    server = app.server = PoolServer("127.0.0.1", 0, app, threads=2, keepalive=2)
+    server.timeout = 0.1
+
+    def loop():
+        while not server.stopping:
+            server.handle_request()
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        for _ in range(3):
+            conn.request("GET", "/")
+            response = conn.getresponse()
+            assert response.read() == b"hello"
+            assert response.getheader("Connection") != "close"
+
+        # Bodies read or not, chunked responses
+        conn.request("POST", "/", body=b"x" * 10000)
+        assert conn.getresponse().read() == b"hello"
+        conn.request("POST", "/echo", body=b"abcdef")
+        response = conn.getresponse()
+        assert response.getheader("Transfer-Encoding") == "chunked"
+        assert response.read() == b"abcdef"
+
+        # Once stopping, the connection is closed after the request in progress
+        conn.request("GET", "/stop")
+        response = conn.getresponse()
+        assert response.read() == b"hello"
+        assert response.will_close
+    finally:
+        server.stopping = True
+        thread.join()
+        server.pool.shutdown(wait=True)
+        server.server_close()
+
+
+def test_idle_connections_give_their_thread_to_waiting_ones():
+    app = make_app()
+    server = app.server = PoolServer("127.0.0.1", 0, app, threads=1, keepalive=30)
+    server.timeout = 0.1
+
+    def loop():
+        while not server.stopping:
+            server.handle_request()
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    try:
+        idle = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        idle.request("GET", "/")
+        assert idle.getresponse().read() == b"hello"
+
+        # Served well before the 30s keepalive of the idle connection
+        start = time.monotonic()
+        other = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+        other.request("GET", "/")
+        assert other.getresponse().read() == b"hello"
+        assert time.monotonic() - start < 2
+        other.close()
+
+        # The idle connection was closed to free the thread
+        assert idle.sock.recv(1) == b""
+    finally:
+        server.stopping = True
+        thread.join()
+        server.pool.shutdown(wait=True)
+        server.server_close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="workers are forked")
+def test_workers_finish_background_work_before_exiting(tmp_path):
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def job():
+        time.sleep(0.5)
+        (tmp_path / f"job-{os.getpid()}").write_text("done")
+
+    submitted = []
+
+    def app(environ, start_response):
+        # Answered before the work is done, like /upload
+        if not submitted:
+            submitted.append(executor.submit(job))
+        body = str(os.getpid()).encode()
+        start_response("202 Accepted", [("Content-Type", "text/plain"), ("Content-Length", str(len(body)))])
+        return [body]
+
+    def pre_exit():
+        executor.shutdown(wait=True)
+        (tmp_path / f"exit-{os.getpid()}").write_text("")
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    master = os.fork()
+    if master == 0:
+        status = 0
+        try:
+            os.environ[LISTEN_FD] = str(listener.fileno())
+            Master(app, "127.0.0.1", port, workers=2, graceful_timeout=10, pre_exit=pre_exit).run()
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+    listener.close()
+
+    try:
+        pids = set()
+        deadline = time.monotonic() + 20
+        while len(pids) < 2 and time.monotonic() < deadline:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/")
+            response = conn.getresponse()
+            assert response.status == 202
+            pids.add(int(response.read()))
+            conn.close()
+        assert len(pids) == 2
+    finally:
+        os.kill(master, signal.SIGTERM)
+        _, status = os.waitpid(master, 0)
+
+    assert status == 0
+    # Every worker ran its queued jobs, then the hook, before exiting
+    for pid in pids:
+        assert (tmp_path / f"job-{pid}").read_text() == "done"
+        assert (tmp_path / f"exit-{pid}").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="workers are forked")
+def test_single_worker_is_supervised():
+    def app(environ, start_response):
+        if environ["PATH_INFO"] == "/hang":
+            time.sleep(60)
+        body = str(os.getpid()).encode()
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", str(len(body)))])
+        return [body]
+
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+
+    master = os.fork()
+    if master == 0:
+        status = 0
+        try:
+            os.environ[LISTEN_FD] = str(listener.fileno())
+            serve(app, "127.0.0.1", port, workers=1, timeout=1, graceful_timeout=5)
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+    listener.close()
+
+    def get(path):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=20)
+        try:
+            conn.request("GET", path)
+            return conn.getresponse().read()
+        finally:
+            conn.close()
+
+    try:
+        first = int(get("/"))
+        # The stuck worker is killed by the master and replaced
+        with pytest.raises((http.client.HTTPException, ConnectionError)):
+            get("/hang")
+        assert int(get("/")) != first
+    finally:
+        os.kill(master, signal.SIGTERM)
+        _, status = os.waitpid(master, 0)
+
+    assert status == 0
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from recipes.tools.recurrence import RRule, expand
+
+
+START = datetime(2026, 1, 5, 9, 0)  # Monday
+HOUR = timedelta(hours=1)
+
+
+def days(occurrences):
+    return [o.strftime("%m-%d") for o in occurrences]
+
+
+def test_weekly_byday():
+    rule = "FREQ=WEEKLY;BYDAY=MO,WE"
+    assert days(expand(rule, START, HOUR, datetime(2026, 3, 1), datetime(2026, 3, 10))) == ["03-02", "03-04", "03-09"]
+
+
+def test_count_and_until():
+    assert len(expand("FREQ=DAILY;INTERVAL=3;COUNT=5", START, HOUR, datetime(2026, 1, 1), datetime(2027, 1, 1))) == 5
+    assert days(expand("FREQ=DAILY;UNTIL=20260107", START, HOUR, datetime(2026, 1, 1), datetime(2026, 2, 1))) == [
+        "01-05", "01-06", "01-07",
+    ]
+    assert RRule.parse("FREQ=DAILY;COUNT=3").last_occurrence(START) == START + timedelta(days=2)
+
+
+def test_monthly_numbered_weekday():
+    rule = "FREQ=MONTHLY;BYDAY=-1FR"
+    assert days(expand(rule, START, HOUR, datetime(2026, 1, 1), datetime(2026, 4, 1))) == ["01-30", "02-27", "03-27"]
+
+
+def test_monthly_skips_short_months():
+    start = datetime(2026, 1, 31, 8)
+    assert days(expand("FREQ=MONTHLY", start, HOUR, datetime(2026, 1, 1), datetime(2026, 6, 1))) == [
+        "01-31", "03-31", "05-31",
+    ]
+
+
+def test_window_far_from_start_matches_full_walk():
+    rule = RRule.parse("FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,FR")
+    window = (datetime(2031, 5, 1), datetime(2031, 7, 1))
+
+    walked = [o for o in rule.occurrences(START, before=window[1]) if o + HOUR > window[0]]
+    assert list(expand(rule, START, HOUR, *window)) == walked
+
+
+def test_overlapping_previous_occurrence():
+    # A 3 days event starting before the window still shows up
+    found = expand("FREQ=WEEKLY", START, timedelta(days=3), datetime(2026, 1, 14), datetime(2026, 1, 15))
+    assert days(found) == ["01-12"]
+
+
+@pytest.mark.parametrize("rule", [
+    "FREQ=HOURLY", "FREQ=DAILY;BYDAY=2MO", "FREQ=DAILY;COUNT=2;UNTIL=20260101", "BYDAY=MO",
+    "FREQ=YEARLY;BYMONTH=13;COUNT=1", "FREQ=YEARLY;BYMONTH=0", "FREQ=DAILY;BYMONTHDAY=0;COUNT=1",
+    "FREQ=MONTHLY;BYMONTHDAY=-32", "FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=30;COUNT=2",
+])
+def test_invalid_rules(rule):
+    with pytest.raises(ValueError):
+        RRule.parse(rule)
+
+
+@pytest.mark.parametrize("rule", [
+    # February never has the 30th of January's start day
+    "FREQ=MONTHLY;BYMONTH=2;COUNT=2",
+    # a Tuesday every 7 days from a Monday
+    "FREQ=DAILY;INTERVAL=7;BYDAY=TU;COUNT=1",
+    "FREQ=YEARLY;INTERVAL=9000;BYMONTH=2;BYMONTHDAY=29;COUNT=2",
+])
+def test_rules_that_stop_matching(rule):
+    with pytest.raises(ValueError):
+        RRule.parse(rule).last_occurrence(datetime(2026, 1, 30, 9, 0))
+
+
+def test_rare_rules_still_match():
+    rule = RRule.parse("FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=29;COUNT=3")
+    assert rule.last_occurrence(START) == datetime(2036, 2, 29, 9, 0)
+
+
+def dates(rule, dtstart, count=None, start=None, end=None):
+    if start is not None:
+        occurrences = expand(rule, dtstart, HOUR, start, end)
+    else:
+        occurrences = list(RRule.parse(rule).occurrences(dtstart))[:count]
+    return [o.strftime("%Y-%m-%d") for o in occurrences]
+
+
+# Examples of RFC 5545, section 3.8.5.3
+def test_rfc_monthly_first_friday():
+    assert dates("FREQ=MONTHLY;COUNT=10;BYDAY=1FR", datetime(1997, 9, 5, 9)) == [
+        "1997-09-05", "1997-10-03", "1997-11-07", "1997-12-05", "1998-01-02",
+        "1998-02-06", "1998-03-06", "1998-04-03", "1998-05-01", "1998-06-05",
+    ]
+
+
+def test_rfc_friday_the_13th():
+    assert dates("FREQ=MONTHLY;BYDAY=FR;BYMONTHDAY=13;COUNT=5", datetime(1997, 9, 2, 9)) == [
+        "1998-02-13", "1998-03-13", "1998-11-13", "1999-08-13", "2000-10-13",
+    ]
+
+
+def test_rfc_saturday_after_first_sunday():
+    assert dates("FREQ=MONTHLY;BYDAY=SA;BYMONTHDAY=7,8,9,10,11,12,13;COUNT=10", datetime(1997, 9, 13, 9)) == [
+        "1997-09-13", "1997-10-11", "1997-11-08", "1997-12-13", "1998-01-10",
+        "1998-02-07", "1998-03-07", "1998-04-11", "1998-05-09", "1998-06-13",
+    ]
+
+
+def test_rfc_yearly_20th_monday():
+    assert dates("FREQ=YEARLY;BYDAY=20MO;COUNT=3", datetime(1997, 5, 19, 9)) == [
+        "1997-05-19", "1998-05-18", "1999-05-17",
+    ]
+
+
+def test_rfc_yearly_thursdays_of_march():
+    assert dates("FREQ=YEARLY;BYMONTH=3;BYDAY=TH;COUNT=7", datetime(1997, 3, 13, 9)) == [
+        "1997-03-13", "1997-03-20", "1997-03-27", "1998-03-05", "1998-03-12", "1998-03-19", "1998-03-26",
+    ]
+
+
+def test_rfc_yearly_every_other_year_in_months():
+    assert dates("FREQ=YEARLY;INTERVAL=2;COUNT=10;BYMONTH=1,2,3", datetime(1997, 3, 10, 9)) == [
+        "1997-03-10", "1999-01-10", "1999-02-10", "1999-03-10", "2001-01-10",
+        "2001-02-10", "2001-03-10", "2003-01-10", "2003-02-10", "2003-03-10",
+    ]
+
+
+def test_yearly_without_bymonth_spans_the_year():
+    assert dates("FREQ=YEARLY;BYMONTHDAY=1;COUNT=3", datetime(2026, 1, 1, 9)) == [
+        "2026-01-01", "2026-02-01", "2026-03-01",
+    ]
+    assert dates("FREQ=YEARLY;BYDAY=MO", START, start=datetime(2026, 3, 1), end=datetime(2026, 3, 20)) == [
+        "2026-03-02", "2026-03-09", "2026-03-16",
+    ]
+    assert dates("FREQ=YEARLY;BYDAY=-1MO;COUNT=2", START) == ["2026-12-28", "2027-12-27"]
@@ -0,0 +1,35 @@
+from recipes.tools.searchindex import (
+    SearchIndex,
+    SearchIndexReader,
+    delta_decode,
+    delta_encode,
+    json_strings,
+    tokenize,
+)
+
+
+def test_tokenize_strips_accents():
+    assert tokenize("Soufflé au Fromage!") == ["souffle", "au", "fromage"]
+
+
+def test_delta_roundtrip():
+    values = [1, 4, 9, 10, 200]
+    assert delta_decode(delta_encode(values)) == values
+
+
+def test_json_strings():
+    data = {"text": "hello", "items": [{"label": "world"}, 3, None]}
+    assert list(json_strings(data)) == ["hello", "world"]
+
+
+def test_search_prefix_and_intersection(tmp_path):
+    index = SearchIndex()
+    index.add("recipe", 1, "Tomato soup", "tomato", "onion")
+    index.add("recipe", 2, "Onion tart", "onion", "butter")
+    index.add("article", 7, "Garden", "Growing tomatoes at home")
+    index.save(tmp_path)
+
+    reader = SearchIndexReader(tmp_path)
+    assert reader.search("tom") == [["recipe", 1, "Tomato soup"], ["article", 7, "Garden"]]
+    assert reader.search("onion butter") == [["recipe", 2, "Onion tart"]]
+    assert reader.search("missing") == []
@@ -0,0 +1,51 @@
+import os
+
+from recipes.tools.syncdir import sync_tree
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fp:
+        fp.write(content)
+
+
+def test_sync_tree_incremental(tmp_path):
+    src = tmp_path / "src"
+    dest = tmp_path / "dest"
+    mirror = tmp_path / "mirror"
+    manifest = tmp_path / "manifest.json"
+
+    write(src / "recipes" / "1" / "preview.jpg", "a")
+    write(src / "articles" / "b.png", "b")
+    write(src / "root.jpg", "c")
+
+    stats = sync_tree(src, dest, mirrors=(mirror,), manifest_path=manifest)
+    assert (stats.copied, stats.skipped, stats.removed) == (3, 0, 0)
+    assert os.path.samefile(dest / "root.jpg", mirror / "root.jpg")
+
+    stats = sync_tree(src, dest, mirrors=(mirror,), manifest_path=manifest)
+    assert (stats.copied, stats.skipped, stats.removed) == (0, 3, 0)
+
+    # Touched without content change, modified, deleted
+    os.utime(src / "root.jpg", ns=(0, 0))
+    write(src / "recipes" / "1" / "preview.jpg", "changed")
+    os.remove(src / "articles" / "b.png")
+
+    stats = sync_tree(src, dest, mirrors=(mirror,), manifest_path=manifest)
+    assert (stats.copied, stats.skipped, stats.removed) == (1, 1, 1)
+    assert (mirror / "recipes" / "1" / "preview.jpg").read_text() == "changed"
+    assert not (dest / "articles" / "b.png").exists()
+    assert not (mirror / "articles" / "b.png").exists()
+
+
+def test_sync_tree_links_identical_content(tmp_path):
+    src = tmp_path / "src"
+    dest = tmp_path / "dest"
+
+    write(src / "recipes" / "1" / "preview.jpg", "same")
+    write(src / "recipes" / "2" / "preview.jpg", "same")
+    write(src / "articles" / "hero.jpg", "other")
+
+    stats = sync_tree(src, dest, workers=1)
+    assert (stats.copied, stats.linked) == (2, 1)
+    assert os.path.samefile(dest / "recipes" / "1" / "preview.jpg", dest / "recipes" / "2" / "preview.jpg")
@@ -0,0 +1,61 @@
+from sqlalchemy import text
+
+from recipes.server.models import Task
+
+
+def test_build_forest_out_of_order_ids():
+    nodes = [
+        Task(_id=1, title="root", root_id=1),
+        # Child listed (and numbered) before its parent
+        Task(_id=2, title="child", parent_id=5, root_id=1),
+        Task(_id=5, title="parent", parent_id=1, root_id=1),
+        # Parent deleted, attached to its root
+        Task(_id=7, title="orphan", parent_id=6, root_id=1),
+    ]
+
+    (root,) = Task.build_forest(nodes, [1])
+    assert [c["id"] for c in root["children"]] == [5, 7]
+    assert [c["id"] for c in root["children"][0]["children"]] == [2]
+
+
+def test_build_forest_keeps_display_order_of_roots():
+    nodes = [Task(_id=3, title="b"), Task(_id=1, title="a")]
+    assert [r["id"] for r in Task.build_forest(nodes, [1, 3])] == [3, 1]
+
+
+def ids(forest):
+    return {task["id"]: ids(task["children"]) for task in forest}
+
+
+def test_orphans_stay_in_their_tree(tasks_client):
+    def create(title, parent=None):
+        return tasks_client.post("/tasks", json={"title": title, "parent_id": parent}).json["id"]
+
+    root = create("root")
+    parent = create("parent", root)
+    child = create("child", parent)
+    grandchild = create("grandchild", child)
+    assert ids(tasks_client.get("/tasks").json) == {root: {parent: {child: {grandchild: {}}}}}
+
+    # Deleted without its subtasks, like the rows left by older versions
+    with tasks_client.application.app_context():
+        db = tasks_client.application.db
+        db.session.execute(text("DELETE FROM tasks WHERE _id = :id"), {"id": parent})
+        db.session.commit()
+
+    assert ids(tasks_client.get("/tasks").json) == {root: {child: {grandchild: {}}}}
+    (tree,) = tasks_client.get("/tasks?depth=0").json
+    assert tree["child_count"] == 1
+    assert ids(tasks_client.get(f"/tasks/{root}/children").json) == {child: {}}
+
+    # The root is gone as well, the orphan is a tree of its own
+    tasks_client.delete(f"/tasks/{root}")
+    assert ids(tasks_client.get("/tasks").json) == {child: {grandchild: {}}}
+
+
+def test_deleting_a_parent_keeps_the_subtasks(tasks_client):
+    root = tasks_client.post("/tasks", json={"title": "root"}).json["id"]
+    child = tasks_client.post("/tasks", json={"title": "child", "parent_id": root}).json["id"]
+
+    assert tasks_client.delete(f"/tasks/{root}").status_code == 200
+    assert ids(tasks_client.get("/tasks").json) == {child: {}}
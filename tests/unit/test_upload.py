@@ -6,6 +6,7 @@ import requests
 import io
 from PIL import Image
 import sys
+import time
 
 def create_test_image():
     """Create a simple test image in memory"""
@@ -31,12 +32,19 @@ def test_upload():
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
-        if response.status_code == 201:
+        if response.status_code in (201, 202):
             print("✅ Upload successful!")
             
-            # Test serving the uploaded file
+            # The image is written in the background, wait for the job
             result = response.json()
-            file_url = f"http://localhost:5000{result['url']}"
+            job = requests.get(f"http://localhost:5000{result['status']}").json()
+            while job['state'] in ('queued', 'running'):
+                time.sleep(0.5)
+                job = requests.get(f"http://localhost:5000{result['status']}").json()
+            print(f"Job: {job}")
+
+            # Test serving the uploaded file
+            file_url = f"http://localhost:5000{job['url']}"
             
             serve_response = requests.get(file_url)
             print(f"File serve status: {serve_response.status_code}")